@@ -1,20 +1,24 @@
 
 # app/__init__.py					
 import os
-from flask import Flask, render_template, redirect, url_for, session, request
-from dotenv import load_dotenv
-from .auth import bp as auth_bp
-from .ptp import bp as ptp_bp
-from .dashboard import bp as dash_bp
-from .reservar import bp as resv_bp
-from .admin import bp as admin_bp
-from .logging  import setup_logging
-from .puntos import bp as puntos_bp   # 🔹 IMPORTAR el nuevo blueprint
 
 
 LOGIN_REQUIRED_PREFIXES = ("/dashboard", "/account", "/admin")
 
 def create_app():
+    # imports de la app web aquí dentro: app.utils.* (lógica pura) se importa sin Flask
+    from flask import Flask, render_template, redirect, url_for, session, request
+    from dotenv import load_dotenv
+    from .auth import bp as auth_bp
+    from .ptp import bp as ptp_bp
+    from .dashboard import bp as dash_bp
+    from .reservar import bp as resv_bp
+    from .admin import bp as admin_bp
+    from .logging  import setup_logging
+    from . import metrics
+    from . import db
+    from .puntos import bp as puntos_bp   # 🔹 IMPORTAR el nuevo blueprint
+
     load_dotenv()
 
     app = Flask(__name__, template_folder="../templates", static_folder="../static")
@@ -29,6 +33,10 @@ def create_app():
     app.register_blueprint(admin_bp)
     
     setup_logging(app)
+    # antes del middleware de login: sus redirecciones también se miden
+    metrics.init_app(app)
+    # una conexión y una transacción por petición (app/db.py)
+    db.init_app(app)
 
  
     # Middleware: exigir login en rutas protegidas
@@ -0,0 +1,113 @@
+# app/cookie_refresh.py
+import os
+import time
+import socket
+import logging
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional
+
+from .db import fetch_all, execute
+from .ptp import selenium_login_and_store_cookies
+from .utils.crypto import decrypt_str
+from .utils.cadence import backoff_sec
+
+logger = logging.getLogger("cookie_refresh")
+
+# ------------------- CONFIG -------------------
+COOKIE_REFRESH_WORKERS = int(os.getenv("COOKIE_REFRESH_WORKERS", "2"))        # logins simultáneos
+COOKIE_REFRESH_AHEAD_H = int(os.getenv("COOKIE_REFRESH_AHEAD_H", "24"))        # renovar si vence antes
+# backoff tras fallos (COOKIE_REFRESH_BACKOFF_SEC, COOKIE_REFRESH_BACKOFF_MAX_SEC): app/utils/cadence.py
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def due_accounts(ahead_h: int = COOKIE_REFRESH_AHEAD_H) -> List[Dict[str, Any]]:
+    """
+    Cuentas cuyo auth_token vigente vence en <= ahead_h (o no existe), fuera de
+    backoff, ordenadas por ExpiryUtc: las más próximas a caducar primero.
+    """
+    return fetch_all("""
+    SELECT a.AccountId, a.EmailPTP, c.PasswordEnc, k.ExpiryUtc, ISNULL(e.FallosSeguidos, 0) AS FallosSeguidos
+    FROM dbo.CuentasPTP a
+    JOIN dbo.CredencialesPTP c ON c.AccountId=a.AccountId
+    OUTER APPLY (
+        SELECT MAX(x.ExpiryUtc) AS ExpiryUtc FROM dbo.CookiesPTP x
+        WHERE x.AccountId=a.AccountId AND x.IsCurrent=1 AND x.Name=N'auth_token'
+    ) k
+    LEFT JOIN dbo.CookieRefreshEstado e ON e.AccountId=a.AccountId
+    WHERE (k.ExpiryUtc IS NULL OR k.ExpiryUtc <= DATEADD(hour, :ahead, SYSUTCDATETIME()))
+      AND (e.ProximoIntentoUtc IS NULL OR e.ProximoIntentoUtc <= SYSUTCDATETIME())
+    ORDER BY CASE WHEN k.ExpiryUtc IS NULL THEN 0 ELSE 1 END, k.ExpiryUtc, a.AccountId
+    """, ahead=ahead_h)
+
+
+def record_attempt(account_id: int, started: datetime, ms: int, ok: bool,
+                   total: Optional[int], auth: Optional[bool], error: Optional[str], fallos_prev: int):
+    fallos = 0 if ok else fallos_prev + 1
+    delay = backoff_sec(fallos)
+    err = (error or "")[:1000] or None
+    execute("""
+      SET NOCOUNT ON;
+      INSERT INTO dbo.CookieRefreshIntentos (AccountId, InicioUtc, DuracionMs, Ok, Guardadas, AuthToken, Error, WorkerId)
+      VALUES (:aid, :ini, :ms, :ok, :tot, :auth, :err, :w);
+
+      MERGE dbo.CookieRefreshEstado AS t
+      USING (SELECT :aid AS AccountId) AS s ON t.AccountId = s.AccountId
+      WHEN MATCHED THEN UPDATE SET
+          FallosSeguidos = :f, UltimoIntentoUtc = SYSUTCDATETIME(),
+          UltimoOkUtc = CASE WHEN :ok = 1 THEN SYSUTCDATETIME() ELSE t.UltimoOkUtc END,
+          ProximoIntentoUtc = CASE WHEN :d > 0 THEN DATEADD(second, :d, SYSUTCDATETIME()) END,
+          UltimoError = :err
+      WHEN NOT MATCHED THEN
+          INSERT (AccountId, FallosSeguidos, UltimoIntentoUtc, UltimoOkUtc, ProximoIntentoUtc, UltimoError)
+          VALUES (:aid, :f, SYSUTCDATETIME(), CASE WHEN :ok = 1 THEN SYSUTCDATETIME() END,
+                  CASE WHEN :d > 0 THEN DATEADD(second, :d, SYSUTCDATETIME()) END, :err);
+    """, aid=account_id, ini=started.replace(tzinfo=None), ms=ms, ok=1 if ok else 0, tot=total,
+         auth=None if auth is None else (1 if auth else 0), err=err, w=WORKER_ID, f=fallos, d=delay)
+    if not ok:
+        logger.warning("cookie_refresh.backoff account_id=%s fallos=%s next_in_sec=%s", account_id, fallos, delay)
+
+
+def refresh_account(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Login + guardado de una cuenta; nunca lanza: el resultado queda registrado."""
+    aid = row["AccountId"]
+    started = datetime.now(timezone.utc)
+    t0 = time.time()
+    total, auth, error = None, None, None
+    try:
+        pwd = decrypt_str(row["PasswordEnc"])
+        total, auth = selenium_login_and_store_cookies(aid, row["EmailPTP"], pwd)
+        if not auth:
+            error = "login sin auth_token"
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        logger.error("cookie_refresh.fail account_id=%s: %s", aid, e, exc_info=True)
+    ok = error is None
+    ms = int((time.time() - t0) * 1000)
+    try:
+        record_attempt(aid, started, ms, ok, total, auth, error, row.get("FallosSeguidos") or 0)
+    except Exception as e:
+        logger.error("cookie_refresh.record.fail account_id=%s: %s", aid, e)
+    logger.info("cookie_refresh account_id=%s ok=%s guardadas=%s duration_ms=%s",
+                aid, ok, total, ms, extra={"extra_dict": {"account_id": aid, "ok": ok, "error": error}})
+    return {"account_id": aid, "ok": ok, "guardadas": total, "auth_token": auth, "error": error, "ms": ms}
+
+
+def refresh_due(workers: int = COOKIE_REFRESH_WORKERS) -> List[Dict[str, Any]]:
+    """
+    Renueva las cuentas vencidas con hasta `workers` logins en paralelo. Se envían
+    en orden de caducidad, así que con el pool lleno las más urgentes van primero.
+    """
+    rows = due_accounts()
+    if not rows:
+        return []
+    t0 = time.time()
+    out: List[Dict[str, Any]] = []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(rows))), thread_name_prefix="cookie") as ex:
+        futs = [ex.submit(refresh_account, r) for r in rows]
+        for f in as_completed(futs):
+            out.append(f.result())
+    logger.info("cookie_refresh.pass n=%s ok=%s duration_ms=%s", len(out),
+                sum(1 for r in out if r["ok"]), int((time.time() - t0) * 1000))
+    return out
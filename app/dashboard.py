@@ -1,7 +1,7 @@
 # app/dashboard.py
-from flask import Blueprint, render_template, session, abort, jsonify, current_app
-from .db import fetch_all
-from .estado import scrape_conector_estado
+from flask import Blueprint, render_template, session, abort, jsonify, current_app, url_for, Response
+from .jobs import enqueue, job_status, cuenta_ptp
+from .events import stream_estados
 
 bp = Blueprint("dash", __name__)
 
@@ -14,6 +14,15 @@ def estado():
     _require_login()
     return render_template("dashboard/estado.html")
 
+@bp.get("/dashboard/estado/stream")
+def estado_stream():
+    _require_login()
+    # Server-Sent Events: cambios de estado de los conectores del usuario en vivo.
+    # El generador corre con la unidad de trabajo de la petición ya cerrada (app/db.py):
+    # no retiene una conexión del pool durante todo el stream
+    return Response(stream_estados(session["uid"]), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @bp.get("/dashboard/precios-cs")
 def precios_cs():
     _require_login()
@@ -27,31 +36,19 @@ def precios_ciudad():
 def estado_refresh():
     _require_login()
     # Busca el account PTP del usuario (usamos el primero)
-    acc = fetch_all("""
-      SELECT a.AccountId FROM dbo.CuentasPTP a
-      JOIN dbo.CredencialesPTP c ON c.AccountId=a.AccountId
-      WHERE a.UserId=:uid
-    """, uid=session["uid"])
-    if not acc:
+    if not cuenta_ptp(session["uid"]):
         return jsonify({"ok": False, "error": "Configura tu cuenta PTP primero."}), 400
 
-    account_id = acc[0]["AccountId"]
-
-    conns = fetch_all("""
-      SELECT c.ConectorId, c.UrlConector
-      FROM dbo.Conectores c
-      JOIN dbo.Puntos p ON p.PuntoId=c.PuntoId
-      WHERE p.UserId=:uid AND c.Activo=1
-      ORDER BY p.PuntoId, c.Orden
-    """, uid=session["uid"])
-
-    results = []
-    for c in conns:
-        try:
-            estado, hint = scrape_conector_estado(account_id, c["ConectorId"], c["UrlConector"])
-            results.append({"conector_id": c["ConectorId"], "estado": estado, "hint": hint})
-        except Exception as e:
-            current_app.logger.error("refresh estado conector_id=%s: %s", c["ConectorId"], e, exc_info=True)
-            results.append({"conector_id": c["ConectorId"], "estado": "Error", "hint": str(e)})
-
-    return jsonify({"ok": True, "results": results})
\ No newline at end of file
+    # El scraping lo hace un worker; aquí solo se encola
+    job_id = enqueue(session["uid"], "estado")
+    current_app.logger.info("refresh estado encolado job_id=%s", job_id)
+    return jsonify({"ok": True, "job_id": job_id,
+                    "status_url": url_for("dash.job_get", job_id=job_id)}), 202
+
+@bp.get("/dashboard/jobs/<job_id>")
+def job_get(job_id: str):
+    _require_login()
+    st = job_status(job_id, session["uid"])
+    if not st:
+        abort(404)
+    return jsonify({"ok": True, **st})
@@ -1,8 +1,12 @@
 # app/db.py
 import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
 from urllib.parse import quote_plus
 from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
+from sqlalchemy.engine import Engine, Connection
+from .metrics import db_timer
 
 _engine: Engine | None = None
 
@@ -21,6 +25,13 @@ def get_engine() -> Engine:
     encrypt = os.getenv("SQL_ENCRYPT", "yes")
     trust   = os.getenv("SQL_TRUST_CERT", "yes")
 
+    # Pool por proceso: DB_POOL_SIZE + DB_MAX_OVERFLOW = máximo de conexiones simultáneas
+    pool_size     = int(os.getenv("DB_POOL_SIZE", "5"))
+    max_overflow  = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    pool_timeout  = int(os.getenv("DB_POOL_TIMEOUT", "30"))     # s esperando una conexión libre
+    pool_recycle  = int(os.getenv("DB_POOL_RECYCLE", "1800"))   # s; antes de que las corte un firewall/servidor
+    pool_pre_ping = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
     assert user and pwd, "Faltan credenciales SQL en variables de entorno"
 
     # mssql+pyodbc soporta host:port sin problemas
@@ -30,17 +41,160 @@ def get_engine() -> Engine:
         f"?driver={quote_plus(driver)}&Encrypt={encrypt}&TrustServerCertificate={trust}"
     )
 
-    _engine = create_engine(conn_str, pool_pre_ping=True, fast_executemany=True)
+    _engine = create_engine(conn_str, pool_pre_ping=pool_pre_ping, pool_size=pool_size,
+                            max_overflow=max_overflow, pool_timeout=pool_timeout,
+                            pool_recycle=pool_recycle, fast_executemany=True)
     return _engine
 
+# ------------------- UNIDAD DE TRABAJO -------------------
+class UnitOfWork:
+    """
+    Una conexión y una transacción compartidas por todos los helpers de este módulo
+    mientras la unidad está activa. La conexión se pide al pool en la primera sentencia
+    (una petición que no toca la BD no hace checkout).
+    """
+    def __init__(self):
+        self.conn: Optional[Connection] = None
+        self._tx = None
+        self.closed = False
+
+    def connection(self) -> Connection:
+        if self.conn is None:
+            self.conn = get_engine().connect()
+            self._tx = self.conn.begin()
+        return self.conn
+
+    def _end(self, ok: bool):
+        conn, tx = self.conn, self._tx
+        self.conn = self._tx = None
+        if conn is None:
+            return
+        try:
+            if tx is not None and tx.is_active:
+                if ok:
+                    with db_timer("commit"):
+                        tx.commit()
+                else:
+                    tx.rollback()
+        finally:
+            conn.close()
+
+    def commit(self):
+        """Confirma lo hecho y devuelve la conexión al pool; la siguiente sentencia abre otra transacción."""
+        self._end(True)
+
+    def close(self, ok: bool):
+        try:
+            self._end(ok)
+        finally:
+            self.closed = True
+
+_uow: ContextVar[Optional[UnitOfWork]] = ContextVar("db_uow", default=None)
+
+def current_uow() -> Optional[UnitOfWork]:
+    u = _uow.get()
+    return u if u is not None and not u.closed else None
+
+@contextmanager
+def unit_of_work():
+    """
+    with unit_of_work(): ...  -> fetch_one/fetch_all/execute/execute_many/transaction de dentro
+    usan la misma conexión y transacción: un checkout y un commit en total. Commit al salir,
+    rollback si sale una excepción. Anidada (o dentro de una petición Flask) se une a la exterior.
+    """
+    cur = current_uow()
+    if cur is not None:
+        yield cur
+        return
+    u = UnitOfWork()
+    tok = _uow.set(u)
+    try:
+        yield u
+    except BaseException:
+        u.close(False)
+        raise
+    else:
+        u.close(True)
+    finally:
+        _uow.reset(tok)
+
+def commit():
+    """Confirma la unidad de trabajo en curso y suelta su conexión (p.ej. antes de un login de 30 s)."""
+    u = current_uow()
+    if u is not None:
+        u.commit()
+
+def init_app(app):
+    """
+    Unidad de trabajo por petición: commit en after_request (antes de enviar la respuesta,
+    salvo 5xx) y rollback en teardown si una excepción no llegó a after_request.
+    Las respuestas en streaming (SSE) se generan con la unidad ya cerrada: cada consulta
+    del generador toma y suelta su propia conexión.
+    """
+    from flask import g
+
+    @app.before_request
+    def _db_uow_begin():
+        g.db_uow = UnitOfWork()
+        _uow.set(g.db_uow)
+
+    @app.after_request
+    def _db_uow_commit(resp):
+        u = g.pop("db_uow", None)
+        if u is not None:
+            u.close(resp.status_code < 500)
+        return resp
+
+    @app.teardown_request
+    def _db_uow_teardown(exc):
+        u = g.pop("db_uow", None)
+        if u is not None:
+            u.close(False)
+        _uow.set(None)
+
+@contextmanager
+def _connection(op: str, sql: Optional[str] = None):
+    """Conexión de la unidad de trabajo activa o, si no hay, una transacción propia (autocommit)."""
+    with db_timer(op, sql):
+        u = current_uow()
+        if u is not None:
+            yield u.connection()
+        else:
+            with get_engine().begin() as conn:
+                yield conn
+
+# ------------------- HELPERS -------------------
 def fetch_one(sql: str, **params):
-    with get_engine().begin() as conn:
+    with _connection("fetch_one", sql) as conn:
         return conn.execute(text(sql), params).mappings().first()
 
 def fetch_all(sql: str, **params):
-    with get_engine().begin() as conn:
+    with _connection("fetch_all", sql) as conn:
         return conn.execute(text(sql), params).mappings().all()
 
 def execute(sql: str, **params):
-    with get_engine().begin() as conn:
+    with _connection("execute", sql) as conn:
         conn.execute(text(sql), params)
+
+def execute_many(sql: str, rows: list):
+    """executemany (fast_executemany en pyodbc) en una sola transacción."""
+    if not rows:
+        return
+    with _connection("execute_many", sql) as conn:
+        conn.execute(text(sql), rows)
+
+@contextmanager
+def transaction():
+    """
+    Conexión con transacción abierta para varias sentencias; commit al salir, rollback si falla.
+    Dentro de una unidad de trabajo es un SAVEPOINT: si el bloque falla solo se deshace él.
+    """
+    with db_timer("transaction"):
+        u = current_uow()
+        if u is not None:
+            conn = u.connection()
+            with conn.begin_nested():
+                yield conn
+        else:
+            with get_engine().begin() as conn:
+                yield conn
@@ -0,0 +1,334 @@
+# app/driver_pool.py
+import os
+import time
+import shutil
+import fcntl
+import signal
+import atexit
+import logging
+import tempfile
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import Optional, List, Dict
+
+from selenium.common.exceptions import WebDriverException
+
+from .ptp import create_driver, HEADLESS
+from .metrics import phase
+
+logger = logging.getLogger("driver_pool")
+
+# ------------------- CONFIG -------------------
+POOL_SIZE = int(os.getenv("DRIVER_POOL_SIZE", "2"))
+MAX_PAGES = int(os.getenv("DRIVER_MAX_PAGES", "200"))           # recicla tras N checkouts
+MAX_RSS_MB = int(os.getenv("DRIVER_MAX_RSS_MB", "900"))         # recicla si el árbol chrome supera esto
+IDLE_TTL_SEC = int(os.getenv("DRIVER_IDLE_TTL_SEC", "600"))     # cierra drivers ociosos
+ACQUIRE_TIMEOUT = int(os.getenv("DRIVER_ACQUIRE_TIMEOUT", "120"))
+# tmpfs si existe: perfiles y cachés de Chrome sin tocar disco
+POOL_DIR = Path(os.getenv("DRIVER_POOL_DIR",
+                          "/dev/shm/reservas4-chrome" if os.path.isdir("/dev/shm") else "/tmp/reservas4-chrome"))
+# Perfiles persistentes por AccountId (acct-<id>-<slot>); sobreviven al reciclado del driver
+PROFILE_DIR = POOL_DIR / "profiles"
+
+
+# ------------------- /proc helpers (Linux) -------------------
+def _ppid_map() -> Dict[int, int]:
+    """pid -> ppid de todos los procesos visibles."""
+    out: Dict[int, int] = {}
+    for d in os.listdir("/proc"):
+        if not d.isdigit():
+            continue
+        try:
+            with open(f"/proc/{d}/stat", "rb") as f:
+                stat = f.read().decode(errors="replace")
+            # el nombre va entre paréntesis y puede contener espacios
+            rest = stat.rsplit(")", 1)[1].split()
+            out[int(d)] = int(rest[1])
+        except Exception:
+            continue
+    return out
+
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except Exception:
+        pass
+    return 0
+
+
+def _cmdline(pid: int) -> str:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            return f.read().replace(b"\0", b" ").decode(errors="replace")
+    except Exception:
+        return ""
+
+
+def tree_rss_mb(root_pid: int) -> float:
+    """RSS total (MB) de un proceso y todos sus descendientes (chromedriver -> chrome -> renderers)."""
+    ppids = _ppid_map()
+    children: Dict[int, List[int]] = {}
+    for pid, ppid in ppids.items():
+        children.setdefault(ppid, []).append(pid)
+    total, stack = 0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        total += _rss_kb(pid)
+        stack.extend(children.get(pid, []))
+    return total / 1024.0
+
+
+def reap_zombie_chrome() -> int:
+    """
+    Mata procesos chrome huérfanos (ppid=1) lanzados por el pool, identificados
+    por un --user-data-dir bajo POOL_DIR. Quedan así cuando un worker muere sin quit().
+    """
+    marker = f"--user-data-dir={POOL_DIR}"
+    killed = 0
+    try:
+        ppids = _ppid_map()
+    except Exception:
+        return 0
+    for pid, ppid in ppids.items():
+        if ppid != 1:
+            continue
+        cmd = _cmdline(pid)
+        if "chrom" in cmd and marker in cmd:
+            try:
+                os.kill(pid, signal.SIGKILL)
+                killed += 1
+            except Exception:
+                pass
+    if killed:
+        logger.warning("pool.reap killed=%s", killed)
+    return killed
+
+
+# ------------------- POOL -------------------
+class PooledDriver:
+    """Driver de Chrome vivo + metadatos de reciclado."""
+
+    def __init__(self, driver, user_data_dir: str, account_id: Optional[int] = None,
+                 profile_lock=None):
+        self.driver = driver
+        self.user_data_dir = user_data_dir
+        self.account_id = account_id
+        self.profile_lock = profile_lock   # fichero con flock: perfil persistente en uso
+        self.pages = 0
+        self.created = time.time()
+        self.last_used = time.time()
+
+    @property
+    def pid(self) -> Optional[int]:
+        try:
+            return self.driver.service.process.pid
+        except Exception:
+            return None
+
+    def rss_mb(self) -> float:
+        pid = self.pid
+        return tree_rss_mb(pid) if pid else 0.0
+
+    def is_alive(self) -> bool:
+        try:
+            self.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+        if self.profile_lock is not None:
+            # perfil de cuenta: se conserva, solo se libera el lock
+            try:
+                self.profile_lock.close()
+            except Exception:
+                pass
+        else:
+            shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+
+class DriverPool:
+    """
+    Pool de drivers de Chrome reutilizables (por proceso).
+    - checkout/checkin con límite de drivers simultáneos (POOL_SIZE)
+    - afinidad por AccountId: cada cuenta usa su propio perfil persistente de Chrome,
+      que ya trae las cookies cargadas; un driver nunca se comparte entre cuentas
+    - reciclado por nº de páginas, RSS del árbol de procesos y tiempo ocioso
+    - health check al sacar del pool y reaping de chrome huérfanos
+    """
+
+    def __init__(self, size: int = POOL_SIZE, max_pages: int = MAX_PAGES,
+                 max_rss_mb: int = MAX_RSS_MB, idle_ttl: int = IDLE_TTL_SEC):
+        self.size = max(1, size)
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.idle_ttl = idle_ttl
+        self._idle: List[PooledDriver] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._busy = 0
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        reap_zombie_chrome()
+
+    def _claim_profile(self, account_id: int):
+        """
+        Reserva un perfil persistente libre de la cuenta (acct-<id>-<slot>).
+        Chrome no admite dos instancias sobre el mismo user-data-dir, ni entre
+        procesos (workers de gunicorn): se arbitra con flock sobre <perfil>.lock.
+        """
+        for slot in range(self.size * 4):
+            path = PROFILE_DIR / f"acct-{account_id}-{slot}"
+            fh = open(f"{path}.lock", "w")
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                fh.close()
+                continue
+            path.mkdir(parents=True, exist_ok=True)
+            # locks de una instancia anterior que murió sin cerrar
+            for name in ("SingletonLock", "SingletonSocket", "SingletonCookie"):
+                try:
+                    os.unlink(path / name)
+                except OSError:
+                    pass
+            return str(path), fh
+        raise RuntimeError(f"Sin perfiles libres para account_id={account_id}")
+
+    def _spawn(self, account_id: Optional[int]) -> PooledDriver:
+        t0 = time.time()
+        lock = None
+        if account_id is None:
+            udd = tempfile.mkdtemp(prefix="drv-", dir=str(POOL_DIR))
+        else:
+            udd, lock = self._claim_profile(account_id)
+        try:
+            with phase("driver_start"):
+                drv = create_driver(HEADLESS, user_data_dir=udd, profile="scrape")
+        except Exception:
+            if lock is not None:
+                lock.close()
+            raise
+        drv._ptp_profile_dir = udd if lock is not None else None
+        logger.info("pool.spawn account_id=%s profile=%s duration_ms=%s",
+                    account_id, udd, int((time.time() - t0) * 1000))
+        return PooledDriver(drv, udd, account_id, profile_lock=lock)
+
+    def _pick_idle(self, account_id: Optional[int]) -> Optional[PooledDriver]:
+        evict: List[PooledDriver] = []
+        with self._lock:
+            now = time.time()
+            evict = [p for p in self._idle if now - p.last_used > self.idle_ttl]
+            self._idle = [p for p in self._idle if p not in evict]
+            pick = next((p for p in self._idle if p.account_id == account_id), None)
+            if pick is not None:
+                self._idle.remove(pick)
+            elif self._idle and len(self._idle) + self._busy > self.size:
+                # sin driver de esta cuenta y pool lleno: se cierra el ocioso más antiguo
+                lru = min(self._idle, key=lambda p: p.last_used)
+                self._idle.remove(lru)
+                evict.append(lru)
+        for p in evict:
+            logger.info("pool.evict account_id=%s idle_sec=%s", p.account_id, int(now - p.last_used))
+            p.quit()
+        return pick
+
+    def acquire(self, account_id: Optional[int] = None, timeout: float = ACQUIRE_TIMEOUT) -> PooledDriver:
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"Sin drivers libres tras {timeout}s (pool size={self.size})")
+        with self._lock:
+            self._busy += 1
+        try:
+            pd = self._pick_idle(account_id)
+            if pd is not None and not pd.is_alive():
+                logger.warning("pool.unhealthy pages=%s", pd.pages)
+                pd.quit()
+                pd = None
+            if pd is None:
+                pd = self._spawn(account_id)
+            return pd
+        except Exception:
+            with self._lock:
+                self._busy -= 1
+            self._slots.release()
+            raise
+
+    def release(self, pd: PooledDriver, discard: bool = False):
+        try:
+            pd.pages += 1
+            pd.last_used = time.time()
+            reason = None
+            if discard:
+                reason = "error"
+            elif pd.pages >= self.max_pages:
+                reason = "max_pages"
+            else:
+                rss = pd.rss_mb()
+                if rss > self.max_rss_mb:
+                    reason = f"rss={int(rss)}MB"
+            if reason is None:
+                try:
+                    # libera memoria de la página y detiene su JS mientras está ocioso
+                    pd.driver.get("about:blank")
+                except Exception:
+                    reason = "blank_fail"
+            if reason:
+                logger.info("pool.recycle reason=%s pages=%s", reason, pd.pages)
+                pd.quit()
+            else:
+                with self._lock:
+                    self._idle.append(pd)
+        finally:
+            with self._lock:
+                self._busy -= 1
+            self._slots.release()
+
+    def shutdown(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pd in idle:
+            pd.quit()
+        reap_zombie_chrome()
+
+
+_pool: Optional[DriverPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> DriverPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = DriverPool()
+                atexit.register(_pool.shutdown)
+    return _pool
+
+
+@contextmanager
+def checkout(account_id: Optional[int] = None, timeout: Optional[float] = None):
+    """
+    with checkout(account_id) as drv: ...
+    Devuelve el driver al pool al salir; si falló WebDriver, se descarta.
+    timeout: espera máxima de hueco libre (por defecto ACQUIRE_TIMEOUT).
+    """
+    pool = get_pool()
+    # espera de hueco + arranque de Chrome si no había driver ocioso de la cuenta
+    with phase("checkout"):
+        pd = pool.acquire(account_id, ACQUIRE_TIMEOUT if timeout is None else timeout)
+    discard = False
+    try:
+        yield pd.driver
+    except WebDriverException:
+        discard = True
+        raise
+    finally:
+        pool.release(pd, discard=discard)
@@ -1,121 +1,189 @@
 # app/estado.py
-import time, logging
-from typing import Optional, Tuple
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait as W
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from .ptp import create_driver, LOGS_DIR
-from .utils.ptp_cookies import get_current_cookies, prime_cookies
+import os, time, logging
+from typing import Optional, Tuple, List, Dict, Any
+from .ptp import LOGS_DIR
+from .driver_pool import checkout, ACQUIRE_TIMEOUT
+from .utils.ptp_cookies import ensure_primed
+from .utils.waits import wait_app_ready, time_left, check_deadline, driver_deadline
+from .utils.status import STATUS_CLASS_MAP, STATUS_TEXT_MAP, match_cards
+from .snapshots import capture_snapshot
 from .db import execute
+from . import metrics
 
 logger = logging.getLogger("estado")
 
-# ✅ Mapeos ampliados (incluye s-light-*)
-STATUS_CLASS_MAP = {
-    # “oscuros”
-    "s-green": "Libre", "green": "Libre", "s-success": "Libre",
-    "s-red": "Ocupado", "red": "Ocupado", "danger": "Ocupado",
-    "s-orange": "Reservado", "orange": "Reservado", "warning": "Reservado",
-    "s-grey": "No disponible", "s-gray": "No disponible", "grey": "No disponible", "gray": "No disponible",
-    "error": "Averiado", "fault": "Averiado",
-
-    # “claros” (tu caso)
-    "s-light-green": "Libre",
-    "s-light-orange": "Reservado",
-    "s-light-red": "Ocupado",
-    "s-light-grey": "No disponible",
-    "s-light-gray": "No disponible",
-}
+# Latido del histórico: fila en EstadosConector aunque no cambie el estado (minutos, 0 = nunca)
+ESTADO_HEARTBEAT_MIN = int(os.getenv("ESTADO_HEARTBEAT_MIN", "60"))
 
-STATUS_TEXT_MAP = {
-    "libre": "Libre",
-    "ocupado": "Ocupado",
-    "reservado": "Reservado",
-    "no disponible": "No disponible",
-    "averiado": "Averiado",
-    "fuera de servicio": "Averiado",
+# Cascada completa en el navegador: una sola llamada WebDriver (sin esperas implícitas
+# por cada selector que no existe ni volcado del texto de cada nodo a Python).
+# arguments[0] = STATUS_CLASS_MAP, arguments[1] = pares de STATUS_TEXT_MAP en orden.
+JS_EXTRACT_STATUS = r"""
+const classMap = arguments[0], textPairs = arguments[1];
+const clsOf = el => (el.getAttribute && el.getAttribute('class')) || '';
+// 1) <lib-status-indicator class="s-light-green"> (zona div.status primero)
+let inds = document.querySelectorAll('div.status lib-status-indicator');
+if (!inds.length) inds = document.querySelectorAll('lib-status-indicator');
+for (const el of inds) {
+  for (const c of clsOf(el).split(/\s+/)) {
+    if (c && Object.prototype.hasOwnProperty.call(classMap, c)) return [classMap[c], 'indicator:' + c];
+  }
+}
+// 2) cualquier clase conocida en el DOM (subcadena, como contains(@class, ...))
+const all = Array.from(document.querySelectorAll('[class]'), clsOf);
+for (const key of Object.keys(classMap)) {
+  if (all.some(v => v.indexOf(key) !== -1)) return [classMap[key], 'class:' + key];
+}
+// 3) heurística por texto visible
+const txt = ((document.body && document.body.innerText) || '').toLowerCase();
+for (const [key, label] of textPairs) {
+  if (txt.indexOf(key) !== -1) return [label, 'text:' + key];
 }
+return null;
+"""
 
-def _infer_from_status_indicator(driver) -> Optional[Tuple[str, str]]:
+def extract_status(driver) -> Tuple[str, str]:
     """
-    Busca <lib-status-indicator ... class="s-light-green"> dentro de la zona de estado.
+    Devuelve (estado, raw_hint) con una única ejecución de JS. Orden de preferencia:
+    - lib-status-indicator (clases s-light-*)
+    - cualquier clase conocida en el DOM
+    - heurística por texto
     """
-    # CSS directo (tu JSXpath): div.status lib-status-indicator[class*='s-']
     try:
-        els = driver.find_elements(By.CSS_SELECTOR, "div.status lib-status-indicator")
-        if not els:
-            # fallback más amplio
-            els = driver.find_elements(By.CSS_SELECTOR, "lib-status-indicator")
-        for el in els:
-            cls = (el.get_attribute("class") or "").strip()
-            if not cls:
-                continue
-            classes = [c.strip() for c in cls.split() if c.strip()]
-            for c in classes:
-                if c in STATUS_CLASS_MAP:
-                    return STATUS_CLASS_MAP[c], f"indicator:{c}"
-    except Exception:
-        pass
-    return None
+        hit = driver.execute_script(JS_EXTRACT_STATUS, STATUS_CLASS_MAP, list(STATUS_TEXT_MAP.items()))
+    except Exception as e:
+        logger.warning("estado.extract.js.fail err=%s", e)
+        hit = None
+    if hit:
+        return hit[0], hit[1]
+    return "Desconocido", "none"
+
+# Atributos de <lib-plug-card> que pueden identificar la toma en la URL del conector
+PLUG_KEY_ATTRS = ("id", "data-id", "data-plug-id", "data-connector-id", "data-evse-id")
+
+def save_estado(conector_id: int, estado: str, hint: str):
+    """
+    Actualiza dbo.ConectorEstadoActual (una fila por conector) y solo añade fila
+    histórica a dbo.EstadosConector si el estado cambió o si han pasado
+    ESTADO_HEARTBEAT_MIN desde la última fila histórica (0 = sin latido).
+    """
+    execute("""
+      SET NOCOUNT ON;
+      DECLARE @prev NVARCHAR(32), @hist DATETIME2, @now DATETIME2 = SYSUTCDATETIME();
+      SELECT @prev = Estado, @hist = HistoricoUtc
+      FROM dbo.ConectorEstadoActual WITH (UPDLOCK, HOLDLOCK)
+      WHERE ConectorId = :cid;
 
-def _infer_status_by_class_anywhere(driver) -> Optional[Tuple[str,str]]:
-    for cls, label in STATUS_CLASS_MAP.items():
-        els = driver.find_elements(By.XPATH, f"//*[contains(@class,'{cls}')]")
-        if els:
-            return label, f"class:{cls}"
+      DECLARE @append BIT = CASE
+        WHEN @prev IS NULL OR @prev <> :est THEN 1
+        WHEN :hb > 0 AND @hist < DATEADD(minute, -:hb, @now) THEN 1
+        ELSE 0 END;
+
+      IF @prev IS NULL
+        INSERT INTO dbo.ConectorEstadoActual (ConectorId, Estado, Precio, RawHint, CapturedAtUtc, CambioUtc, HistoricoUtc)
+        VALUES (:cid, :est, NULL, :hint, @now, @now, @now);
+      ELSE
+        UPDATE dbo.ConectorEstadoActual
+        SET Estado = :est, RawHint = :hint, CapturedAtUtc = @now,
+            CambioUtc = CASE WHEN @prev <> :est THEN @now ELSE CambioUtc END,
+            HistoricoUtc = CASE WHEN @append = 1 THEN @now ELSE HistoricoUtc END
+        WHERE ConectorId = :cid;
+
+      IF @append = 1
+        INSERT INTO dbo.EstadosConector (ConectorId, Estado, Precio, RawHint, CapturedAtUtc)
+        VALUES (:cid, :est, NULL, :hint, @now);
+    """, cid=conector_id, est=estado, hint=hint, hb=ESTADO_HEARTBEAT_MIN)
+
+def _status_from_classes(cls: str) -> Optional[Tuple[str, str]]:
+    for c in (cls or "").split():
+        if c in STATUS_CLASS_MAP:
+            return STATUS_CLASS_MAP[c], f"indicator:{c}"
     return None
 
-def _infer_status_by_text(driver) -> Optional[Tuple[str,str]]:
-    try:
-        texts = [e.text.strip().lower() for e in driver.find_elements(By.XPATH, "//*[normalize-space(text())!='']")]
-        joined = " | ".join(texts)
-        for key, label in STATUS_TEXT_MAP.items():
-            if key in joined:
-                return label, f"text:{key}"
-    except Exception:
-        pass
+def _status_from_text(txt: str) -> Optional[Tuple[str, str]]:
+    low = (txt or "").lower()
+    for key, label in STATUS_TEXT_MAP.items():
+        if key in low:
+            return label, f"text:{key}"
     return None
 
-def extract_status(driver) -> Tuple[str, str]:
+# Datos crudos de cada <lib-plug-card> en una llamada: claves, clases de sus indicadores y texto
+JS_PLUG_CARDS = r"""
+const keyAttrs = arguments[0];
+return Array.from(document.querySelectorAll('lib-plug-card'), card => {
+  const keys = [];
+  for (const a of keyAttrs) {
+    const v = (card.getAttribute(a) || '').trim();
+    if (v) keys.push(v);
+  }
+  for (const a of card.querySelectorAll('a[href]')) {
+    const href = (a.href || '').trim().replace(/\/+$/, '');
+    if (href) keys.push(href.split('/').pop());
+  }
+  const cls = Array.from(card.querySelectorAll('lib-status-indicator'), i => i.getAttribute('class') || '');
+  return {keys: keys, cls: cls, text: card.innerText || ''};
+});
+"""
+
+def extract_plug_statuses(driver) -> List[Dict[str, Any]]:
     """
-    Devuelve (estado, raw_hint). Orden de preferencia:
-    - lib-status-indicator (clases s-light-*)
-    - cualquier clase conocida en el DOM
-    - heurística por texto
+    Una entrada por <lib-plug-card> en orden DOM:
+    {"index", "keys" (ids/hrefs para casar con UrlConector), "estado", "hint"}
     """
-    hit = (
-        _infer_from_status_indicator(driver)
-        or _infer_status_by_class_anywhere(driver)
-        or _infer_status_by_text(driver)
-    )
-    if hit:
-        return hit[0], hit[1]
-    return "Desconocido", "none"
+    try:
+        raw = driver.execute_script(JS_PLUG_CARDS, list(PLUG_KEY_ATTRS)) or []
+    except Exception as e:
+        logger.warning("estado.cards.js.fail err=%s", e)
+        raw = []
+    return cards_from_raw(raw)
+
+def cards_from_raw(raw: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """[{keys, cls, text}] (navegador o snapshot offline) -> tarjetas con estado."""
+    cards = []
+    for i, r in enumerate(raw):
+        hit = None
+        for cls in r.get("cls") or []:
+            hit = _status_from_classes(cls)
+            if hit:
+                break
+        if not hit:
+            hit = _status_from_text(r.get("text"))
+        estado, hint = hit if hit else ("Desconocido", "none")
+        cards.append({"index": i, "keys": r.get("keys") or [], "estado": estado, "hint": f"card{i}:{hint}"})
+    return cards
 
-def scrape_conector_estado(account_id: int, conector_id: int, url_conector: str) -> Tuple[str, str]:
+def scrape_conector_estado(account_id: int, conector_id: int, url_conector: str,
+                           deadline: Optional[float] = None) -> Tuple[str, str]:
+    """
+    deadline (epoch): la carga, las esperas y los scripts no pasan de ese instante y,
+    si se supera, lanza DeadlineExceeded sin escribir en BD.
+    """
     t0 = time.time()
-    drv = create_driver()
-    try:
-        cookies = get_current_cookies(account_id)
-        prime_cookies(drv, cookies)
+    with metrics.scrape("estado.conector") as m, \
+            checkout(account_id, time_left(deadline, ACQUIRE_TIMEOUT)) as drv, \
+            driver_deadline(drv, deadline):
+        ensure_primed(drv, account_id)
 
-        drv.get(url_conector)
+        with metrics.phase("navigate"):
+            drv.get(url_conector)
 
         # ✅ Espera a que Angular pueble la vista de puntos
-        try:
-            W(drv, 15).until(EC.presence_of_element_located((By.CSS_SELECTOR, "app-charging-stations, lib-plug-card, lib-status-indicator")))
-        except TimeoutException:
+        with metrics.phase("dom_wait"):
+            ready = wait_app_ready(drv, ["lib-status-indicator", "lib-plug-card", "app-charging-stations"], 15,
+                                   deadline=deadline)
+        if ready is None:
             logger.warning("estado.timeout.root conector_id=%s url=%s", conector_id, url_conector)
 
-        estado, hint = extract_status(drv)
+        with metrics.phase("extract"):
+            estado, hint = extract_status(drv)
+        m["outcome"], m["hint"] = estado, hint
+        capture_snapshot(drv, "conector", conector_id, url_conector)
         logger.info("estado.conector conector_id=%s estado=%s hint=%s duration_ms=%s",
                     conector_id, estado, hint, int((time.time()-t0)*1000))
 
-        execute("""
-          INSERT INTO dbo.EstadosConector (ConectorId, Estado, Precio, RawHint)
-          VALUES (:cid, :est, NULL, :hint)
-        """, cid=conector_id, est=estado, hint=hint)
+        check_deadline(deadline, f"conector_id={conector_id}")
+        with metrics.phase("db_write"):
+            save_estado(conector_id, estado, hint)
 
         # Si no encontramos nada, deja captura para depurar selectores reales
         if estado == "Desconocido":
@@ -127,6 +195,45 @@ def scrape_conector_estado(account_id: int, conector_id: int, url_conector: str)
                 pass
 
         return estado, hint
-    finally:
-        try: drv.quit()
-        except Exception: pass
+
+def scrape_punto_cards(account_id: int, url_punto: str, label=None,
+                       deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Carga la página de un punto y devuelve sus tarjetas (extract_plug_statuses) sin guardar nada."""
+    with metrics.scrape("estado.punto") as m, \
+            checkout(account_id, time_left(deadline, ACQUIRE_TIMEOUT)) as drv, \
+            driver_deadline(drv, deadline):
+        ensure_primed(drv, account_id)
+        with metrics.phase("navigate"):
+            drv.get(url_punto)
+        with metrics.phase("dom_wait"):
+            ready = wait_app_ready(drv, ["lib-plug-card"], 15, deadline=deadline)
+        if ready is None:
+            logger.warning("estado.timeout.punto punto=%s url=%s", label, url_punto)
+        with metrics.phase("extract"):
+            cards = extract_plug_statuses(drv)
+        m["outcome"] = "ok" if cards else "Desconocido"
+        capture_snapshot(drv, "punto", label, url_punto)
+        return cards
+
+def scrape_punto_estados(account_id: int, punto_id: int, url_punto: str,
+                         conns: List[Dict[str, Any]],
+                         deadline: Optional[float] = None) -> Dict[int, Tuple[str, str]]:
+    """
+    Carga la página del punto una sola vez y escribe el estado de sus conectores.
+    Devuelve {ConectorId: (estado, hint)} solo de los que se casaron con una tarjeta;
+    el resto lo resuelve el llamador por conector (en su propia tarea y con su plazo).
+    """
+    t0 = time.time()
+    out: Dict[int, Tuple[str, str]] = {}
+    # el driver vuelve al pool antes de escribir en BD o pedir otro driver
+    cards = scrape_punto_cards(account_id, url_punto, label=punto_id, deadline=deadline)
+    matched = match_cards(cards, conns)
+    check_deadline(deadline, f"punto_id={punto_id}")
+    with metrics.phase("db_write", scraper="estado.punto"):
+        for cid, card in matched.items():
+            save_estado(cid, card["estado"], card["hint"])
+            out[cid] = (card["estado"], card["hint"])
+
+    logger.info("estado.punto punto_id=%s cards=%s matched=%s/%s duration_ms=%s",
+                punto_id, len(cards), len(matched), len(conns), int((time.time()-t0)*1000))
+    return out
@@ -0,0 +1,171 @@
+# app/events.py
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from datetime import timedelta
+from typing import Dict, Set, Any, Optional, Iterator, Tuple
+
+from .db import fetch_all, fetch_one
+
+logger = logging.getLogger("events")
+
+# ------------------- CONFIG -------------------
+EVENTS_POLL_SEC = float(os.getenv("EVENTS_POLL_SEC", "2"))
+EVENTS_KEEPALIVE_SEC = float(os.getenv("EVENTS_KEEPALIVE_SEC", "15"))
+# Cierra el stream tras N s (EventSource reconecta solo). Cada cliente ocupa un hilo
+# de gunicorn: gunicorn.conf.py usa gthread (GUNICORN_THREADS por worker).
+EVENTS_STREAM_MAX_SEC = int(os.getenv("EVENTS_STREAM_MAX_SEC", "300"))
+EVENTS_CLIENT_QUEUE = int(os.getenv("EVENTS_CLIENT_QUEUE", "200"))
+EVENTS_PAGE = int(os.getenv("EVENTS_PAGE", "500"))
+# Cada consulta relee esta ventana antes de la marca: un cambio que se confirma tarde
+# con un CambioUtc anterior (transacción larga) sigue llegando si cae dentro de ella.
+EVENTS_OVERLAP_SEC = float(os.getenv("EVENTS_OVERLAP_SEC", "30"))
+
+
+class EventHub:
+    """
+    Fan-out en proceso de cambios de estado (dbo.ConectorEstadoActual.CambioUtc).
+    Un único hilo consulta la BD cada EVENTS_POLL_SEC (solo mientras haya
+    suscriptores) y reparte las filas nuevas a las colas de los clientes del
+    usuario dueño del conector; ningún cliente retiene una conexión de BD.
+    """
+
+    def __init__(self):
+        self._subs: Dict[int, Set[queue.Queue]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._since = None
+        # (ConectorId, CambioUtc) ya publicados dentro de la ventana de solape
+        self._seen: Set[Tuple[int, Any]] = set()
+
+    def subscribe(self, user_id: int) -> queue.Queue:
+        q: queue.Queue = queue.Queue(maxsize=EVENTS_CLIENT_QUEUE)
+        with self._lock:
+            self._subs.setdefault(user_id, set()).add(q)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="events-poller", daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, user_id: int, q: queue.Queue):
+        with self._lock:
+            subs = self._subs.get(user_id)
+            if subs:
+                subs.discard(q)
+                if not subs:
+                    self._subs.pop(user_id, None)
+
+    def publish(self, user_id: int, event: Dict[str, Any]):
+        with self._lock:
+            targets = list(self._subs.get(user_id, ()))
+        for q in targets:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # cliente lento: se descarta el evento, el siguiente lo corrige
+                pass
+
+    def _poll(self):
+        if self._since is None:
+            self._since = fetch_one("SELECT SYSUTCDATETIME() AS now")["now"]
+            self._seen = set()
+        # tabla compacta: CambioUtc solo avanza en transiciones de estado.
+        # Keyset por (CambioUtc, ConectorId): los empates en el corte de página no se pierden.
+        ts, cid = self._since - timedelta(seconds=EVENTS_OVERLAP_SEC), -1
+        newest = self._since
+        while True:
+            rows = fetch_all("""
+                SELECT TOP (:lim) e.ConectorId, e.Estado, e.RawHint, e.CapturedAtUtc, e.CambioUtc,
+                       p.UserId, p.PuntoId, p.Nombre AS Punto, c.Nombre AS Conector
+                FROM dbo.ConectorEstadoActual e
+                JOIN dbo.Conectores c ON c.ConectorId = e.ConectorId
+                JOIN dbo.Puntos p ON p.PuntoId = c.PuntoId
+                WHERE e.CambioUtc >= :ts
+                  AND (e.CambioUtc > :ts OR e.ConectorId > :cid)
+                ORDER BY e.CambioUtc, e.ConectorId
+            """, lim=EVENTS_PAGE, ts=ts, cid=cid)
+            for r in rows:
+                key = (r["ConectorId"], r["CambioUtc"])
+                if key not in self._seen:
+                    self._seen.add(key)
+                    self.publish(r["UserId"], _event_row(r))
+                if r["CambioUtc"] > newest:
+                    newest = r["CambioUtc"]
+            if len(rows) < EVENTS_PAGE:
+                break
+            ts, cid = rows[-1]["CambioUtc"], rows[-1]["ConectorId"]
+        self._since = newest
+        cutoff = newest - timedelta(seconds=EVENTS_OVERLAP_SEC)
+        self._seen = {k for k in self._seen if k[1] >= cutoff}
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subs:
+                    # sin clientes: el hilo termina; el próximo subscribe lo relanza
+                    self._thread = None
+                    self._since = None
+                    return
+            try:
+                self._poll()
+            except Exception as e:
+                logger.warning("events.poll.fail: %s", e)
+            time.sleep(EVENTS_POLL_SEC)
+
+
+def _event_row(r) -> Dict[str, Any]:
+    return {
+        "conector_id": r["ConectorId"], "estado": r["Estado"], "hint": r.get("RawHint"),
+        "captured_at": r["CapturedAtUtc"].isoformat() if r["CapturedAtUtc"] else None,
+        "punto_id": r.get("PuntoId"), "punto": r.get("Punto"), "conector": r.get("Conector"),
+    }
+
+
+_hub: Optional[EventHub] = None
+
+
+def get_hub() -> EventHub:
+    global _hub
+    if _hub is None:
+        _hub = EventHub()
+    return _hub
+
+
+def _sse(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def snapshot(user_id: int):
+    """Estado actual de los conectores activos del usuario (primer mensaje del stream)."""
+    rows = fetch_all("""
+        SELECT e.ConectorId, e.Estado, NULL AS RawHint, e.CapturedAtUtc,
+               p.PuntoId, p.Nombre AS Punto, c.Nombre AS Conector
+        FROM dbo.Conectores c
+        JOIN dbo.Puntos p ON p.PuntoId = c.PuntoId
+        JOIN dbo.V_ConectorEstadoActual e ON e.ConectorId = c.ConectorId
+        WHERE p.UserId = :uid AND c.Activo = 1
+        ORDER BY p.PuntoId, c.Orden
+    """, uid=user_id)
+    return [_event_row(r) for r in rows]
+
+
+def stream_estados(user_id: int) -> Iterator[str]:
+    """Generador SSE: snapshot inicial + cambios según llegan + keep-alive."""
+    yield "retry: 3000\n\n"
+    yield _sse({"items": snapshot(user_id)}, event="snapshot")
+    hub = get_hub()
+    q = hub.subscribe(user_id)
+    t_end = time.time() + EVENTS_STREAM_MAX_SEC
+    try:
+        while time.time() < t_end:
+            try:
+                ev = q.get(timeout=EVENTS_KEEPALIVE_SEC)
+                yield _sse(ev, event="estado")
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+    finally:
+        hub.unsubscribe(user_id, q)
@@ -0,0 +1,135 @@
+# app/fetchers.py
+import os
+import time
+import logging
+import threading
+from typing import Callable, Optional, Tuple, Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .estado import scrape_conector_estado, save_estado
+from .utils.status import FetchSchemaError, plug_id_from_url, parse_status_payload
+from .utils.ptp_cookies import get_current_cookies, cookies_key
+from .utils.waits import time_left, check_deadline
+from . import metrics
+
+logger = logging.getLogger("fetchers")
+
+# ------------------- CONFIG -------------------
+FETCHER_BACKEND = os.getenv("FETCHER_BACKEND", "selenium")       # selenium | http
+PTP_API_BASE = os.getenv("PTP_API_BASE", "https://api.placetoplug.com").rstrip("/")
+PTP_STATUS_API_PATH = os.getenv("PTP_STATUS_API_PATH", "/plugs/{plug_id}")
+HTTP_TIMEOUT = float(os.getenv("FETCHER_HTTP_TIMEOUT", "10"))
+HTTP_POOL_MAXSIZE = int(os.getenv("FETCHER_HTTP_POOL_MAXSIZE", "10"))
+USER_AGENT = os.getenv("FETCHER_USER_AGENT",
+                       "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36")
+
+class FetchAuthError(Exception):
+    """El backend rechazó las cookies (401/403 o redirección a login)."""
+
+
+# ------------------- BACKENDS -------------------
+class HttpStatusFetcher:
+    """
+    Consulta el backend JSON de PlaceToPlug con las cookies de dbo.CookiesPTP
+    (cookies_fn(account_id), por defecto get_current_cookies).
+    Una requests.Session por cuenta (keep-alive), reconstruida si cambian las cookies.
+    Para probarlo en local: bench/server.py sirve /plugs/<id> (PTP_API_BASE=http://127.0.0.1:8765).
+    """
+
+    def __init__(self, api_base: str = PTP_API_BASE, path_tpl: str = PTP_STATUS_API_PATH,
+                 timeout: float = HTTP_TIMEOUT, cookies_fn: Callable = get_current_cookies):
+        self.api_base = api_base.rstrip("/")
+        self.path_tpl = path_tpl
+        self.timeout = timeout
+        self.cookies_fn = cookies_fn
+        self._sessions: Dict[int, Tuple[tuple, requests.Session]] = {}
+        self._lock = threading.Lock()
+
+    def _new_session(self, cookies) -> requests.Session:
+        s = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_MAXSIZE)
+        s.mount("https://", adapter)
+        s.mount("http://", adapter)
+        s.headers.update({"User-Agent": USER_AGENT, "Accept": "application/json"})
+        for c in cookies:
+            s.cookies.set(c["name"], c["value"], domain=c.get("domain"), path=c.get("path") or "/")
+        return s
+
+    def session_for(self, account_id: int) -> requests.Session:
+        cookies = self.cookies_fn(account_id)
+        key = cookies_key(account_id, cookies)
+        with self._lock:
+            cur = self._sessions.get(account_id)
+            if cur and cur[0] == key:
+                return cur[1]
+            if cur:
+                cur[1].close()
+            s = self._new_session(cookies)
+            self._sessions[account_id] = (key, s)
+            return s
+
+    def fetch(self, account_id: int, conector_id: int, url_conector: str,
+              deadline: Optional[float] = None) -> Tuple[str, str]:
+        plug_id = plug_id_from_url(url_conector)
+        if not plug_id:
+            raise FetchSchemaError(f"no se pudo extraer el id de toma de {url_conector}")
+        url = self.api_base + self.path_tpl.format(plug_id=plug_id)
+        check_deadline(deadline, f"conector_id={conector_id}")
+        resp = self.session_for(account_id).get(url, timeout=max(0.5, time_left(deadline, self.timeout)),
+                                                allow_redirects=False)
+        if resp.status_code in (401, 403) or (300 <= resp.status_code < 400 and "entrar" in resp.headers.get("Location", "")):
+            raise FetchAuthError(f"HTTP {resp.status_code}")
+        resp.raise_for_status()
+        try:
+            data = resp.json()
+        except ValueError as e:
+            raise FetchSchemaError("respuesta no JSON") from e
+        return parse_status_payload(data)
+
+    def close(self):
+        with self._lock:
+            for _, s in self._sessions.values():
+                s.close()
+            self._sessions.clear()
+
+
+_http: Optional[HttpStatusFetcher] = None
+
+
+def get_http_fetcher() -> HttpStatusFetcher:
+    global _http
+    if _http is None:
+        _http = HttpStatusFetcher()
+    return _http
+
+
+def fetch_estado(account_id: int, conector_id: int, url_conector: str,
+                 deadline: Optional[float] = None) -> Tuple[str, str]:
+    """
+    Misma firma y efecto que scrape_conector_estado (persiste en EstadosConector).
+    Con FETCHER_BACKEND=http prueba primero el JSON y cae a Selenium ante error
+    de autenticación, de formato o de red. El fallback comparte el mismo deadline.
+    """
+    if FETCHER_BACKEND != "http":
+        return scrape_conector_estado(account_id, conector_id, url_conector, deadline=deadline)
+    t0 = time.time()
+    with metrics.scrape("estado.http") as m:
+        try:
+            with metrics.phase("fetch"):
+                estado, hint = get_http_fetcher().fetch(account_id, conector_id, url_conector, deadline)
+        except (FetchAuthError, FetchSchemaError, requests.RequestException) as e:
+            m["outcome"] = "Fallback"
+            logger.warning("fetch.http.fallback conector_id=%s reason=%s: %s",
+                           conector_id, type(e).__name__, e)
+        else:
+            m["outcome"], m["hint"] = estado, hint
+            check_deadline(deadline, f"conector_id={conector_id}")
+            with metrics.phase("db_write"):
+                save_estado(conector_id, estado, hint)
+    if m["outcome"] == "Fallback":
+        return scrape_conector_estado(account_id, conector_id, url_conector, deadline=deadline)
+    logger.info("estado.conector conector_id=%s estado=%s hint=%s backend=http duration_ms=%s",
+                conector_id, estado, hint, int((time.time() - t0) * 1000))
+    return estado, hint
@@ -0,0 +1,127 @@
+# app/http_login.py
+import os
+import time
+import logging
+import threading
+from typing import List, Dict, Any, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("http_login")
+
+# ------------------- CONFIG -------------------
+# Endpoints del servicio de cuentas; configurables para apuntar a un servidor de pruebas local
+PTP_AUTH_BASE = os.getenv("PTP_AUTH_BASE", "https://account.placetoplug.com").rstrip("/")
+PTP_AUTH_WARMUP_PATH = os.getenv("PTP_AUTH_WARMUP_PATH", "/es/entrar")        # cookies previas / XSRF; "" = no
+PTP_AUTH_LOGIN_PATH = os.getenv("PTP_AUTH_LOGIN_PATH", "/api/auth/login")
+PTP_AUTH_EMAIL_FIELD = os.getenv("PTP_AUTH_EMAIL_FIELD", "email")
+PTP_AUTH_PASSWORD_FIELD = os.getenv("PTP_AUTH_PASSWORD_FIELD", "password")
+PTP_AUTH_TOKEN_FIELD = os.getenv("PTP_AUTH_TOKEN_FIELD", "token")             # si el token viene en el JSON
+PTP_AUTH_COOKIE_DOMAIN = os.getenv("PTP_AUTH_COOKIE_DOMAIN", ".placetoplug.com")
+PTP_AUTH_TIMEOUT = float(os.getenv("PTP_AUTH_TIMEOUT", "15"))
+PTP_AUTH_USER_AGENT = os.getenv("PTP_AUTH_USER_AGENT", os.getenv(
+    "FETCHER_USER_AGENT",
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"))
+
+XSRF_COOKIES = ("XSRF-TOKEN", "xsrf-token", "csrftoken")
+
+
+class HttpLoginError(Exception):
+    """Fallo del login HTTP ajeno a las credenciales (red, formato, sin auth_token): se puede caer a Selenium."""
+
+
+class HttpLoginAuthError(HttpLoginError):
+    """Credenciales rechazadas (400/401/403): reintentar con Selenium no cambiaría nada."""
+
+
+# Un solo pool de conexiones (keep-alive) para todos los logins del proceso;
+# cada login usa su propia Session para no mezclar cookies entre cuentas.
+_adapter: Optional[HTTPAdapter] = None
+_adapter_lock = threading.Lock()
+
+
+def _get_adapter() -> HTTPAdapter:
+    global _adapter
+    with _adapter_lock:
+        if _adapter is None:
+            _adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=1)
+        return _adapter
+
+
+def _new_session() -> requests.Session:
+    s = requests.Session()
+    a = _get_adapter()
+    s.mount("https://", a)
+    s.mount("http://", a)
+    s.headers.update({"User-Agent": PTP_AUTH_USER_AGENT, "Accept": "application/json, text/plain, */*"})
+    return s
+
+
+def jar_to_cookies(jar) -> List[Dict[str, Any]]:
+    """CookieJar de requests -> mismo formato que ptp.dump_cookies (para store_cookies_in_db)."""
+    out: List[Dict[str, Any]] = []
+    for c in jar:
+        rest = getattr(c, "_rest", {}) or {}
+        http_only = any(k.lower() == "httponly" for k in rest)
+        same_site = next((v for k, v in rest.items() if k.lower() == "samesite"), None)
+        out.append({
+            "name": c.name,
+            "value": c.value,
+            "domain": c.domain,
+            "path": c.path,
+            "expiry": int(c.expires) if c.expires else None,
+            "secure": bool(c.secure),
+            "httpOnly": http_only,
+            "sameSite": same_site,
+        })
+    return out
+
+
+def http_login_and_collect_cookies(email: str, password: str, base: str = PTP_AUTH_BASE) -> List[Dict[str, Any]]:
+    """
+    Mismo contrato que ptp.login_and_collect_cookies pero sin navegador:
+    GET de calentamiento (cookies previas / XSRF) + POST de credenciales.
+    El auth_token llega como Set-Cookie o en el JSON (PTP_AUTH_TOKEN_FIELD).
+    """
+    t0 = time.time()
+    s = _new_session()
+    try:
+        if PTP_AUTH_WARMUP_PATH:
+            try:
+                s.get(base + PTP_AUTH_WARMUP_PATH, timeout=PTP_AUTH_TIMEOUT)
+            except requests.RequestException as e:
+                raise HttpLoginError(f"warmup: {e}") from e
+        headers = {"Origin": base, "Referer": base + (PTP_AUTH_WARMUP_PATH or "/")}
+        xsrf = next((s.cookies.get(n) for n in XSRF_COOKIES if s.cookies.get(n)), None)
+        if xsrf:
+            headers["X-XSRF-TOKEN"] = xsrf
+
+        try:
+            resp = s.post(base + PTP_AUTH_LOGIN_PATH, timeout=PTP_AUTH_TIMEOUT, headers=headers,
+                          json={PTP_AUTH_EMAIL_FIELD: email, PTP_AUTH_PASSWORD_FIELD: password})
+        except requests.RequestException as e:
+            raise HttpLoginError(f"login: {e}") from e
+        if resp.status_code in (400, 401, 403):
+            raise HttpLoginAuthError(f"HTTP {resp.status_code}")
+        if resp.status_code >= 300:
+            raise HttpLoginError(f"HTTP {resp.status_code}")
+
+        if not s.cookies.get("auth_token"):
+            token = None
+            try:
+                data = resp.json()
+                token = data.get(PTP_AUTH_TOKEN_FIELD) if isinstance(data, dict) else None
+            except ValueError:
+                pass
+            if not token:
+                raise HttpLoginError("respuesta sin auth_token")
+            s.cookies.set("auth_token", token, domain=PTP_AUTH_COOKIE_DOMAIN, path="/", secure=True)
+
+        cookies = jar_to_cookies(s.cookies)
+        logger.info("ptp.login.http.success cookies=%s duration_ms=%s", len(cookies), int((time.time() - t0) * 1000))
+        return cookies
+    finally:
+        # cierra la Session pero no el adaptador compartido
+        s.adapters.clear()
+        s.close()
@@ -0,0 +1,278 @@
+# app/jobs.py
+import os
+import json
+import time
+import uuid
+import socket
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+
+from sqlalchemy import text
+
+from .db import fetch_all, fetch_one, execute, transaction, unit_of_work
+from .refresh import refresh_conectores
+from .meta import scrape_punto_info, scrape_conector_info
+
+logger = logging.getLogger("jobs")
+
+# ------------------- CONFIG -------------------
+# db: cola en dbo.RefreshJobs que ejecuta workers/jobs_run.py
+# local: hilo de fondo en el propio proceso web (desarrollo / sin workers)
+JOBS_BACKEND = os.getenv("JOBS_BACKEND", "db")
+JOBS_LOCAL_WORKERS = int(os.getenv("JOBS_LOCAL_WORKERS", "1"))
+JOBS_STALE_MIN = int(os.getenv("JOBS_STALE_MIN", "30"))   # en_curso sin latido en este plazo -> se reintenta
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))  # reclamado tantas veces sin terminar -> error
+
+TIPOS = ("estado", "punto", "meta")
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+# ------------------- CONSULTAS COMUNES -------------------
+def cuenta_ptp(user_id: int) -> Optional[int]:
+    acc = fetch_one("""
+      SELECT TOP 1 a.AccountId
+      FROM dbo.CuentasPTP a JOIN dbo.CredencialesPTP c ON c.AccountId=a.AccountId
+      WHERE a.UserId=:uid ORDER BY a.AccountId
+    """, uid=user_id)
+    return acc["AccountId"] if acc else None
+
+
+def conectores_usuario(user_id: int):
+    return fetch_all("""
+      SELECT c.ConectorId, c.UrlConector, c.Orden, p.PuntoId, p.UrlPunto
+      FROM dbo.Conectores c
+      JOIN dbo.Puntos p ON p.PuntoId=c.PuntoId
+      WHERE p.UserId=:uid AND c.Activo=1
+      ORDER BY p.PuntoId, c.Orden
+    """, uid=user_id)
+
+
+def conectores_punto(punto_id: int):
+    return fetch_all("""
+      SELECT c.ConectorId, c.UrlConector, c.Orden, p.PuntoId, p.UrlPunto
+      FROM dbo.Conectores c
+      JOIN dbo.Puntos p ON p.PuntoId=c.PuntoId
+      WHERE c.PuntoId=:pid AND c.Activo=1
+      ORDER BY c.Orden, c.ConectorId
+    """, pid=punto_id)
+
+
+# ------------------- BACKENDS -------------------
+class DBJobStore:
+    """
+    Cola de trabajos en dbo.RefreshJobs / dbo.RefreshJobItems.
+    El progreso solo lo escribe el worker que tiene el trabajo (WorkerId): si otro lo
+    reclamó porque dejó de latir, las escrituras del primero se descartan.
+    """
+
+    def __init__(self, worker_id: str = WORKER_ID):
+        self.worker_id = worker_id
+
+    def enqueue(self, user_id: int, tipo: str, payload: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        execute("""
+            INSERT INTO dbo.RefreshJobs (JobId, UserId, Tipo, PayloadJson, Estado)
+            VALUES (:id, :uid, :t, :p, N'pendiente')
+        """, id=job_id, uid=user_id, t=tipo, p=json.dumps(payload))
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Toma el trabajo pendiente más antiguo (o uno en_curso cuyo worker dejó de latir)."""
+        with transaction() as conn:
+            # abandonados que ya agotaron sus intentos: no se vuelven a reclamar
+            conn.execute(text("""
+                UPDATE dbo.RefreshJobs
+                SET Estado=N'error', Error=N'abandonado tras ' + CAST(Intentos AS NVARCHAR(10)) + N' intentos',
+                    FinalizadoUtc=SYSUTCDATETIME()
+                WHERE Estado=N'en_curso' AND Intentos >= :max
+                  AND ISNULL(LatidoUtc, IniciadoUtc) < DATEADD(minute, -:stale, SYSUTCDATETIME())
+            """), {"max": JOBS_MAX_ATTEMPTS, "stale": JOBS_STALE_MIN})
+            row = conn.execute(text("""
+                UPDATE j SET Estado=N'en_curso', WorkerId=:w, IniciadoUtc=SYSUTCDATETIME(),
+                             LatidoUtc=SYSUTCDATETIME(), Intentos=Intentos+1, Total=0, Hechos=0
+                OUTPUT inserted.JobId, inserted.UserId, inserted.Tipo, inserted.PayloadJson, inserted.Intentos
+                FROM (
+                    SELECT TOP 1 * FROM dbo.RefreshJobs WITH (ROWLOCK, UPDLOCK, READPAST)
+                    WHERE Estado=N'pendiente'
+                       OR (Estado=N'en_curso' AND Intentos < :max
+                           AND ISNULL(LatidoUtc, IniciadoUtc) < DATEADD(minute, -:stale, SYSUTCDATETIME()))
+                    ORDER BY CreadoUtc
+                ) j
+            """), {"w": self.worker_id, "stale": JOBS_STALE_MIN, "max": JOBS_MAX_ATTEMPTS}).mappings().first()
+            if row:
+                conn.execute(text("DELETE FROM dbo.RefreshJobItems WHERE JobId=:id"), {"id": row["JobId"]})
+        return dict(row) if row else None
+
+    def start(self, job_id: str, total: int):
+        execute("""
+            UPDATE dbo.RefreshJobs SET Total=:n, LatidoUtc=SYSUTCDATETIME()
+            WHERE JobId=:id AND WorkerId=:w AND Estado=N'en_curso'
+        """, n=total, id=job_id, w=self.worker_id)
+
+    def report(self, job_id: str, item: Dict[str, Any]):
+        with transaction() as conn:
+            # cada resultado es también el latido del trabajo
+            res = conn.execute(text("""
+                UPDATE dbo.RefreshJobs SET Hechos=Hechos+1, LatidoUtc=SYSUTCDATETIME()
+                WHERE JobId=:id AND WorkerId=:w AND Estado=N'en_curso'
+            """), {"id": job_id, "w": self.worker_id})
+            if res.rowcount == 0:
+                logger.warning("job.lost job_id=%s worker=%s: reclamado por otro worker", job_id, self.worker_id)
+                return
+            conn.execute(text("""
+                INSERT INTO dbo.RefreshJobItems (JobId, ConectorId, Estado, Hint)
+                VALUES (:id, :cid, :est, :hint)
+            """), {"id": job_id, "cid": item.get("conector_id"), "est": item.get("estado"),
+                   "hint": (str(item.get("hint")) if item.get("hint") is not None else None)})
+
+    def finish(self, job_id: str, error: Optional[str] = None, result: Optional[Dict[str, Any]] = None):
+        execute("""
+            UPDATE dbo.RefreshJobs
+            SET Estado=:e, Error=:err, ResultJson=:r, FinalizadoUtc=SYSUTCDATETIME()
+            WHERE JobId=:id AND WorkerId=:w AND Estado=N'en_curso'
+        """, id=job_id, w=self.worker_id, e=("error" if error else "ok"), err=error,
+             r=(json.dumps(result, ensure_ascii=False, default=str) if result else None))
+
+    def status(self, job_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        job = fetch_one("""
+            SELECT JobId, Tipo, Estado, Total, Hechos, Error, ResultJson,
+                   CreadoUtc, IniciadoUtc, FinalizadoUtc
+            FROM dbo.RefreshJobs WHERE JobId=:id AND UserId=:uid
+        """, id=job_id, uid=user_id)
+        if not job:
+            return None
+        items = fetch_all("""
+            SELECT ConectorId, Estado, Hint FROM dbo.RefreshJobItems
+            WHERE JobId=:id ORDER BY JobItemId
+        """, id=job_id)
+        return {
+            "job_id": job["JobId"], "tipo": job["Tipo"], "estado": job["Estado"],
+            "total": job["Total"] or 0, "hechos": job["Hechos"] or 0, "error": job["Error"],
+            "result": json.loads(job["ResultJson"]) if job["ResultJson"] else None,
+            "results": [{"conector_id": i["ConectorId"], "estado": i["Estado"], "hint": i["Hint"]} for i in items],
+        }
+
+
+class LocalJobStore:
+    """Sustituto en memoria: ejecuta los trabajos en un hilo del propio proceso."""
+
+    def __init__(self, workers: int = JOBS_LOCAL_WORKERS):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+
+    def enqueue(self, user_id: int, tipo: str, payload: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._jobs[job_id] = {"user_id": user_id, "tipo": tipo, "estado": "pendiente",
+                                  "total": 0, "hechos": 0, "error": None, "result": None,
+                                  "results": [], "creado": time.time()}
+        job = {"JobId": job_id, "UserId": user_id, "Tipo": tipo, "PayloadJson": json.dumps(payload)}
+        self._pool.submit(run_job, job, self)
+        return job_id
+
+    def start(self, job_id: str, total: int):
+        with self._lock:
+            self._jobs[job_id].update(estado="en_curso", total=total)
+
+    def report(self, job_id: str, item: Dict[str, Any]):
+        with self._lock:
+            j = self._jobs[job_id]
+            j["results"].append(item)
+            j["hechos"] += 1
+
+    def finish(self, job_id: str, error: Optional[str] = None, result: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            self._jobs[job_id].update(estado=("error" if error else "ok"), error=error, result=result)
+            # no acumular trabajos viejos indefinidamente
+            limit = time.time() - 3600
+            for k in [k for k, v in self._jobs.items() if v["creado"] < limit and v["estado"] in ("ok", "error")]:
+                self._jobs.pop(k, None)
+
+    def status(self, job_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            j = self._jobs.get(job_id)
+            if not j or j["user_id"] != user_id:
+                return None
+            return {"job_id": job_id, "tipo": j["tipo"], "estado": j["estado"], "total": j["total"],
+                    "hechos": j["hechos"], "error": j["error"], "result": j["result"],
+                    "results": list(j["results"])}
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = LocalJobStore() if JOBS_BACKEND == "local" else DBJobStore()
+    return _store
+
+
+def enqueue(user_id: int, tipo: str, payload: Optional[Dict[str, Any]] = None) -> str:
+    assert tipo in TIPOS, f"tipo de trabajo desconocido: {tipo}"
+    job_id = get_store().enqueue(user_id, tipo, payload or {})
+    logger.info("job.enqueue job_id=%s tipo=%s user_id=%s backend=%s", job_id, tipo, user_id, JOBS_BACKEND)
+    return job_id
+
+
+def job_status(job_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+    return get_store().status(job_id, user_id)
+
+
+# ------------------- EJECUCIÓN -------------------
+def _run_meta(job_id: str, account_id: int, punto_id: int, store) -> Dict[str, Any]:
+    with unit_of_work():
+        p = fetch_one("SELECT PuntoId, UrlPunto FROM dbo.Puntos WHERE PuntoId=:id", id=punto_id)
+        conns = conectores_punto(punto_id)
+        store.start(job_id, len(conns) + (1 if p and p["UrlPunto"] else 0))
+    info_p = {}
+    if p and p["UrlPunto"]:
+        try:
+            info_p = scrape_punto_info(account_id, punto_id, p["UrlPunto"])
+            store.report(job_id, {"conector_id": None, "estado": "ok", "hint": "punto"})
+        except Exception as e:
+            logger.error("meta punto error: %s", e, exc_info=True)
+            store.report(job_id, {"conector_id": None, "estado": "Error", "hint": str(e)})
+    infos_c = []
+    for c in conns:
+        try:
+            infos_c.append(scrape_conector_info(account_id, c["ConectorId"], c["UrlConector"]))
+            store.report(job_id, {"conector_id": c["ConectorId"], "estado": "ok", "hint": "meta"})
+        except Exception as e:
+            logger.error("meta conector error: %s", e, exc_info=True)
+            store.report(job_id, {"conector_id": c["ConectorId"], "estado": "Error", "hint": str(e)})
+    return {"punto": info_p, "conectores": infos_c}
+
+
+def run_job(job: Dict[str, Any], store=None):
+    """Ejecuta un trabajo reclamado ({JobId, UserId, Tipo, PayloadJson}) informando el progreso."""
+    store = store or get_store()
+    job_id, user_id, tipo = job["JobId"], job["UserId"], job["Tipo"]
+    t0 = time.time()
+    try:
+        payload = json.loads(job.get("PayloadJson") or "{}")
+        # lecturas previas en una unidad de trabajo; los scrapes van fuera, sin conexión
+        # retenida, y cada report() confirma solo para que la web vea el progreso
+        with unit_of_work():
+            account_id = cuenta_ptp(user_id)
+            if not account_id:
+                raise RuntimeError("Configura tu cuenta PTP primero.")
+            if tipo != "meta":
+                conns = conectores_punto(int(payload["PuntoId"])) if tipo == "punto" else conectores_usuario(user_id)
+                store.start(job_id, len(conns))
+        result = None
+        if tipo == "meta":
+            result = _run_meta(job_id, account_id, int(payload["PuntoId"]), store)
+        else:
+            refresh_conectores(account_id, conns, on_result=lambda r: store.report(job_id, r))
+        store.finish(job_id, result=result)
+        logger.info("job.done job_id=%s tipo=%s duration_ms=%s", job_id, tipo, int((time.time() - t0) * 1000))
+    except Exception as e:
+        logger.error("job.fail job_id=%s tipo=%s: %s", job_id, tipo, e, exc_info=True)
+        try:
+            store.finish(job_id, error=str(e))
+        except Exception:
+            pass
@@ -0,0 +1,190 @@
+# app/leases.py
+import os
+import math
+import time
+import socket
+import logging
+import threading
+from typing import Set, Optional
+
+from sqlalchemy import text
+
+from .db import fetch_all, execute, transaction
+
+logger = logging.getLogger("leases")
+
+# ------------------- CONFIG -------------------
+LEASE_TTL_SEC = int(os.getenv("LEASE_TTL_SEC", "90"))             # sin latido en este plazo = nodo muerto
+LEASE_HEARTBEAT_SEC = int(os.getenv("LEASE_HEARTBEAT_SEC", "20"))
+# un nodo se da de alta y espera esto antes de su primer reparto: los que arrancan a la
+# vez (p.ej. desde cron) se cuentan entre sí en vez de quedarse el primero con todo
+LEASE_JOIN_GRACE_SEC = float(os.getenv("LEASE_JOIN_GRACE_SEC", "10"))
+
+NODE_ID = os.getenv("WORKER_NODE_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+# recursos repartibles: cuentas PTP con credenciales (un perfil de Chrome por cuenta)
+RECURSOS_SQL = """
+    SELECT DISTINCT a.AccountId AS Recurso
+    FROM dbo.CuentasPTP a JOIN dbo.CredencialesPTP c ON c.AccountId = a.AccountId
+"""
+
+
+class LeaseManager:
+    """
+    Leases con caducidad en dbo.WorkerLeases para repartir cuentas entre nodos.
+    Cada nodo toma como máximo ceil(recursos / nodos vivos): al entrar un nodo,
+    los demás sueltan el exceso en su siguiente rebalanceo; al morir uno, sus
+    leases caducan (LEASE_TTL_SEC) y los reclaman los vivos.
+    El reparto se recalcula en cada rebalance(): con una sola pasada por proceso
+    (cron) solo se reparten los nodos que se den de alta dentro de LEASE_JOIN_GRACE_SEC;
+    un reparto que se ajuste a altas y bajas de nodos requiere el modo bucle.
+    """
+
+    def __init__(self, tipo: str = "estado", node_id: str = NODE_ID, ttl: int = LEASE_TTL_SEC,
+                 join_grace: float = LEASE_JOIN_GRACE_SEC):
+        self.tipo = tipo
+        self.node_id = node_id
+        self.ttl = ttl
+        self.join_grace = join_grace
+        self._joined: Optional[float] = None
+        self._owned: Set[int] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # --- latido ---
+    def heartbeat(self) -> Set[int]:
+        """Late el nodo, renueva sus leases y devuelve los que sigue poseyendo."""
+        with transaction() as conn:
+            conn.execute(text("""
+                MERGE dbo.WorkerNodes AS t
+                USING (SELECT :t AS Tipo, :n AS NodeId) AS s ON t.Tipo = s.Tipo AND t.NodeId = s.NodeId
+                WHEN MATCHED THEN UPDATE SET HeartbeatUtc = SYSUTCDATETIME()
+                WHEN NOT MATCHED THEN INSERT (NodeId, Tipo, HeartbeatUtc) VALUES (s.NodeId, s.Tipo, SYSUTCDATETIME());
+            """), {"t": self.tipo, "n": self.node_id})
+            rows = conn.execute(text("""
+                UPDATE dbo.WorkerLeases
+                SET ExpiraUtc = DATEADD(second, :ttl, SYSUTCDATETIME())
+                OUTPUT inserted.Recurso
+                WHERE Tipo = :t AND Owner = :n AND ExpiraUtc > SYSUTCDATETIME()
+            """), {"t": self.tipo, "n": self.node_id, "ttl": self.ttl}).mappings().all()
+        owned = {r["Recurso"] for r in rows}
+        with self._lock:
+            lost = self._owned - owned
+            self._owned = owned
+        if lost:
+            logger.warning("lease.lost node=%s recursos=%s", self.node_id, sorted(lost))
+        return owned
+
+    def register(self):
+        """Alta del nodo en dbo.WorkerNodes (primer latido); marca el inicio del plazo de gracia."""
+        self.heartbeat()
+        if self._joined is None:
+            self._joined = time.time()
+
+    def rebalance(self) -> Set[int]:
+        """Alta de recursos nuevos, cálculo del reparto justo y toma/suelta de leases."""
+        if self._joined is None:
+            self.register()
+        wait = self._joined + self.join_grace - time.time()
+        if wait > 0:
+            # primer reparto: deja que se registren los nodos que arrancan a la vez
+            logger.info("lease.join.grace node=%s wait_s=%.1f", self.node_id, wait)
+            self._stop.wait(wait)
+        self.heartbeat()
+        with transaction() as conn:
+            # recursos nuevos -> fila de lease libre
+            conn.execute(text(f"""
+                INSERT INTO dbo.WorkerLeases (Tipo, Recurso)
+                SELECT :t, r.Recurso FROM ({RECURSOS_SQL}) r
+                WHERE NOT EXISTS (SELECT 1 FROM dbo.WorkerLeases l WITH (UPDLOCK, HOLDLOCK)
+                                  WHERE l.Tipo = :t AND l.Recurso = r.Recurso)
+            """), {"t": self.tipo})
+            # cuentas borradas o sin credenciales: fuera del reparto (y de quien las tuviera)
+            gone = conn.execute(text(f"""
+                DELETE l FROM dbo.WorkerLeases l
+                OUTPUT deleted.Recurso
+                WHERE l.Tipo = :t AND l.Recurso NOT IN (SELECT r.Recurso FROM ({RECURSOS_SQL}) r)
+            """), {"t": self.tipo}).mappings().all()
+            stats = conn.execute(text("""
+                SELECT (SELECT COUNT(1) FROM dbo.WorkerLeases WHERE Tipo = :t) AS Recursos,
+                       (SELECT COUNT(1) FROM dbo.WorkerNodes
+                        WHERE Tipo = :t AND HeartbeatUtc > DATEADD(second, -:ttl, SYSUTCDATETIME())) AS Nodos
+            """), {"t": self.tipo, "ttl": self.ttl}).mappings().first()
+        if gone:
+            with self._lock:
+                self._owned -= {r["Recurso"] for r in gone}
+            logger.info("lease.retire node=%s recursos=%s", self.node_id, sorted(r["Recurso"] for r in gone))
+        total, nodes = stats["Recursos"] or 0, max(1, stats["Nodos"] or 1)
+        target = math.ceil(total / nodes)
+        with self._lock:
+            have = len(self._owned)
+
+        if have > target:
+            # entró otro nodo: soltar el exceso para que lo recoja
+            rows = fetch_all("""
+                UPDATE TOP (:n) dbo.WorkerLeases
+                SET Owner = NULL, ExpiraUtc = '19000101'
+                OUTPUT deleted.Recurso
+                WHERE Tipo = :t AND Owner = :node
+            """, n=have - target, t=self.tipo, node=self.node_id)
+            with self._lock:
+                self._owned -= {r["Recurso"] for r in rows}
+            logger.info("lease.release node=%s n=%s", self.node_id, len(rows))
+        elif have < target:
+            # libres o caducados (nodo muerto); READPAST: dos nodos no se pisan
+            rows = fetch_all("""
+                UPDATE TOP (:n) l
+                SET Owner = :node, ExpiraUtc = DATEADD(second, :ttl, SYSUTCDATETIME()),
+                    AdquiridoUtc = SYSUTCDATETIME()
+                OUTPUT inserted.Recurso
+                FROM dbo.WorkerLeases l WITH (ROWLOCK, UPDLOCK, READPAST)
+                WHERE l.Tipo = :t AND (l.Owner IS NULL OR l.ExpiraUtc <= SYSUTCDATETIME())
+            """, n=target - have, node=self.node_id, ttl=self.ttl, t=self.tipo)
+            if rows:
+                with self._lock:
+                    self._owned |= {r["Recurso"] for r in rows}
+                logger.info("lease.acquire node=%s recursos=%s", self.node_id, [r["Recurso"] for r in rows])
+        logger.info("lease.rebalance node=%s nodes=%s total=%s target=%s owned=%s",
+                    self.node_id, nodes, total, target, len(self._owned))
+        return self.owned()
+
+    def owned(self) -> Set[int]:
+        with self._lock:
+            return set(self._owned)
+
+    def holds(self, recurso: int) -> bool:
+        with self._lock:
+            return recurso in self._owned
+
+    # --- ciclo de vida ---
+    def start(self):
+        """Latido en segundo plano: un scrape largo no deja caducar los leases."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self.register()
+        self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(LEASE_HEARTBEAT_SEC):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.warning("lease.heartbeat.fail node=%s: %s", self.node_id, e)
+
+    def stop(self):
+        """Suelta todos los leases y da de baja el nodo (salida ordenada)."""
+        self._stop.set()
+        try:
+            execute("""
+                UPDATE dbo.WorkerLeases SET Owner = NULL, ExpiraUtc = '19000101'
+                WHERE Tipo = :t AND Owner = :n;
+                DELETE FROM dbo.WorkerNodes WHERE Tipo = :t AND NodeId = :n;
+            """, t=self.tipo, n=self.node_id)
+        except Exception as e:
+            logger.warning("lease.stop.fail node=%s: %s", self.node_id, e)
+        with self._lock:
+            self._owned = set()
+
@@ -1,5 +1,5 @@
 # app/logging.py
-import logging, json, os
+import logging, json, os, queue, threading
 from datetime import datetime, timezone
 from flask import request
 
@@ -8,81 +8,7 @@ from flask import request
 # from flask import has_request_context, request, session
 
 class RequestContextFilter(logging.Filter):
-    """Inyecta user_id y path si hay request activo."""
-    def filter(self, record):
-        try:
-            from flask import has_request_context, request, session
-            if has_request_context():
-                record.user_id = session.get("uid")
-                record.path = getattr(request, "path", None)
-            else:
-                # fuera de Flask (workers, scripts)
-                if not hasattr(record, "user_id"):
-                    record.user_id = None
-                if not hasattr(record, "path"):
-                    record.path = None
-        except Exception:
-            if not hasattr(record, "user_id"):
-                record.user_id = None
-            if not hasattr(record, "path"):
-                record.path = None
-        return True
-
-class DBHandler(logging.Handler):
-    """Intenta escribir en dbo.LogsApp; si falla, usa archivo local."""
-    def emit(self, record):
-        try:
-            msg = record.getMessage()
-            level = record.levelname
-            module = record.name
-            user_id = getattr(record, "user_id", None)
-            path = getattr(record, "path", None)
-
-            extra_json = None
-            # Si se pasó un dict por 'extra={"data": ...}' lo serializamos
-            if hasattr(record, "extra_dict"):
-                try:
-                    extra_json = json.dumps(record.extra_dict, ensure_ascii=False)
-                except Exception:
-                    extra_json = None
-
-            from .db import execute
-            execute("""
-                INSERT INTO dbo.LogsApp(Level, Module, Message, UserId, RequestPath, ExtraJson)
-                VALUES (:lvl, :mod, :msg, :uid, :path, :extra)
-            """, lvl=level, mod=module, msg=msg, uid=user_id, path=path, extra=extra_json)
-
-        except Exception:
-            try:
-                # Fallback local
-                fallback = "/opt/reservas4/logs/app.log"
-                os.makedirs(os.path.dirname(fallback), exist_ok=True)
-                with open(fallback, "a", encoding="utf-8") as f:
-                    ts = datetime.now(timezone.utc).isoformat()
-                    f.write(f"[{ts}] {record.levelname} {record.name} uid={getattr(record,'user_id',None)} path={getattr(record,'path',None)}: {record.getMessage()}\n")
-            except Exception:
-                # último recurso: ignorar
-                pass
-
-def setup_logging(app):
-    """Adjunta handler de BD con filtro de contexto a app.logger"""
-    handler = DBHandler()
-    handler.setLevel(logging.INFO)
-    handler.addFilter(RequestContextFilter())
-    fmt = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
-    handler.setFormatter(fmt)
-
-    app.logger.addHandler(handler)
-    app.logger.setLevel(logging.INFO)
-
-    # Log de acceso mínimo
-    @app.after_request
-    def _after(resp):
-        # Evita llenar la tabla con /healthz
-        if getattr(resp, "status_code", 200) >= 400:
-            app.logger.warning("HTTP %s en %s", resp.status_code, getattr(resp, "direct_passthrough", False), extra={"extra_dict":{"status": resp.status_code}})
-        return resp
-class RequestContextFilter(logging.Filter):
+    """Inyecta user_id y path si hay request activo (None fuera de Flask: workers, scripts)."""
     def filter(self, record):
         try:
             from flask import has_request_context, session
@@ -97,39 +23,129 @@ class RequestContextFilter(logging.Filter):
             record.path = None
         return True
 
+# Cola/lotes del handler de BD
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_SEC = float(os.getenv("LOG_FLUSH_SEC", "2"))
+LOG_OVERFLOW_POLICY = os.getenv("LOG_OVERFLOW_POLICY", "spill")   # spill (a fichero) | drop
+FALLBACK_LOG = "/opt/reservas4/logs/app.log"
+
+def _write_fallback(rows):
+    """Escribe filas de log en el fichero local (fallo de BD o cola llena)."""
+    try:
+        os.makedirs(os.path.dirname(FALLBACK_LOG), exist_ok=True)
+        with open(FALLBACK_LOG, "a", encoding="utf-8") as f:
+            for r in rows:
+                f.write(f"[{r['ts']}] {r['lvl']} {r['mod']} uid={r['uid']} path={r['path']}: {r['msg']}\n")
+    except Exception:
+        pass
+
 class DBHandler(logging.Handler):
+    """
+    Encola los registros y un hilo de fondo los inserta en dbo.LogsApp por lotes
+    (LOG_BATCH_SIZE filas o cada LOG_FLUSH_SEC). emit() nunca toca la BD.
+    Cola acotada: si se llena, LOG_OVERFLOW_POLICY=spill escribe en el fichero
+    local y drop descarta (contando los descartes). close() vacía la cola.
+    """
+    def __init__(self, level=logging.NOTSET):
+        super().__init__(level)
+        self._q = queue.Queue(maxsize=LOG_QUEUE_MAX)
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._dropped = 0
+        self._start_lock = threading.Lock()
+
+    def _ensure_thread(self):
+        # arranque perezoso y tras fork (gunicorn --preload): el hilo no sobrevive al fork
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="dblog-flusher", daemon=True)
+                self._thread.start()
+
     def emit(self, record):
         try:
-            msg = record.getMessage()
-            level = record.levelname
-            module = record.name
-            user_id = getattr(record, "user_id", None)
-            path = getattr(record, "path", None)
-
             extra_json = None
             if hasattr(record, "extra_dict"):
                 try:
                     extra_json = json.dumps(record.extra_dict, ensure_ascii=False)
                 except Exception:
                     pass
+            row = {
+                "lvl": record.levelname, "mod": record.name, "msg": record.getMessage(),
+                "uid": getattr(record, "user_id", None), "path": getattr(record, "path", None),
+                "extra": extra_json,
+                "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).replace(tzinfo=None),
+            }
+        except Exception:
+            self.handleError(record)
+            return
+        self._ensure_thread()
+        try:
+            self._q.put_nowait(row)
+        except queue.Full:
+            if LOG_OVERFLOW_POLICY == "spill":
+                _write_fallback([row])
+            else:
+                self._dropped += 1
 
-            from .db import execute
-            execute("""
+    def _write(self, rows):
+        try:
+            from .db import execute_many
+            execute_many("""
                 INSERT INTO dbo.LogsApp(Level, Module, Message, UserId, RequestPath, ExtraJson)
                 VALUES (:lvl, :mod, :msg, :uid, :path, :extra)
-            """, lvl=level, mod=module, msg=msg, uid=user_id, path=path, extra=extra_json)
-
+            """, [{k: v for k, v in r.items() if k != "ts"} for r in rows])
         except Exception:
+            _write_fallback(rows)
+
+    def _drain(self, first=None):
+        batch = [first] if first is not None else []
+        while len(batch) < LOG_BATCH_SIZE:
+            try:
+                batch.append(self._q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stop.is_set():
             try:
-                fallback = "/opt/reservas4/logs/app.log"
-                os.makedirs(os.path.dirname(fallback), exist_ok=True)
-                with open(fallback, "a", encoding="utf-8") as f:
-                    ts = datetime.now(timezone.utc).isoformat()
-                    f.write(f"[{ts}] {record.levelname} {record.name} uid={getattr(record,'user_id',None)} path={getattr(record,'path',None)}: {record.getMessage()}\n")
-            except Exception:
-                pass
+                first = self._q.get(timeout=LOG_FLUSH_SEC)
+            except queue.Empty:
+                first = None
+            if first is not None and self._q.qsize() + 1 < LOG_BATCH_SIZE:
+                # espera corta para juntar más filas en el mismo INSERT
+                self._stop.wait(min(0.5, LOG_FLUSH_SEC))
+            batch = self._drain(first)
+            if self._dropped:
+                n, self._dropped = self._dropped, 0
+                _write_fallback([{"ts": datetime.now(timezone.utc).isoformat(), "lvl": "WARNING",
+                                  "mod": "logging", "uid": None, "path": None,
+                                  "msg": f"DBHandler: {n} registros descartados (cola llena)"}])
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """Escribe de forma síncrona lo que quede en la cola."""
+        while True:
+            batch = self._drain()
+            if not batch:
+                break
+            self._write(batch)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=LOG_FLUSH_SEC + 5)
+        self.flush()
+        super().close()
 
 def setup_logging(app):
+    """Adjunta handler de BD con filtro de contexto a app.logger y un log mínimo de errores HTTP."""
     handler = DBHandler()
     handler.setLevel(logging.INFO)
     handler.addFilter(RequestContextFilter())
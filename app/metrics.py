@@ -0,0 +1,207 @@
+# app/metrics.py
+import os
+import re
+import time
+import hmac
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from prometheus_client import (Counter, Histogram, CollectorRegistry, REGISTRY,
+                               generate_latest, CONTENT_TYPE_LATEST, start_http_server)
+from prometheus_client import multiprocess
+
+logger = logging.getLogger("metrics")
+
+# ------------------- CONFIG -------------------
+# Con gunicorn (varios workers) PROMETHEUS_MULTIPROC_DIR debe apuntar a un directorio
+# vacío al arrancar: cada proceso escribe sus valores ahí y /metrics los agrega
+# (ver gunicorn.conf.py). La lee prometheus_client al importarse.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR") or os.getenv("prometheus_multiproc_dir")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")                      # si se define: Authorization: Bearer <token>
+
+PHASE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# ------------------- MÉTRICAS -------------------
+SCRAPE_PHASE = Histogram(
+    "reservas4_scrape_phase_seconds", "Duración de cada fase de un scrape",
+    ["scraper", "phase"], buckets=PHASE_BUCKETS)
+SCRAPE_SECONDS = Histogram(
+    "reservas4_scrape_seconds", "Duración total de un scrape por resultado",
+    ["scraper", "outcome"], buckets=PHASE_BUCKETS)
+SCRAPE_TOTAL = Counter(
+    "reservas4_scrape_total", "Scrapes terminados por resultado y origen del hint",
+    ["scraper", "outcome", "hint_source"])
+DB_QUERY = Histogram(
+    "reservas4_db_query_seconds", "Duración de consultas en app.db",
+    ["op", "stmt"], buckets=DB_BUCKETS)
+DB_ERRORS = Counter(
+    "reservas4_db_errors_total", "Consultas de app.db que lanzaron excepción",
+    ["op", "stmt"])
+HTTP_REQUEST = Histogram(
+    "reservas4_http_request_seconds", "Latencia de peticiones Flask por endpoint",
+    ["endpoint", "method", "status"], buckets=HTTP_BUCKETS)
+WATCH_TICK = Histogram(
+    "reservas4_watch_tick_seconds", "Duración de un tick de vigilancia",
+    ["found"], buckets=PHASE_BUCKETS)
+WATCH_FIRST_FREE = Histogram(
+    "reservas4_watch_first_free_seconds", "Tiempo hasta la primera toma libre en un tick",
+    buckets=PHASE_BUCKETS)
+WATCH_ITEMS = Counter(
+    "reservas4_watch_items_total", "Items de vigilancia por resultado",
+    ["result"])
+
+# scrape en curso en este hilo/contexto: las fases anidadas (pool, cookies, BD) heredan la etiqueta
+_scraper: ContextVar[str] = ContextVar("metrics_scraper", default="-")
+
+
+def hint_source(hint: Optional[str]) -> str:
+    """'indicator:s-light-green' -> 'indicator'; etiqueta de cardinalidad baja."""
+    if not hint:
+        return "none"
+    return hint.split(":", 1)[0][:32]
+
+
+@contextmanager
+def phase(name: str, scraper: Optional[str] = None):
+    """with phase("navigate"): ...  -> reservas4_scrape_phase_seconds{scraper, phase}."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        SCRAPE_PHASE.labels(scraper or _scraper.get(), name).observe(time.perf_counter() - t0)
+
+
+@contextmanager
+def scrape(name: str):
+    """
+    Marca un scrape: las fases de dentro llevan scraper=name y al salir se cuenta
+    el resultado. El bloque rellena rec["outcome"] (p.ej. el estado) y rec["hint"];
+    una excepción cuenta como outcome="Error".
+    """
+    tok = _scraper.set(name)
+    rec: Dict[str, Optional[str]] = {"outcome": None, "hint": None}
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    except Exception:
+        rec["outcome"] = "Error"
+        raise
+    finally:
+        _scraper.reset(tok)
+        outcome = rec["outcome"] or "ok"
+        SCRAPE_SECONDS.labels(name, outcome).observe(time.perf_counter() - t0)
+        SCRAPE_TOTAL.labels(name, outcome, hint_source(rec["hint"])).inc()
+
+
+# ------------------- BD -------------------
+RX_STMT = re.compile(r"\b(SELECT|INSERT|UPDATE|DELETE|MERGE|EXEC)\b.*?(dbo\.\w+)", re.I | re.S)
+_stmt_cache: Dict[str, str] = {}
+_STMT_CACHE_MAX = 2048
+
+
+def stmt_label(sql: str) -> str:
+    """Etiqueta corta de una sentencia: verbo + primera tabla dbo.* ("MERGE dbo.PuntoInfo")."""
+    lbl = _stmt_cache.get(sql)
+    if lbl is None:
+        m = RX_STMT.search(sql)
+        lbl = f"{m.group(1).upper()} {m.group(2)}" if m else "other"
+        if len(_stmt_cache) < _STMT_CACHE_MAX:
+            _stmt_cache[sql] = lbl
+    return lbl
+
+
+@contextmanager
+def db_timer(op: str, sql: Optional[str] = None):
+    stmt = stmt_label(sql) if sql else "-"
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DB_ERRORS.labels(op, stmt).inc()
+        raise
+    finally:
+        DB_QUERY.labels(op, stmt).observe(time.perf_counter() - t0)
+
+
+# ------------------- WATCH -------------------
+def observe_watch_tick(m: Dict) -> None:
+    """Métricas del dict 'metrics' de watch.run_watch_tick."""
+    if m.get("skipped"):
+        WATCH_ITEMS.labels("skipped").inc()
+        return
+    WATCH_TICK.labels("1" if m.get("found") else "0").observe((m.get("tick_ms") or 0) / 1000.0)
+    if m.get("first_free_ms") is not None:
+        WATCH_FIRST_FREE.observe(m["first_free_ms"] / 1000.0)
+    ok = (m.get("evaluated") or 0) - (m.get("errors") or 0)
+    for result, n in (("ok", ok), ("error", m.get("errors")), ("cancelled", m.get("cancelled")),
+                      ("abandoned", m.get("abandoned"))):
+        if n:
+            WATCH_ITEMS.labels(result).inc(n)
+
+
+# ------------------- EXPOSICIÓN -------------------
+def registry():
+    """Registro a exponer: agregado de todos los procesos en modo multiproceso."""
+    if MULTIPROC_DIR:
+        r = CollectorRegistry()
+        multiprocess.MultiProcessCollector(r)
+        return r
+    return REGISTRY
+
+
+def init_app(app):
+    """Latencia por endpoint y ruta /metrics en la app Flask."""
+    from flask import request, g, Response, abort
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_t0 = time.perf_counter()
+
+    @app.after_request
+    def _metrics_observe(resp):
+        t0 = getattr(g, "_metrics_t0", None)
+        if t0 is not None and request.endpoint != "metrics":
+            HTTP_REQUEST.labels(request.endpoint or "404", request.method,
+                                str(resp.status_code)).observe(time.perf_counter() - t0)
+        return resp
+
+    @app.get("/metrics", endpoint="metrics")
+    def metrics_view():
+        if METRICS_TOKEN:
+            auth = request.headers.get("Authorization", "")
+            if not hmac.compare_digest(auth, f"Bearer {METRICS_TOKEN}"):
+                abort(403)
+        return Response(generate_latest(registry()), mimetype=CONTENT_TYPE_LATEST)
+
+
+_served = False
+_served_lock = threading.Lock()
+
+
+def serve_worker_metrics(port: Optional[int] = None, addr: Optional[str] = None) -> bool:
+    """
+    Servidor /metrics propio para procesos worker (sin Flask), en WORKER_METRICS_PORT
+    (0 = no se expone). Se lee al llamar: los workers cargan el .env después de importar app.*.
+    Idempotente.
+    """
+    global _served
+    port = int(os.getenv("WORKER_METRICS_PORT", "0")) if port is None else port
+    addr = addr or os.getenv("WORKER_METRICS_ADDR", "127.0.0.1")
+    if not port:
+        return False
+    with _served_lock:
+        if _served:
+            return True
+        try:
+            start_http_server(port, addr=addr, registry=registry())
+        except OSError as e:
+            logger.warning("metrics.serve.fail port=%s err=%s", port, e)
+            return False
+        _served = True
+    logger.info("metrics.serve addr=%s port=%s multiproc=%s", addr, port, bool(MULTIPROC_DIR))
+    return True
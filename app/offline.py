@@ -0,0 +1,132 @@
+# app/offline.py
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+import lxml.html
+from lxml.cssselect import CSSSelector
+
+from .estado import PLUG_KEY_ATTRS, cards_from_raw
+from .utils.status import STATUS_CLASS_MAP, STATUS_TEXT_MAP
+
+# Mismas extracciones que los scripts JS de estado.py / utils/manifest.py, pero sobre
+# HTML guardado (app/snapshots.py) con lxml: sin navegador, miles de páginas por minuto.
+# Diferencia conocida: offline no hay layout, así que no se filtra por visibilidad y el
+# texto es text_content() (sin scripts/estilos) en vez de innerText.
+
+RX_WS = re.compile(r"\s+")
+_css_cache: Dict[str, Optional[CSSSelector]] = {}
+
+
+def load_doc(html: str):
+    doc = lxml.html.fromstring(html or "<html></html>")
+    for el in doc.xpath("//script|//style|//noscript|//template"):
+        el.drop_tree()
+    return doc
+
+
+def _css(doc, sel: Optional[str]) -> list:
+    if not sel:
+        return []
+    c = _css_cache.get(sel, False)
+    if c is False:
+        try:
+            c = CSSSelector(sel)
+        except Exception:
+            c = None
+        _css_cache[sel] = c
+    return c(doc) if c is not None else []
+
+
+def _xpath(doc, xp: Optional[str]) -> list:
+    if not xp:
+        return []
+    try:
+        return [e for e in doc.xpath(xp) if hasattr(e, "tag")]
+    except Exception:
+        return []
+
+
+def _text(el) -> str:
+    return RX_WS.sub(" ", el.text_content() or "").strip()
+
+
+def _first_text(els) -> str:
+    for el in els:
+        t = _text(el)
+        if t:
+            return t
+    return ""
+
+
+def _lines(doc) -> List[str]:
+    return [t.strip() for t in doc.xpath("//body//text()") if t and t.strip()]
+
+
+# ------------------- ESTADO -------------------
+def status_from_doc(doc) -> Tuple[str, str]:
+    """Cascada de estado.JS_EXTRACT_STATUS: indicador -> clase en cualquier nodo -> texto."""
+    inds = _css(doc, "div.status lib-status-indicator") or _css(doc, "lib-status-indicator")
+    for el in inds:
+        for c in (el.get("class") or "").split():
+            if c in STATUS_CLASS_MAP:
+                return STATUS_CLASS_MAP[c], f"indicator:{c}"
+    classes = [v for v in doc.xpath("//@class")]
+    for key, label in STATUS_CLASS_MAP.items():
+        if any(key in v for v in classes):
+            return label, f"class:{key}"
+    body = doc.find("body")
+    txt = (_text(body) if body is not None else _text(doc)).lower()
+    for key, label in STATUS_TEXT_MAP.items():
+        if key in txt:
+            return label, f"text:{key}"
+    return "Desconocido", "none"
+
+
+def plug_cards_from_doc(doc) -> List[Dict[str, Any]]:
+    """Equivalente offline de estado.extract_plug_statuses."""
+    raw = []
+    for card in _css(doc, "lib-plug-card"):
+        keys = [(card.get(a) or "").strip() for a in PLUG_KEY_ATTRS]
+        keys = [k for k in keys if k]
+        for a in card.xpath(".//a[@href]"):
+            href = (a.get("href") or "").strip().rstrip("/")
+            if href:
+                keys.append(href.rsplit("/", 1)[-1])
+        cls = [ind.get("class") or "" for ind in _css(card, "lib-status-indicator")]
+        raw.append({"keys": keys, "cls": cls, "text": _text(card)})
+    return cards_from_raw(raw)
+
+
+# ------------------- MANIFIESTOS -------------------
+def manifest_from_doc(doc, manif: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Mismo resultado que utils.manifest.eval_manifest, campo a campo."""
+    out: Dict[str, Any] = {}
+    lines: Optional[List[str]] = None
+    for name, f in manif.items():
+        kind = f.get("kind") or "text"
+        if kind == "count":
+            n = len(_xpath(doc, f.get("xpath"))) or len(_css(doc, f.get("css"))) or len(_css(doc, f.get("fallback_css")))
+            out[name] = n
+        elif kind == "href":
+            nodes = _xpath(doc, f.get("xpath")) or _css(doc, f.get("css"))
+            node, href = (nodes[0] if nodes else None), None
+            for _ in range((f.get("up") or 0) + 1):
+                if node is None:
+                    break
+                if isinstance(node.tag, str) and node.tag.lower() == "a":
+                    href = node.get("href")
+                    break
+                node = node.getparent()
+            if not href and f.get("fallback_css"):
+                anchors = _css(doc, f["fallback_css"])
+                href = anchors[0].get("href") if anchors else None
+            out[name] = href or ""
+        else:
+            if kind == "text":
+                out[name] = _first_text(_xpath(doc, f.get("xpath"))) or _first_text(_css(doc, f.get("css")))
+            if f.get("scan"):
+                if lines is None:
+                    lines = _lines(doc)
+                hits = [l for l in lines if f["scan"] in l]
+                out[name if kind == "scan" else name + "__scan"] = hits
+    return out
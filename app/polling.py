@@ -0,0 +1,109 @@
+# app/polling.py
+import os
+import json
+import random
+import logging
+from typing import Dict, Any, List, Optional, Iterable
+
+from .db import fetch_all, execute_many
+from .utils.cadence import compute_interval, POLL_MIN_SEC, POLL_WATCHED_MAX_SEC, POLL_WINDOW_H
+
+logger = logging.getLogger("polling")
+
+# ------------------- CONFIG -------------------
+# cadencia (POLL_MIN_SEC, POLL_MAX_SEC, POLL_WATCHED_MAX_SEC, POLL_WINDOW_H...): app/utils/cadence.py
+POLL_JITTER_PCT = float(os.getenv("POLL_JITTER_PCT", "0.1"))
+
+# Vigilado = algún set activo del usuario tiene un item cuyo ExternalIdPTP es el último
+# segmento de UrlPunto (como watch._slug). Igualdad con RIGHT(), no LIKE: '_' y '%'
+# de un slug no actúan de comodín.
+_WATCHED_SQL = """
+    CASE WHEN EXISTS (
+        SELECT 1 FROM dbo.ConjuntoItems i
+        CROSS APPLY (SELECT LTRIM(RTRIM(i.ExternalIdPTP)) AS Slug) x
+        JOIN dbo.ConjuntosVigilancia s ON s.SetId = i.SetId
+        WHERE s.Activo = 1 AND s.UserId = p.UserId AND x.Slug <> N''
+          AND (RIGHT(p.UrlPunto, LEN(x.Slug) + 1) = N'/' + x.Slug
+               OR RIGHT(p.UrlPunto, LEN(x.Slug) + 2) = N'/' + x.Slug + N'/')
+    ) THEN 1 ELSE 0 END
+"""
+
+
+def due_conectores(limit: int = 500, account_ids: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+    """
+    Conectores activos a consultar ya: sin fila en ConectorPolling, con NextPollUtc
+    vencido, o vigilados y sin leer en POLL_WATCHED_MAX_SEC (un set recién activado
+    no espera al intervalo largo aprendido). Incluye la cuenta PTP del usuario.
+    account_ids limita a las cuentas de este nodo (leases); None = todas.
+    """
+    accts = None if account_ids is None else json.dumps(sorted(account_ids))
+    return fetch_all(f"""
+      SELECT TOP (:lim) c.ConectorId, c.UrlConector, c.Orden, p.PuntoId, p.UrlPunto, p.UserId, a.AccountId
+      FROM dbo.Conectores c
+      JOIN dbo.Puntos p ON p.PuntoId = c.PuntoId
+      CROSS APPLY (
+          SELECT TOP 1 x.AccountId FROM dbo.CuentasPTP x
+          JOIN dbo.CredencialesPTP k ON k.AccountId = x.AccountId
+          WHERE x.UserId = p.UserId ORDER BY x.AccountId
+      ) a
+      LEFT JOIN dbo.ConectorPolling cp ON cp.ConectorId = c.ConectorId
+      WHERE c.Activo = 1
+        AND (:accts IS NULL OR a.AccountId IN (SELECT CAST(value AS INT) FROM OPENJSON(:accts)))
+        AND (cp.ConectorId IS NULL
+             OR cp.NextPollUtc <= SYSUTCDATETIME()
+             OR (cp.LastPollUtc < DATEADD(second, -:wmax, SYSUTCDATETIME()) AND {_WATCHED_SQL} = 1))
+      ORDER BY ISNULL(cp.NextPollUtc, '19000101'), p.PuntoId, c.Orden, c.ConectorId
+    """, lim=limit, wmax=POLL_WATCHED_MAX_SEC, accts=accts)
+
+
+def reschedule(results: Iterable[Dict[str, Any]]):
+    """
+    Tras un refresco ({"conector_id","estado",...}): recalcula la cadencia de cada
+    conector con una consulta de estadísticas y la persiste con un único executemany.
+    """
+    by_id = {r["conector_id"]: r for r in results if r.get("conector_id") is not None}
+    if not by_id:
+        return
+    stats = fetch_all(f"""
+      SELECT c.ConectorId, a.Estado, cp.IntervalSec,
+             (SELECT COUNT(1) FROM (
+                 SELECT h.Estado, LAG(h.Estado) OVER (ORDER BY h.CapturedAtUtc) AS Prev
+                 FROM dbo.EstadosConector h
+                 WHERE h.ConectorId = c.ConectorId
+                   AND h.CapturedAtUtc >= DATEADD(hour, -:win, SYSUTCDATETIME())
+             ) t WHERE t.Prev IS NOT NULL AND t.Prev <> t.Estado) AS Transiciones,
+             {_WATCHED_SQL} AS Vigilado
+      FROM OPENJSON(:ids) j
+      JOIN dbo.Conectores c ON c.ConectorId = CAST(j.value AS INT)
+      JOIN dbo.Puntos p ON p.PuntoId = c.PuntoId
+      LEFT JOIN dbo.ConectorEstadoActual a ON a.ConectorId = c.ConectorId
+      LEFT JOIN dbo.ConectorPolling cp ON cp.ConectorId = c.ConectorId
+    """, ids=json.dumps(list(by_id)), win=POLL_WINDOW_H)
+
+    rows = []
+    for s in stats:
+        cid = s["ConectorId"]
+        estado = by_id[cid].get("estado")
+        if estado == "Error":
+            # fallo de scrape: reintento pronto sin tocar la cadencia aprendida
+            iv, learned = POLL_MIN_SEC, s["IntervalSec"] or POLL_MIN_SEC
+        else:
+            iv = learned = compute_interval(s["Transiciones"] or 0, s["Estado"] or estado,
+                                            bool(s["Vigilado"]), s["IntervalSec"])
+        delay = max(1, int(iv * (1 + random.uniform(-POLL_JITTER_PCT, POLL_JITTER_PCT))))
+        rows.append({"cid": cid, "iv": learned, "delay": delay,
+                     "tr": s["Transiciones"] or 0, "vig": 1 if s["Vigilado"] else 0})
+
+    execute_many("""
+      MERGE dbo.ConectorPolling AS t
+      USING (SELECT :cid AS ConectorId) AS s ON t.ConectorId = s.ConectorId
+      WHEN MATCHED THEN UPDATE SET
+          IntervalSec = :iv, LastPollUtc = SYSUTCDATETIME(),
+          NextPollUtc = DATEADD(second, :delay, SYSUTCDATETIME()),
+          Transiciones = :tr, Vigilado = :vig, ActualizadoUtc = SYSUTCDATETIME()
+      WHEN NOT MATCHED THEN
+          INSERT (ConectorId, IntervalSec, NextPollUtc, LastPollUtc, Transiciones, Vigilado)
+          VALUES (:cid, :iv, DATEADD(second, :delay, SYSUTCDATETIME()), SYSUTCDATETIME(), :tr, :vig);
+    """, rows)
+    logger.info("polling.reschedule n=%s min_iv=%s max_iv=%s", len(rows),
+                min(r["iv"] for r in rows) if rows else None, max(r["iv"] for r in rows) if rows else None)
@@ -3,6 +3,7 @@ import os
 import json
 import time
 import logging
+import uuid
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import List, Dict, Any
@@ -12,8 +13,14 @@ from flask import (
     url_for, session, flash, current_app, abort
 )
 
-from .db import fetch_one, fetch_all, execute
+from sqlalchemy import text
+
+from .db import fetch_one, fetch_all, execute, transaction, commit
 from .utils.crypto import encrypt_str, decrypt_str
+from .utils.ptp_cookies import invalidate_cookies
+from .http_login import http_login_and_collect_cookies, HttpLoginError, HttpLoginAuthError
+from .utils.waits import maybe_any, wait_dom_quiet
+from . import metrics
 
 # --- Selenium ---
 from selenium import webdriver
@@ -35,9 +42,14 @@ bp = Blueprint("ptp", __name__)  # rutas declaradas aquí; en create_app se regi
 HEADLESS = os.getenv("SELENIUM_HEADLESS", "1") == "1"
 PAGELOAD_TIMEOUT = int(os.getenv("SELENIUM_PAGELOAD_TIMEOUT", "60"))
 EXPLICIT_WAIT = int(os.getenv("SELENIUM_WAIT_TIMEOUT", "30"))
-IMPLICIT_WAIT = int(os.getenv("SELENIUM_IMPLICIT_WAIT", "5"))
+# 0: toda espera es explícita (app/utils/waits.py); con >0 cada find_elements sin resultado bloquea
+IMPLICIT_WAIT = int(os.getenv("SELENIUM_IMPLICIT_WAIT", "0"))
+BANNER_WAIT_SEC = float(os.getenv("PTP_BANNER_WAIT_SEC", "2"))
 
-PTP_LOGIN_URL = "https://account.placetoplug.com/es/entrar?from=placetoplug.com%2Fes"
+PTP_LOGIN_URL = os.getenv("PTP_LOGIN_URL", "https://account.placetoplug.com/es/entrar?from=placetoplug.com%2Fes")
+# http: login sin navegador (app/http_login.py) con Selenium de respaldo; selenium: solo navegador
+PTP_LOGIN_BACKEND = os.getenv("PTP_LOGIN_BACKEND", "selenium")
+PTP_LOGIN_FALLBACK = os.getenv("PTP_LOGIN_FALLBACK", "1") == "1"
 
 # XPaths
 X_EMAIL = "//input[@placeholder='Email']"
@@ -70,9 +82,58 @@ def _mask_email(e: str) -> str:
 
 
 # ------------------- UTILIDADES SELENIUM -------------------
-def create_driver(headless: bool = HEADLESS) -> webdriver.Chrome:
-    """Crea un driver de Chrome con/ sin interfaz usando selenium-manager."""
-    logger.info("selenium.init headless=%s", headless)
+# Recursos que no hacen falta para leer estados/metadatos (CDP Network.setBlockedURLs)
+SCRAPE_BLOCK_URLS = [
+    # imágenes, fuentes y media
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.ico", "*.svg",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*.mp4", "*.webm", "*.mp3",
+    # teselas de mapa
+    "*tile.openstreetmap.org*", "*maps.googleapis.com*", "*maps.gstatic.com*",
+    "*api.mapbox.com*", "*tiles.mapbox.com*",
+    # analítica y terceros
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*",
+    "*facebook.net*", "*connect.facebook.com*", "*hotjar.com*", "*clarity.ms*",
+    "*sentry.io*", "*intercom.io*", "*onesignal.com*",
+] + [u.strip() for u in os.getenv("SCRAPE_BLOCK_URLS_EXTRA", "").split(",") if u.strip()]
+
+# Perfiles de driver con nombre:
+#  - login: navegador completo (lo que ve un usuario), para el flujo de login
+#  - scrape: carga "eager", sin imágenes/fuentes/mapas/analítica ni tráfico de fondo
+DRIVER_PROFILES: Dict[str, Dict[str, Any]] = {
+    "login": {
+        "page_load_strategy": "normal",
+        "args": [],
+        "prefs": {},
+        "block_urls": [],
+    },
+    "scrape": {
+        "page_load_strategy": os.getenv("SCRAPE_PAGE_LOAD_STRATEGY", "eager"),
+        "args": [
+            "--disable-extensions",
+            "--disable-background-networking",
+            "--disable-component-update",
+            "--disable-default-apps",
+            "--disable-sync",
+            "--disable-features=Translate,OptimizationHints,MediaRouter",
+            "--no-first-run",
+            "--mute-audio",
+            "--blink-settings=imagesEnabled=false",
+        ],
+        "prefs": {
+            "profile.managed_default_content_settings.images": 2,
+            "profile.default_content_setting_values.notifications": 2,
+            "profile.default_content_setting_values.geolocation": 2,
+        },
+        "block_urls": SCRAPE_BLOCK_URLS if os.getenv("SCRAPE_BLOCK_RESOURCES", "1") == "1" else [],
+    },
+}
+
+
+def create_driver(headless: bool = HEADLESS, user_data_dir: str | None = None,
+                  profile: str = "login") -> webdriver.Chrome:
+    """Crea un driver de Chrome con/ sin interfaz usando selenium-manager, según un perfil de DRIVER_PROFILES."""
+    prof = DRIVER_PROFILES[profile]
+    logger.info("selenium.init headless=%s user_data_dir=%s profile=%s", headless, user_data_dir, profile)
     chrome_options = ChromeOptions()
     if headless:
         chrome_options.add_argument("--headless=new")  # headless moderno
@@ -82,11 +143,28 @@ def create_driver(headless: bool = HEADLESS) -> webdriver.Chrome:
     chrome_options.add_argument("--disable-dev-shm-usage")
     # Ventana razonable para evitar layouts móviles / overlays
     chrome_options.add_argument("--window-size=1200,900")
+    # Perfil propio: necesario para varios Chrome concurrentes (pool) y para identificarlos
+    if user_data_dir:
+        chrome_options.add_argument(f"--user-data-dir={user_data_dir}")
+    for arg in prof["args"]:
+        chrome_options.add_argument(arg)
+    if prof["prefs"]:
+        chrome_options.add_experimental_option("prefs", prof["prefs"])
+    chrome_options.page_load_strategy = prof["page_load_strategy"]
 
     driver = webdriver.Chrome(service=ChromeService(), options=chrome_options)
     driver.set_page_load_timeout(PAGELOAD_TIMEOUT)
     driver.implicitly_wait(IMPLICIT_WAIT)
-    logger.info("selenium.ready pageload_timeout=%s implicit_wait=%s", PAGELOAD_TIMEOUT, IMPLICIT_WAIT)
+    if prof["block_urls"]:
+        try:
+            # vale para todas las navegaciones de esta pestaña
+            driver.execute_cdp_cmd("Network.enable", {})
+            driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": prof["block_urls"]})
+        except Exception as e:
+            logger.warning("selenium.block_urls.fail err=%s", e)
+    driver._ptp_driver_profile = profile
+    logger.info("selenium.ready pageload_timeout=%s implicit_wait=%s strategy=%s blocked=%s",
+                PAGELOAD_TIMEOUT, IMPLICIT_WAIT, prof["page_load_strategy"], len(prof["block_urls"]))
     return driver
 
 
@@ -120,8 +198,8 @@ def save_json(obj: Any, path: Path) -> None:
     path.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
 
 
-def maybe_accept_cookies_banner(driver):
-    """Intenta aceptar banners de cookies comunes; ignora si no hay."""
+def maybe_accept_cookies_banner(driver, timeout: float = BANNER_WAIT_SEC):
+    """Intenta aceptar banners de cookies comunes; ignora si no hay (una espera combinada, no una por selector)."""
     logger.info("cookies.banner.try")
     candidates = [
         "//button[contains(., 'Aceptar')]",
@@ -130,20 +208,21 @@ def maybe_accept_cookies_banner(driver):
         "//button[contains(., 'Consentir')]",
         "//*[@id='onetrust-accept-btn-handler']",
     ]
-    for xp in candidates:
+    hit = maybe_any(driver, candidates, timeout, visible=True)
+    if not hit:
+        logger.info("cookies.banner.none")
+        return
+    idx, btn = hit
+    try:
+        btn.click()
+        # en vez de dormir: esperar a que el botón desaparezca (o quede obsoleto)
         try:
-            btns = driver.find_elements(By.XPATH, xp)
-            if btns:
-                try:
-                    btns[0].click()
-                    time.sleep(0.5)
-                    logger.info("cookies.banner.accepted selector=%s", xp)
-                    break
-                except Exception as e:
-                    logger.warning("cookies.banner.click.fail selector=%s err=%s", xp, e)
-        except Exception:
-            # seguimos probando otros selectores silenciosamente
+            WebDriverWait(driver, 2, poll_frequency=0.1).until(EC.invisibility_of_element(btn))
+        except TimeoutException:
             pass
+        logger.info("cookies.banner.accepted selector=%s", candidates[idx])
+    except Exception as e:
+        logger.warning("cookies.banner.click.fail selector=%s err=%s", candidates[idx], e)
 
 
 # ------------------- FLUJO DE LOGIN PTP -------------------
@@ -155,10 +234,12 @@ def login_and_collect_cookies(email: str, password: str) -> List[Dict[str, Any]]
     t0 = time.time()
     logger.info("ptp.login.start url=%s email=%s", PTP_LOGIN_URL, _mask_email(email))
 
-    driver = create_driver(HEADLESS)
+    with metrics.phase("driver_start", scraper="login.selenium"):
+        driver = create_driver(HEADLESS, profile="login")
     try:
         # 1) Cargar página de login
-        driver.get(PTP_LOGIN_URL)
+        with metrics.phase("navigate", scraper="login.selenium"):
+            driver.get(PTP_LOGIN_URL)
         logger.info("ptp.login.page.loaded url_now=%s", driver.current_url)
         maybe_accept_cookies_banner(driver)
 
@@ -192,11 +273,13 @@ def login_and_collect_cookies(email: str, password: str) -> List[Dict[str, Any]]
         logger.info("ptp.login.pass.next.clicked")
 
         # 4) Esperar a éxito de login (cookie de sesión o cambio de URL)
-        WebDriverWait(driver, EXPLICIT_WAIT).until(
-            lambda d: ("session" in "".join([c["name"].lower() for c in d.get_cookies()]))
-                      or d.current_url != PTP_LOGIN_URL
-        )
-        time.sleep(2)  # por si hay redirecciones extra
+        with metrics.phase("dom_wait", scraper="login.selenium"):
+            WebDriverWait(driver, EXPLICIT_WAIT).until(
+                lambda d: ("session" in "".join([c["name"].lower() for c in d.get_cookies()]))
+                          or d.current_url != PTP_LOGIN_URL
+            )
+            # redirecciones extra: esperar a que la app deje de mutar el DOM, no un tiempo fijo
+            wait_dom_quiet(driver, 5, quiet_ms=500)
 
         # 5) Volcado de cookies
         cookies = dump_cookies(driver)
@@ -231,62 +314,116 @@ def login_and_collect_cookies(email: str, password: str) -> List[Dict[str, Any]]
 def store_cookies_in_db(account_id: int, cookies: List[Dict[str, Any]]) -> tuple[int, bool]:
     """
     Guarda cookies en dbo.CookiesPTP con invalidación de la vigente por (Name,Domain,Path).
+    Todo en una transacción: executemany de las nuevas (aún no vigentes, marcadas con
+    un BatchId propio del lote), invalidación set-based de las anteriores y activación
+    del lote por ese BatchId. Un lector concurrente ve el juego anterior completo o el
+    nuevo completo. LastLoginUtc/LastRefreshUtc son hora del servidor.
     Devuelve (total_guardadas, hay_auth_token).
     """
-    total_saved = 0
+    t0 = time.time()
     has_auth = False
     name_stats: Dict[str, int] = {}
+    batch_id = str(uuid.uuid4())
 
+    rows: Dict[tuple, Dict[str, Any]] = {}
     for c in cookies:
         name = c.get("name")
         value = c.get("value")
         domain = c.get("domain") or "placetoplug.com"
         path = c.get("path") or "/"
         expiry = c.get("expiry")
-        httpOnly = 1 if c.get("httpOnly") else 0
-        secure = 1 if c.get("secure") else 0
-        sameSite = c.get("sameSite")
 
         # Convertir expiry (epoch) -> datetime
         exp_dt = None
         if isinstance(expiry, (int, float)):
-            exp_dt = datetime.fromtimestamp(int(expiry), tz=timezone.utc)
-
-        # invalidar anteriores "vigentes"
-        execute("""
-            UPDATE dbo.CookiesPTP
-            SET IsCurrent = 0, IsValid = 0
-            WHERE AccountId=:aid AND Name=:n AND Domain=:d AND Path=:p AND IsCurrent=1
-        """, aid=account_id, n=name, d=domain, p=path)
-
-        # insertar nueva vigente
-        execute("""
-            INSERT INTO dbo.CookiesPTP
-            (AccountId, Name, Value, Domain, Path, ExpiryUtc, Secure, HttpOnly, SameSite,
-             LastLoginUtc, LastRefreshUtc, IsValid, IsCurrent)
-            VALUES
-            (:aid, :n, :v, :d, :p, :exp, :sec, :httponly, :ss, SYSUTCDATETIME(), SYSUTCDATETIME(), 1, 1)
-        """, aid=account_id, n=name, v=value, d=domain, p=path, exp=exp_dt,
-           sec=secure, httponly=httpOnly, ss=sameSite)
-
-        total_saved += 1
+            exp_dt = datetime.fromtimestamp(int(expiry), tz=timezone.utc).replace(tzinfo=None)
+
+        # misma (Name,Domain,Path) repetida en el lote: gana la última
+        rows[(name, domain, path)] = {
+            "aid": account_id, "n": name, "v": value, "d": domain, "p": path, "exp": exp_dt,
+            "sec": 1 if c.get("secure") else 0, "httponly": 1 if c.get("httpOnly") else 0,
+            "ss": c.get("sameSite"), "bid": batch_id,
+        }
         name_stats[name or "(none)"] = name_stats.get(name or "(none)", 0) + 1
         if name and name.lower() == "auth_token" and value:
             has_auth = True
 
+    with transaction() as conn:
+        if rows:
+            # 1) lote nuevo, todavía no vigente (IsCurrent=0, IsValid=1)
+            conn.execute(text("""
+                INSERT INTO dbo.CookiesPTP
+                (AccountId, Name, Value, Domain, Path, ExpiryUtc, Secure, HttpOnly, SameSite,
+                 LastLoginUtc, LastRefreshUtc, IsValid, IsCurrent, BatchId)
+                VALUES
+                (:aid, :n, :v, :d, :p, :exp, :sec, :httponly, :ss,
+                 SYSUTCDATETIME(), SYSUTCDATETIME(), 1, 0, :bid)
+            """), list(rows.values()))
+
+            # 2) invalidar las vigentes con la misma (Name,Domain,Path) que el lote
+            conn.execute(text("""
+                UPDATE old SET IsCurrent = 0, IsValid = 0
+                FROM dbo.CookiesPTP old
+                JOIN dbo.CookiesPTP n
+                  ON n.AccountId = old.AccountId AND n.Name = old.Name
+                 AND n.Domain = old.Domain AND n.Path = old.Path
+                WHERE old.AccountId = :aid AND old.IsCurrent = 1
+                  AND n.AccountId = :aid AND n.BatchId = :bid
+            """), {"aid": account_id, "bid": batch_id})
+
+            # 3) activar el lote
+            res = conn.execute(text("""
+                UPDATE dbo.CookiesPTP SET IsCurrent = 1
+                WHERE AccountId = :aid AND BatchId = :bid
+            """), {"aid": account_id, "bid": batch_id})
+            if res.rowcount != len(rows):
+                # rollback: mejor conservar el juego anterior que dejar la cuenta a medias
+                raise RuntimeError(f"lote de cookies incompleto: activadas={res.rowcount} esperadas={len(rows)}")
+
+        # nueva generación: invalida cachés de cookies de otros procesos
+        conn.execute(text("""
+            MERGE dbo.CookiesPTPVersion AS t
+            USING (SELECT :aid AS AccountId) AS s
+            ON t.AccountId = s.AccountId
+            WHEN MATCHED THEN UPDATE SET Generation = t.Generation + 1, UpdatedUtc = SYSUTCDATETIME()
+            WHEN NOT MATCHED THEN INSERT (AccountId, Generation, UpdatedUtc) VALUES (s.AccountId, 1, SYSUTCDATETIME());
+        """), {"aid": account_id})
+    # dentro de una petición el commit sería en after_request: confirmar antes de invalidar,
+    # o otro hilo recargaría (y cachearía) el juego anterior
+    commit()
+    invalidate_cookies(account_id)
+
+    total_saved = len(rows)
     logger.info(
-        "ptp.cookies.store account_id=%s total=%s names=%s auth_token=%s",
-        account_id, total_saved, name_stats, has_auth
+        "ptp.cookies.store account_id=%s total=%s names=%s auth_token=%s batch=%s duration_ms=%s",
+        account_id, total_saved, name_stats, has_auth, batch_id, int((time.time() - t0) * 1000)
     )
     return total_saved, has_auth
 
 
+def collect_cookies(email: str, password: str) -> List[Dict[str, Any]]:
+    """Login según PTP_LOGIN_BACKEND; el HTTP cae a Selenium salvo credenciales rechazadas."""
+    if PTP_LOGIN_BACKEND == "http":
+        with metrics.scrape("login.http") as m:
+            try:
+                return http_login_and_collect_cookies(email, password)
+            except HttpLoginAuthError:
+                raise
+            except HttpLoginError as e:
+                if not PTP_LOGIN_FALLBACK:
+                    raise
+                m["outcome"] = "Fallback"
+                logger.warning("ptp.login.http.fallback email=%s err=%s", _mask_email(email), e)
+    with metrics.scrape("login.selenium"):
+        return login_and_collect_cookies(email, password)
+
+
 def selenium_login_and_store_cookies(account_id: int, email: str, password: str) -> tuple[int, bool]:
     """
-    Login con Selenium y persistencia en BD para uso por workers y vistas.
+    Login (PTP_LOGIN_BACKEND: HTTP o Selenium) y persistencia en BD para uso por workers y vistas.
     Alias estable, usado por workers.
     """
-    cookies = login_and_collect_cookies(email, password)
+    cookies = collect_cookies(email, password)
     return store_cookies_in_db(account_id, cookies)
 
 
@@ -364,6 +501,8 @@ def ptp_refresh_now():
 
     email = account["EmailPTP"]
     password = decrypt_str(account["PasswordEnc"])
+    # el login tarda decenas de segundos: no retener la conexión de la petición mientras tanto
+    commit()
 
     try:
         total_saved, has_auth = selenium_login_and_store_cookies(account["AccountId"], email, password)
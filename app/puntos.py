@@ -1,9 +1,8 @@
 # app/puntos.py
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash, abort, current_app
-from .db import fetch_all, fetch_one, execute
-from .estado import scrape_conector_estado
+from .db import fetch_all, fetch_one, execute, unit_of_work
 from flask import jsonify
-from .meta import scrape_punto_info, scrape_conector_info
+from .jobs import enqueue, cuenta_ptp
 
 bp = Blueprint("puntos", __name__, template_folder="../templates")
 
@@ -34,13 +33,22 @@ def punto_delete(punto_id: int):
     if not owner:
         abort(404)
 
-    # Borrado en cascada manual (si no tienes FK ON DELETE CASCADE)
-    execute("""
-      DELETE e FROM dbo.EstadosConector e
-      WHERE e.ConectorId IN (SELECT ConectorId FROM dbo.Conectores WHERE PuntoId=:pid);
-    """, pid=punto_id)
-    execute("DELETE FROM dbo.Conectores WHERE PuntoId=:pid;", pid=punto_id)
-    execute("DELETE FROM dbo.Puntos WHERE PuntoId=:pid;", pid=punto_id)
+    # Borrado en cascada manual (si no tienes FK ON DELETE CASCADE), todo o nada
+    with unit_of_work():
+        execute("""
+          DELETE e FROM dbo.EstadosConector e
+          WHERE e.ConectorId IN (SELECT ConectorId FROM dbo.Conectores WHERE PuntoId=:pid);
+        """, pid=punto_id)
+        execute("""
+          DELETE a FROM dbo.ConectorEstadoActual a
+          WHERE a.ConectorId IN (SELECT ConectorId FROM dbo.Conectores WHERE PuntoId=:pid);
+        """, pid=punto_id)
+        execute("""
+          DELETE FROM dbo.ConectorPolling
+          WHERE ConectorId IN (SELECT ConectorId FROM dbo.Conectores WHERE PuntoId=:pid);
+        """, pid=punto_id)
+        execute("DELETE FROM dbo.Conectores WHERE PuntoId=:pid;", pid=punto_id)
+        execute("DELETE FROM dbo.Puntos WHERE PuntoId=:pid;", pid=punto_id)
 
     flash("Punto eliminado.", "success")
     return redirect(url_for("puntos.puntos_list"))
@@ -135,63 +143,23 @@ def punto_refresh(punto_id: int):
                   id=punto_id, uid=session["uid"])
     if not p: abort(404)
 
-    acc = fetch_all("""
-      SELECT a.AccountId
-      FROM dbo.CuentasPTP a
-      JOIN dbo.CredencialesPTP c ON c.AccountId=a.AccountId
-      WHERE a.UserId=:uid
-      ORDER BY a.AccountId ASC
-    """, uid=session["uid"])
-    if not acc:
+    if not cuenta_ptp(session["uid"]):
       return jsonify({"ok": False, "error": "Configura tu cuenta PTP primero."}), 400
-    account_id = acc[0]["AccountId"]
-
-    conns = fetch_all("""
-      SELECT ConectorId, UrlConector
-      FROM dbo.Conectores
-      WHERE PuntoId=:pid AND Activo=1
-      ORDER BY Orden, ConectorId
-    """, pid=punto_id)
 
-    results = []
-    for c in conns:
-        try:
-            estado, hint = scrape_conector_estado(account_id, c["ConectorId"], c["UrlConector"])
-            results.append({"conector_id": c["ConectorId"], "estado": estado, "hint": hint})
-        except Exception as e:
-            results.append({"conector_id": c["ConectorId"], "estado": "Error", "hint": str(e)})
+    job_id = enqueue(session["uid"], "punto", {"PuntoId": punto_id})
+    return jsonify({"ok": True, "job_id": job_id,
+                    "status_url": url_for("dash.job_get", job_id=job_id)}), 202
 
-    return jsonify({ "ok": True, "count": len(results), "results": results })
 @bp.post("/dashboard/puntos/<int:punto_id>/meta-refresh")
 def punto_meta_refresh(punto_id: int):
     _require_login()
-    p = fetch_one("SELECT PuntoId, UrlPunto FROM dbo.Puntos WHERE PuntoId=:id AND UserId=:uid",
+    p = fetch_one("SELECT PuntoId FROM dbo.Puntos WHERE PuntoId=:id AND UserId=:uid",
                   id=punto_id, uid=session["uid"])
     if not p: abort(404)
 
-    acc = fetch_one("""
-      SELECT TOP 1 a.AccountId
-      FROM dbo.CuentasPTP a JOIN dbo.CredencialesPTP c ON c.AccountId=a.AccountId
-      WHERE a.UserId=:uid ORDER BY a.AccountId
-    """, uid=session["uid"])
-    if not acc:
+    if not cuenta_ptp(session["uid"]):
         return jsonify({"ok": False, "error": "Configura tu cuenta PTP primero."}), 400
-    account_id = acc["AccountId"]
-
-    info_p = {}
-    if p.get("UrlPunto"):
-        try:
-            info_p = scrape_punto_info(account_id, p["PuntoId"], p["UrlPunto"])
-        except Exception as e:
-            current_app.logger.error("meta punto error: %s", e, exc_info=True)
-
-    conns = fetch_all("SELECT ConectorId, UrlConector FROM dbo.Conectores WHERE PuntoId=:pid AND Activo=1 ORDER BY Orden, ConectorId",
-                      pid=punto_id)
-    infos_c = []
-    for c in conns:
-        try:
-            infos_c.append(scrape_conector_info(account_id, c["ConectorId"], c["UrlConector"]))
-        except Exception as e:
-            current_app.logger.error("meta conector error: %s", e, exc_info=True)
-
-    return jsonify({"ok": True, "punto": info_p, "conectores": infos_c})
\ No newline at end of file
+
+    job_id = enqueue(session["uid"], "meta", {"PuntoId": punto_id})
+    return jsonify({"ok": True, "job_id": job_id,
+                    "status_url": url_for("dash.job_get", job_id=job_id)}), 202
@@ -0,0 +1,176 @@
+# app/refresh.py
+import os
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+from .driver_pool import POOL_SIZE
+from .estado import scrape_punto_estados
+from .fetchers import fetch_estado, FETCHER_BACKEND
+from .utils.waits import DeadlineExceeded
+
+logger = logging.getLogger("refresh")
+
+# ------------------- CONFIG -------------------
+REFRESH_WORKERS = int(os.getenv("REFRESH_WORKERS", "4"))
+REFRESH_EXECUTOR = os.getenv("REFRESH_EXECUTOR", "thread")        # thread | process
+REFRESH_ITEM_TIMEOUT = int(os.getenv("REFRESH_ITEM_TIMEOUT", "90"))  # segundos por conector
+# margen para que una tarea que venció su plazo termine sola antes de darla por perdida
+REFRESH_TIMEOUT_GRACE = int(os.getenv("REFRESH_TIMEOUT_GRACE", "10"))
+# Chrome simultáneos permitidos: en modo thread comparten el pool del proceso
+REFRESH_MAX_CHROME = int(os.getenv("REFRESH_MAX_CHROME", str(POOL_SIZE)))
+# Agrupar conectores del mismo punto en una sola carga de página (requiere UrlPunto).
+# Con el backend HTTP no hay páginas que ahorrar: por defecto se consulta por conector.
+REFRESH_BY_PUNTO = os.getenv("REFRESH_BY_PUNTO", "0" if FETCHER_BACKEND == "http" else "1") == "1"
+
+
+def _workers_for(n_items: int, workers: Optional[int] = None) -> int:
+    w = workers or REFRESH_WORKERS
+    return max(1, min(w, REFRESH_MAX_CHROME, n_items))
+
+
+def _result(conector_id, estado, hint) -> Dict[str, Any]:
+    return {"conector_id": conector_id, "estado": estado, "hint": hint}
+
+
+def _run_task(ti: int, fn: Callable, args: tuple, item_timeout: float, started) -> Any:
+    """
+    Corre en el hilo/proceso del pool: anota el arranque real de la tarea (started es
+    un dict, o un proxy de Manager en modo process) y le pasa su plazo como deadline.
+    """
+    t = time.time()
+    try:
+        started[ti] = t
+    except Exception:
+        pass    # el llamador ya se fue (Manager cerrado): la tarea corre igual con su plazo
+    return fn(*args, deadline=t + item_timeout)
+
+
+def _plan(account_id: int, conns: List[Dict[str, Any]], scrape: Callable,
+          by_punto: bool) -> List[Tuple[Callable, tuple, List[int]]]:
+    """
+    Convierte la lista de conectores en tareas (fn, args, índices en conns).
+    Los conectores de un mismo punto con UrlPunto van en una única tarea de punto.
+    """
+    tasks: List[Tuple[Callable, tuple, List[int]]] = []
+    groups: Dict[Any, List[int]] = {}
+    for i, c in enumerate(conns):
+        if by_punto and c.get("UrlPunto") and c.get("PuntoId") is not None:
+            groups.setdefault(c["PuntoId"], []).append(i)
+        else:
+            tasks.append((scrape, (account_id, c["ConectorId"], c["UrlConector"]), [i]))
+    for pid, idxs in groups.items():
+        if len(idxs) == 1:
+            c = conns[idxs[0]]
+            tasks.append((scrape, (account_id, c["ConectorId"], c["UrlConector"]), idxs))
+            continue
+        sub = [{k: conns[i].get(k) for k in ("ConectorId", "UrlConector", "Orden")} for i in idxs]
+        tasks.append((scrape_punto_estados, (account_id, pid, conns[idxs[0]]["UrlPunto"], sub), idxs))
+    return tasks
+
+
+def refresh_conectores(account_id: int, conns: List[Dict[str, Any]],
+                       scrape: Callable = fetch_estado,
+                       workers: Optional[int] = None,
+                       item_timeout: int = REFRESH_ITEM_TIMEOUT,
+                       executor: str = REFRESH_EXECUTOR,
+                       by_punto: bool = REFRESH_BY_PUNTO,
+                       on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> List[Dict[str, Any]]:
+    """
+    Ejecuta scrape(account_id, ConectorId, UrlConector, deadline=...) (por defecto
+    fetch_estado, HTTP o Selenium según FETCHER_BACKEND) para cada conector con
+    concurrencia acotada y timeout por tarea. Si las filas traen PuntoId/UrlPunto,
+    los conectores del mismo punto se resuelven con una sola carga de página; los
+    que no casan con ninguna tarjeta se reencolan como tareas por conector.
+    El timeout se aplica dentro de la tarea (deadline = arranque real + item_timeout):
+    driver y esperas se acotan a él y una tarea vencida no escribe en BD.
+    Devuelve la lista de resultados en el mismo orden que conns:
+    {"conector_id", "estado", "hint"}. Fallos y timeouts se devuelven como "Error".
+    on_result(resultado) se llama (en este hilo) según va terminando cada conector.
+    """
+    if not conns:
+        return []
+    t0 = time.time()
+    tasks = _plan(account_id, conns, scrape, by_punto)
+    n = _workers_for(len(tasks), workers)
+
+    manager = None
+    if executor == "process":
+        # Cada proceso tiene su propio pool de drivers; spawn evita heredar hilos/locks
+        ctx = multiprocessing.get_context("spawn")
+        manager = ctx.Manager()
+        started = manager.dict()
+        pool = ProcessPoolExecutor(max_workers=n, mp_context=ctx)
+    else:
+        started = {}
+        pool = ThreadPoolExecutor(max_workers=n, thread_name_prefix="refresh")
+    futs = {pool.submit(_run_task, ti, fn, args, item_timeout, started): ti
+            for ti, (fn, args, _) in enumerate(tasks)}
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(conns)
+
+    def _set(i: int, estado: str, hint: str):
+        results[i] = _result(conns[i]["ConectorId"], estado, hint)
+        if on_result is not None:
+            try:
+                on_result(results[i])
+            except Exception as e:
+                logger.warning("refresh.on_result.fail conector_id=%s: %s", conns[i]["ConectorId"], e)
+
+    def _fill(ti: int, estado: str, hint: str):
+        for i in tasks[ti][2]:
+            _set(i, estado, hint)
+
+    pending = set(futs)
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for f in done:
+                ti = futs[f]
+                idxs = tasks[ti][2]
+                try:
+                    res = f.result()
+                    if isinstance(res, dict):
+                        # tarea de punto: {ConectorId: (estado, hint)} de los casados; los
+                        # demás van a la cola como tareas por conector, cada una con su plazo
+                        for i in idxs:
+                            cid = conns[i]["ConectorId"]
+                            if cid in res:
+                                _set(i, *res[cid])
+                                continue
+                            tasks.append((scrape, (account_id, cid, conns[i]["UrlConector"]), [i]))
+                            nf = pool.submit(_run_task, len(tasks) - 1, scrape, tasks[-1][1], item_timeout, started)
+                            futs[nf] = len(tasks) - 1
+                            pending.add(nf)
+                    else:
+                        _fill(ti, *res)
+                except DeadlineExceeded:
+                    logger.warning("refresh.item.timeout conector_ids=%s timeout_s=%s",
+                                   [conns[i]["ConectorId"] for i in idxs], item_timeout)
+                    _fill(ti, "Error", "timeout")
+                except Exception as e:
+                    logger.error("refresh.item.fail conector_ids=%s: %s",
+                                 [conns[i]["ConectorId"] for i in idxs], e, exc_info=True)
+                    _fill(ti, "Error", str(e))
+            # red de seguridad: la tarea debería cortarse sola en su deadline; si pasado el
+            # margen sigue viva se deja de esperar (aunque acabe, ya no escribe en BD)
+            now = time.time()
+            for f in list(pending):
+                ti = futs[f]
+                t_start = started.get(ti)
+                if t_start is not None and now - t_start > item_timeout + REFRESH_TIMEOUT_GRACE:
+                    pending.discard(f)
+                    logger.warning("refresh.item.stuck conector_ids=%s timeout_s=%s",
+                                   [conns[i]["ConectorId"] for i in tasks[ti][2]], item_timeout)
+                    _fill(ti, "Error", "timeout")
+    finally:
+        # no esperamos a los que siguen corriendo tras un timeout
+        pool.shutdown(wait=False, cancel_futures=True)
+        if manager is not None:
+            manager.shutdown()
+
+    logger.info("refresh.done account_id=%s items=%s tasks=%s workers=%s executor=%s duration_ms=%s",
+                account_id, len(conns), len(tasks), n, executor, int((time.time() - t0) * 1000))
+    return results
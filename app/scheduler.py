@@ -0,0 +1,97 @@
+# app/scheduler.py
+import os
+import logging
+import threading
+from typing import Dict, Callable
+
+from .db import fetch_all
+from .utils.cron import JobHeap, ScheduledJob, SCHED_JITTER_PCT, SCHED_MISSED_POLICY
+
+logger = logging.getLogger("scheduler")
+
+# ------------------- CONFIG -------------------
+# jitter, política de perdidas y catchup: SCHED_* en app/utils/cron.py
+SCHED_FULL_RESYNC_SEC = int(os.getenv("SCHED_FULL_RESYNC_SEC", "900"))  # detecta filas borradas
+
+
+class Scheduler(JobHeap):
+    """
+    JobHeap alimentado incrementalmente desde dbo.JobsProgramados por su rowversion
+    (RowVer): solo se leen filas nuevas o modificadas (incluidas las desactivadas,
+    para sacarlas del heap).
+    """
+
+    def __init__(self, jitter_pct: float = SCHED_JITTER_PCT, default_policy: str = SCHED_MISSED_POLICY):
+        super().__init__(jitter_pct, default_policy)
+        self._watermark = 0
+        self._last_full = 0.0
+
+    # --- carga ---
+    def sync(self, now: float):
+        """
+        Lee cambios desde el último watermark; cada SCHED_FULL_RESYNC_SEC, recarga completa.
+        Solo se leen (y el watermark solo avanza sobre) versiones por debajo de
+        MIN_ACTIVE_ROWVERSION(): una transacción aún abierta con un RowVer menor que
+        otro ya confirmado no se salta; se lee en el siguiente sync, al confirmarse.
+        """
+        full = now - self._last_full > SCHED_FULL_RESYNC_SEC
+        rows = fetch_all("""
+            SELECT JobId, UserId, Tipo, CronExpr, PayloadJson, Activo,
+                   CAST(RowVer AS BIGINT) AS Ver,
+                   CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT) AS Mar
+            FROM dbo.JobsProgramados
+            WHERE RowVer > CAST(CAST(:wm AS BIGINT) AS BINARY(8))
+              AND (:full = 1 OR RowVer < MIN_ACTIVE_ROWVERSION())
+        """, wm=0 if full else self._watermark, full=1 if full else 0)
+        seen = set()
+        for r in rows:
+            # en la recarga completa se aplican todas, pero el watermark no pasa del límite
+            if int(r["Ver"]) < int(r["Mar"]):
+                self._watermark = max(self._watermark, int(r["Ver"]))
+            seen.add(r["JobId"])
+            self.apply(r, now)
+        if full:
+            self._last_full = now
+            with self._lock:
+                for jid in [j for j in self.jobs if j not in seen]:
+                    self.jobs.pop(jid, None)   # borrada en BD; su entrada del heap se ignora
+        if rows:
+            logger.info("sched.sync rows=%s full=%s jobs=%s", len(rows), full, len(self.jobs))
+
+
+def run_scheduler(handlers: Dict[str, Callable[[ScheduledJob], None]], executor,
+                  stop: threading.Event, poll_sec: float, now_fn: Callable[[], float]):
+    """
+    Bucle principal: sincroniza JobsProgramados cada poll_sec y despacha en executor
+    los jobs vencidos (handlers[tipo](job)); duerme hasta el siguiente vencimiento.
+    """
+    sched = Scheduler()
+    next_sync = 0.0
+    while not stop.is_set():
+        now = now_fn()
+        if now >= next_sync:
+            try:
+                sched.sync(now)
+            except Exception as e:
+                logger.error("sched.sync error: %s", e, exc_info=True)
+            next_sync = now + poll_sec
+        for job, runs in sched.pop_due(now):
+            handler = handlers.get(job.tipo)
+            if handler is None:
+                logger.warning("sched.no_handler job_id=%s tipo=%s", job.job_id, job.tipo)
+                continue
+            job.running = True
+            executor.submit(_run_job, handler, job, runs)
+        wait = sched.seconds_until_next(now_fn())
+        wait = min(wait if wait is not None else poll_sec, max(0.0, next_sync - now_fn()))
+        stop.wait(max(0.05, wait))
+
+
+def _run_job(handler, job: ScheduledJob, runs: int):
+    try:
+        for _ in range(runs):
+            handler(job)
+    except Exception as e:
+        logger.error("sched.job.fail job_id=%s tipo=%s: %s", job.job_id, job.tipo, e, exc_info=True)
+    finally:
+        job.running = False
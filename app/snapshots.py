@@ -0,0 +1,71 @@
+# app/snapshots.py
+import os
+import gzip
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+from .db import execute
+
+logger = logging.getLogger("snapshots")
+
+# ------------------- CONFIG -------------------
+# 1: cada scrape guarda page_source (una llamada más al driver) para re-parsear offline
+SNAPSHOT_CAPTURE = os.getenv("SNAPSHOT_CAPTURE", "0") == "1"
+SNAPSHOT_DIR = Path(os.getenv("SNAPSHOT_DIR", "/opt/reservas4/snapshots"))
+SNAPSHOT_GZIP_LEVEL = int(os.getenv("SNAPSHOT_GZIP_LEVEL", "6"))
+
+
+def snapshot_path(sha: str, base: Path = SNAPSHOT_DIR) -> Path:
+    return base / sha[:2] / f"{sha}.html.gz"
+
+
+def put(html: str, base: Path = SNAPSHOT_DIR) -> str:
+    """Guarda el HTML comprimido, direccionado por su sha256; idempotente. Devuelve el sha."""
+    data = html.encode("utf-8")
+    sha = hashlib.sha256(data).hexdigest()
+    path = snapshot_path(sha, base)
+    if path.exists():
+        return sha
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # escritura atómica: otro proceso puede estar guardando la misma página
+    fd, tmp = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb",
+                                                       compresslevel=SNAPSHOT_GZIP_LEVEL, mtime=0) as gz:
+            gz.write(data)
+        os.replace(tmp, path)
+    except Exception:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return sha
+
+
+def get(sha: str, base: Path = SNAPSHOT_DIR) -> str:
+    with gzip.open(snapshot_path(sha, base), "rb") as f:
+        return f.read().decode("utf-8")
+
+
+def capture_snapshot(driver, tipo: str, ref_id: Optional[int], url: Optional[str]) -> Optional[str]:
+    """
+    Si SNAPSHOT_CAPTURE está activo, guarda el page_source actual y lo indexa en dbo.Snapshots.
+    Nunca lanza: un fallo de captura no debe romper el scrape.
+    """
+    if not SNAPSHOT_CAPTURE:
+        return None
+    try:
+        html = driver.page_source or ""
+        sha = put(html)
+        execute("""
+            INSERT INTO dbo.Snapshots (Sha256, Tipo, RefId, Url, Bytes)
+            VALUES (:sha, :t, :ref, :url, :b)
+        """, sha=sha, t=tipo, ref=ref_id if isinstance(ref_id, int) else None, url=url, b=len(html))
+        return sha
+    except Exception as e:
+        logger.warning("snapshot.capture.fail tipo=%s ref=%s err=%s", tipo, ref_id, e)
+        return None
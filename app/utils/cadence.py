@@ -0,0 +1,56 @@
+# app/utils/cadence.py
+# Cadencias de reintento sin BD: intervalo de sondeo adaptativo por conector (polling.py)
+# y backoff de los logins fallidos (cookie_refresh.py).
+import os
+import random
+from typing import Optional
+
+# ------------------- CONFIG -------------------
+POLL_MIN_SEC = int(os.getenv("POLL_MIN_SEC", "60"))
+POLL_MAX_SEC = int(os.getenv("POLL_MAX_SEC", "3600"))
+POLL_WATCHED_MAX_SEC = int(os.getenv("POLL_WATCHED_MAX_SEC", "120"))  # techo si lo vigila un set activo
+POLL_WINDOW_H = int(os.getenv("POLL_WINDOW_H", "24"))                 # ventana para contar transiciones
+POLL_SAMPLES_PER_CHANGE = float(os.getenv("POLL_SAMPLES_PER_CHANGE", "4"))  # lecturas por cambio esperado
+POLL_SMOOTHING = float(os.getenv("POLL_SMOOTHING", "0.5"))            # peso del intervalo nuevo (EWMA)
+
+# multiplicador por estado actual: lo averiado o no disponible rara vez vuelve enseguida
+POLL_STATE_FACTOR = {
+    "Libre": 1.0,
+    "Ocupado": 1.0,
+    "Reservado": 1.0,
+    "No disponible": 3.0,
+    "Averiado": 4.0,
+}
+
+COOKIE_REFRESH_BACKOFF_SEC = int(os.getenv("COOKIE_REFRESH_BACKOFF_SEC", "300"))
+COOKIE_REFRESH_BACKOFF_MAX_SEC = int(os.getenv("COOKIE_REFRESH_BACKOFF_MAX_SEC", str(6 * 3600)))
+
+
+def compute_interval(transitions: int, estado: Optional[str], watched: bool,
+                     prev_interval: Optional[int] = None, window_h: int = POLL_WINDOW_H) -> int:
+    """
+    Intervalo de sondeo (s): POLL_SAMPLES_PER_CHANGE lecturas por cada cambio esperado
+    según las transiciones de la ventana, escalado por estado, suavizado con el
+    intervalo anterior y acotado a [POLL_MIN_SEC, POLL_MAX_SEC] (POLL_WATCHED_MAX_SEC si vigilado).
+    """
+    if estado in (None, "Desconocido", "Error"):
+        # sin lectura fiable: volver pronto, sin heredar cadencia
+        base = float(POLL_MIN_SEC)
+        prev_interval = None
+    elif transitions <= 0:
+        base = float(POLL_MAX_SEC)
+    else:
+        base = (window_h * 3600.0 / transitions) / POLL_SAMPLES_PER_CHANGE
+    base *= POLL_STATE_FACTOR.get(estado or "", 1.0)
+    if prev_interval:
+        base = POLL_SMOOTHING * base + (1 - POLL_SMOOTHING) * prev_interval
+    hi = min(POLL_MAX_SEC, POLL_WATCHED_MAX_SEC) if watched else POLL_MAX_SEC
+    return int(max(POLL_MIN_SEC, min(hi, base)))
+
+
+def backoff_sec(fallos: int) -> int:
+    """base * 2^(fallos-1), con techo y ±20% de jitter para no sincronizar reintentos."""
+    if fallos <= 0:
+        return 0
+    d = min(COOKIE_REFRESH_BACKOFF_MAX_SEC, COOKIE_REFRESH_BACKOFF_SEC * (2 ** min(fallos - 1, 20)))
+    return int(d * random.uniform(0.8, 1.2))
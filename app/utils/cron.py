@@ -0,0 +1,157 @@
+# app/utils/cron.py
+# Planificación en memoria de los jobs programados: intervalos de CronExpr y heap
+# de próximas ejecuciones. Sin BD: la carga desde dbo.JobsProgramados está en app/scheduler.py.
+import os
+import re
+import json
+import heapq
+import random
+import logging
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger("scheduler")
+
+# ------------------- CONFIG -------------------
+SCHED_JITTER_PCT = float(os.getenv("SCHED_JITTER_PCT", "0.1"))      # ±10% del intervalo
+SCHED_MISSED_POLICY = os.getenv("SCHED_MISSED_POLICY", "run_once")  # run_once | skip | catchup
+SCHED_MAX_CATCHUP = int(os.getenv("SCHED_MAX_CATCHUP", "3"))
+
+MISSED_POLICIES = ("run_once", "skip", "catchup")
+
+RX_EVERY = re.compile(r"^@every\s+(\d+)\s*(ms|s|m|h|d)?$", re.I)
+RX_CRON_STEP = re.compile(r"^\*/(\d+)\s+\*\s+\*\s+\*\s+\*$")
+UNIT_SEC = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+ALIASES = {"@minutely": 60, "@hourly": 3600, "@daily": 86400}
+
+
+def parse_cron(expr: Optional[str]) -> Optional[float]:
+    """
+    Intervalo en segundos para las expresiones que usamos: '@every 60s', '@every 5m',
+    '@hourly'/'@daily', '*/N * * * *' (cada N minutos). None si no se reconoce o es 0.
+    """
+    e = (expr or "").strip()
+    if not e:
+        return None
+    if e.lower() in ALIASES:
+        return float(ALIASES[e.lower()])
+    m = RX_EVERY.match(e)
+    if m:
+        return int(m.group(1)) * UNIT_SEC[(m.group(2) or "s").lower()] or None
+    m = RX_CRON_STEP.match(e)
+    if m:
+        return int(m.group(1)) * 60.0 or None
+    return None
+
+
+class ScheduledJob:
+    __slots__ = ("job_id", "user_id", "tipo", "payload", "interval", "policy", "next_run", "running")
+
+    def __init__(self, job_id: int, user_id: int, tipo: str, payload: Dict[str, Any],
+                 interval: float, policy: str):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.tipo = tipo
+        self.payload = payload
+        self.interval = interval
+        self.policy = policy
+        self.next_run = 0.0
+        self.running = False
+
+
+class JobHeap:
+    """
+    Min-heap de próximas ejecuciones por JobId con jitter y política de ejecuciones
+    perdidas (run_once | skip | catchup). Sin BD: Scheduler (app/scheduler.py) lo
+    alimenta desde dbo.JobsProgramados.
+    """
+
+    def __init__(self, jitter_pct: float = SCHED_JITTER_PCT, default_policy: str = SCHED_MISSED_POLICY):
+        self.jitter_pct = jitter_pct
+        self.default_policy = default_policy if default_policy in MISSED_POLICIES else "run_once"
+        self.jobs: Dict[int, ScheduledJob] = {}
+        self._heap: List[Tuple[float, int]] = []
+        self._lock = threading.Lock()
+
+    def apply(self, r, now: float):
+        """Alta, cambio o baja de un job desde su fila (JobId, UserId, Tipo, CronExpr, PayloadJson, Activo)."""
+        jid = r["JobId"]
+        interval = parse_cron(r["CronExpr"])
+        if not r["Activo"] or interval is None:
+            if r["Activo"] and interval is None:
+                logger.warning("sched.cron.unsupported job_id=%s cron=%r", jid, r["CronExpr"])
+            with self._lock:
+                self.jobs.pop(jid, None)
+            return
+        try:
+            payload = json.loads(r["PayloadJson"] or "{}")
+        except Exception:
+            payload = {}
+        policy = payload.get("MissedPolicy") if payload.get("MissedPolicy") in MISSED_POLICIES else self.default_policy
+        with self._lock:
+            cur = self.jobs.get(jid)
+            if cur is not None:
+                cur.user_id, cur.tipo, cur.payload, cur.policy = r["UserId"], r["Tipo"], payload, policy
+                if cur.interval != interval:
+                    cur.interval = interval
+                    cur.next_run = min(cur.next_run, now + self._jittered(interval))
+                    heapq.heappush(self._heap, (cur.next_run, jid))
+                return
+            job = ScheduledJob(jid, r["UserId"], r["Tipo"], payload, interval, policy)
+            # primera ejecución repartida en el intervalo: cientos de jobs no coinciden en el mismo segundo
+            job.next_run = now + random.uniform(0, interval)
+            self.jobs[jid] = job
+            heapq.heappush(self._heap, (job.next_run, jid))
+
+    def _jittered(self, interval: float) -> float:
+        j = interval * self.jitter_pct
+        return max(0.001, interval + random.uniform(-j, j))
+
+    # --- planificación ---
+    def seconds_until_next(self, now: float) -> Optional[float]:
+        with self._lock:
+            self._drop_stale_heads()
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - now)
+
+    def _drop_stale_heads(self):
+        while self._heap:
+            t, jid = self._heap[0]
+            job = self.jobs.get(jid)
+            if job is None or job.next_run != t:
+                heapq.heappop(self._heap)
+                continue
+            break
+
+    def pop_due(self, now: float) -> List[Tuple[ScheduledJob, int]]:
+        """Devuelve [(job, n_ejecuciones)] vencidos y los reprograma según su política."""
+        out: List[Tuple[ScheduledJob, int]] = []
+        with self._lock:
+            while True:
+                self._drop_stale_heads()
+                if not self._heap or self._heap[0][0] > now:
+                    break
+                t, jid = heapq.heappop(self._heap)
+                job = self.jobs[jid]
+                missed = int((now - t) // job.interval) if job.interval > 0 else 0
+                if job.running:
+                    # la anterior sigue en curso: no se solapa, cuenta como perdida
+                    runs = 0
+                elif missed == 0 or job.policy == "run_once":
+                    runs = 1
+                elif job.policy == "catchup":
+                    runs = min(missed + 1, SCHED_MAX_CATCHUP)
+                else:  # skip
+                    runs = 0
+                if missed:
+                    logger.info("sched.missed job_id=%s missed=%s policy=%s runs=%s",
+                                jid, missed, job.policy, runs)
+                # siguiente ejecución alineada a la rejilla del intervalo, con jitter
+                job.next_run = t + (missed + 1) * job.interval + (self._jittered(job.interval) - job.interval)
+                if job.next_run <= now:
+                    job.next_run = now + self._jittered(job.interval)
+                heapq.heappush(self._heap, (job.next_run, jid))
+                if runs:
+                    out.append((job, runs))
+        return out
@@ -0,0 +1,86 @@
+# app/utils/manifest.py
+import json
+import threading
+from typing import Dict, Any
+
+# Evaluador de manifiestos de selectores (MANIF_* en app/meta.py) dentro de la página.
+# Cada campo: {"xpath", "css", "kind", ...} con kind:
+#   text   (defecto) primer elemento con texto visible, XPath y luego CSS
+#   count  nº de elementos (XPath, CSS y fallback_css, el primero que no sea 0)
+#   href   sube hasta `up` ancestros desde el nodo hasta un <a> y lee su href;
+#          si no, primer elemento de fallback_css
+#   scan   líneas del texto visible que contienen `scan` (p.ej. "kW")
+# Además un campo de texto puede llevar "scan": sus líneas van en <campo>__scan como respaldo.
+# Las claves que no son JSON (regex, param...) se quedan en Python.
+JS_EVAL_MANIFEST = r"""
+const spec = %s;
+const byXPath = xp => {
+  if (!xp) return [];
+  try {
+    const r = document.evaluate(xp, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    const out = [];
+    for (let i = 0; i < r.snapshotLength; i++) out.push(r.snapshotItem(i));
+    return out;
+  } catch (e) { return []; }
+};
+const byCss = css => {
+  if (!css) return [];
+  try { return Array.from(document.querySelectorAll(css)); } catch (e) { return []; }
+};
+const textOf = el => ((el.innerText !== undefined ? el.innerText : el.textContent) || '').trim();
+const firstText = els => { for (const el of els) { const t = textOf(el); if (t) return t; } return ''; };
+let bodyLines = null;
+const scanLines = token => {
+  if (bodyLines === null) bodyLines = ((document.body && document.body.innerText) || '').split('\n');
+  return bodyLines.map(l => l.trim()).filter(l => l && l.indexOf(token) !== -1);
+};
+const out = {};
+for (const [name, f] of Object.entries(spec)) {
+  const kind = f.kind || 'text';
+  if (kind === 'count') {
+    let n = byXPath(f.xpath).length;
+    if (!n) n = byCss(f.css).length;
+    if (!n) n = byCss(f.fallback_css).length;
+    out[name] = n;
+  } else if (kind === 'href') {
+    let node = byXPath(f.xpath)[0] || byCss(f.css)[0] || null, href = null;
+    for (let i = 0; node && i <= (f.up || 0); i++, node = node.parentElement) {
+      if (node.tagName && node.tagName.toLowerCase() === 'a') { href = node.getAttribute('href'); break; }
+    }
+    if (!href && f.fallback_css) {
+      const a = byCss(f.fallback_css)[0];
+      href = a ? a.getAttribute('href') : null;
+    }
+    out[name] = href || '';
+  } else if (kind === 'scan') {
+    out[name] = f.scan ? scanLines(f.scan) : [];
+  } else {
+    const t = firstText(byXPath(f.xpath)) || firstText(byCss(f.css));
+    out[name] = t;
+    if (f.scan) out[name + '__scan'] = scanLines(f.scan);
+  }
+}
+return out;
+"""
+
+JSON_KEYS = ("xpath", "css", "kind", "up", "fallback_css", "scan")
+
+_compiled: Dict[int, str] = {}
+_lock = threading.Lock()
+
+
+def compile_manifest(manif: Dict[str, Dict[str, Any]]) -> str:
+    """Script JS con el manifiesto embebido (solo las claves serializables), cacheado por manifiesto."""
+    key = id(manif)
+    with _lock:
+        js = _compiled.get(key)
+        if js is None:
+            spec = {name: {k: f[k] for k in JSON_KEYS if f.get(k)} for name, f in manif.items()}
+            js = JS_EVAL_MANIFEST % json.dumps(spec, ensure_ascii=False)
+            _compiled[key] = js
+        return js
+
+
+def eval_manifest(driver, manif: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Todos los campos del manifiesto en una sola llamada execute_script."""
+    return driver.execute_script(compile_manifest(manif)) or {}
@@ -1,12 +1,59 @@
 # app/utils/ptp_cookies.py
-from typing import List, Dict
+import os
+import time
+import hashlib
+import calendar
+import threading
+from typing import List, Dict, Optional
 from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.webdriver import WebDriver
 from selenium.webdriver.support.ui import WebDriverWait as W
 from selenium.webdriver.support import expected_conditions as EC
-from ..db import fetch_all
+from ..db import fetch_all, fetch_one
+from ..metrics import phase
+
+# Caché en proceso de cookies vigentes por AccountId.
+# - TTL duro: pasado COOKIE_CACHE_TTL_SEC se recarga siempre
+# - cada COOKIE_VERSION_CHECK_SEC se compara la generación con dbo.CookiesPTPVersion
+#   (1 fila por cuenta), que store_cookies_in_db incrementa: invalida entre procesos
+COOKIE_CACHE_TTL = int(os.getenv("COOKIE_CACHE_TTL_SEC", "900"))
+COOKIE_VERSION_CHECK = int(os.getenv("COOKIE_VERSION_CHECK_SEC", "30"))
+
+_cache: Dict[int, Dict] = {}
+_cache_lock = threading.Lock()
+
+def _db_generation(account_id: int) -> int:
+    row = fetch_one("SELECT Generation FROM dbo.CookiesPTPVersion WHERE AccountId=:aid", aid=account_id)
+    return int(row["Generation"]) if row else 0
+
+def invalidate_cookies(account_id: int):
+    with _cache_lock:
+        _cache.pop(account_id, None)
 
 def get_current_cookies(account_id: int) -> List[Dict]:
+    now = time.time()
+    with _cache_lock:
+        e = _cache.get(account_id)
+    gen = None
+    if e and now - e["loaded"] < COOKIE_CACHE_TTL:
+        if now - e["checked"] < COOKIE_VERSION_CHECK:
+            return [dict(c) for c in e["cookies"]]
+        gen = _db_generation(account_id)
+        if gen == e["gen"]:
+            with _cache_lock:
+                # solo si nadie la ha sustituido o invalidado mientras tanto; si no, se recarga
+                if _cache.get(account_id) is e:
+                    _cache[account_id] = dict(e, checked=now)
+                    return [dict(c) for c in e["cookies"]]
+
+    if gen is None:
+        gen = _db_generation(account_id)
+    cookies = _load_cookies(account_id)
+    with _cache_lock:
+        _cache[account_id] = {"gen": gen, "cookies": cookies, "loaded": now, "checked": now}
+    return [dict(c) for c in cookies]
+
+def _load_cookies(account_id: int) -> List[Dict]:
     rows = fetch_all("""
       SELECT Name, Value, Domain, Path, ExpiryUtc, Secure, HttpOnly, SameSite
       FROM dbo.CookiesPTP
@@ -20,11 +67,39 @@ def get_current_cookies(account_id: int) -> List[Dict]:
             "path": r["Path"] or "/",
             "secure": bool(r["Secure"]), "httpOnly": bool(r["HttpOnly"])
         }
+        if r["ExpiryUtc"] is not None:
+            # DATETIME2 llega naive en UTC
+            c["expiry"] = calendar.timegm(r["ExpiryUtc"].timetuple())
+        if r["SameSite"]:
+            c["sameSite"] = r["SameSite"]
         cookies.append(c)
     return cookies
 
+def prime_cookies_cdp(driver: WebDriver, cookies: List[Dict]):
+    """Inyecta las cookies por CDP (Network.setCookies): no necesita navegar al dominio."""
+    params = []
+    for c in cookies:
+        p = {
+            "name": c["name"], "value": c["value"],
+            "domain": c.get("domain") or "placetoplug.com",
+            "path": c.get("path") or "/",
+            "secure": bool(c.get("secure")), "httpOnly": bool(c.get("httpOnly")),
+        }
+        if c.get("expiry"):
+            p["expires"] = int(c["expiry"])
+        if c.get("sameSite") in ("Strict", "Lax", "None"):
+            p["sameSite"] = c["sameSite"]
+        params.append(p)
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setCookies", {"cookies": params})
+
 def prime_cookies(driver: WebDriver, cookies: List[Dict]):
-    """Añade cookies para dominios relevantes."""
+    """Añade cookies para dominios relevantes (CDP; si no está disponible, navegando a cada dominio)."""
+    try:
+        prime_cookies_cdp(driver, cookies)
+        return
+    except Exception:
+        pass
     domains = ["placetoplug.com", "account.placetoplug.com"]
     for dom in domains:
         driver.get(f"https://{dom}/")
@@ -38,3 +113,58 @@ def prime_cookies(driver: WebDriver, cookies: List[Dict]):
                     driver.add_cookie(cd)
                 except Exception:
                     pass
+
+
+def cookies_key(account_id: int, cookies: List[Dict]) -> tuple:
+    h = hashlib.sha1()
+    for c in sorted(cookies, key=lambda c: (c.get("domain") or "", c.get("path") or "", c.get("name") or "")):
+        h.update(f"{c.get('domain')}|{c.get('path')}|{c.get('name')}={c.get('value')};".encode("utf-8"))
+    return account_id, h.hexdigest()
+
+# Marca en el perfil persistente de Chrome con la generación de cookies ya cargada
+PROFILE_MARKER = ".ptp_cookie_gen"
+
+def read_profile_marker(profile_dir: str) -> Optional[str]:
+    try:
+        with open(os.path.join(profile_dir, PROFILE_MARKER), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def write_profile_marker(profile_dir: str, generation: str):
+    try:
+        with open(os.path.join(profile_dir, PROFILE_MARKER), "w", encoding="utf-8") as f:
+            f.write(generation)
+    except OSError:
+        pass
+
+def _browser_has_cookies(driver: WebDriver, cookies: List[Dict]) -> bool:
+    """Comprueba (una llamada CDP) que el navegador conserva los valores de BD."""
+    try:
+        have = {(c["name"], c["value"]) for c in driver.execute_cdp_cmd("Network.getAllCookies", {})["cookies"]}
+    except Exception:
+        return False
+    return all((c["name"], c["value"]) in have for c in cookies)
+
+def ensure_primed(driver: WebDriver, account_id: int) -> bool:
+    """
+    Carga las cookies vigentes de la cuenta en un driver del pool solo si aún no
+    las tiene (mismo AccountId y misma generación de cookies). Con perfil
+    persistente (driver._ptp_profile_dir) la generación sobrevive a reinicios de
+    Chrome. Devuelve True si hubo priming.
+    """
+    with phase("cookie_lookup"):
+        cookies = get_current_cookies(account_id)
+    key = cookies_key(account_id, cookies)
+    if getattr(driver, "_ptp_primed", None) == key:
+        return False
+    profile = getattr(driver, "_ptp_profile_dir", None)
+    if profile and read_profile_marker(profile) == key[1] and _browser_has_cookies(driver, cookies):
+        driver._ptp_primed = key
+        return False
+    with phase("prime"):
+        prime_cookies(driver, cookies)
+    driver._ptp_primed = key
+    if profile:
+        write_profile_marker(profile, key[1])
+    return True
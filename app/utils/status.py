@@ -0,0 +1,120 @@
+# app/utils/status.py
+# Estados de toma: etiquetas propias, valores del backend JSON y su lectura.
+# Sin Selenium, requests ni BD: lo usan estado.py, offline.py, fetchers.py y el backfill.
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+# ✅ Mapeos ampliados (incluye s-light-*)
+STATUS_CLASS_MAP = {
+    # “oscuros”
+    "s-green": "Libre", "green": "Libre", "s-success": "Libre",
+    "s-red": "Ocupado", "red": "Ocupado", "danger": "Ocupado",
+    "s-orange": "Reservado", "orange": "Reservado", "warning": "Reservado",
+    "s-grey": "No disponible", "s-gray": "No disponible", "grey": "No disponible", "gray": "No disponible",
+    "error": "Averiado", "fault": "Averiado",
+
+    # “claros” (tu caso)
+    "s-light-green": "Libre",
+    "s-light-orange": "Reservado",
+    "s-light-red": "Ocupado",
+    "s-light-grey": "No disponible",
+    "s-light-gray": "No disponible",
+}
+
+STATUS_TEXT_MAP = {
+    "libre": "Libre",
+    "ocupado": "Ocupado",
+    "reservado": "Reservado",
+    "no disponible": "No disponible",
+    "averiado": "Averiado",
+    "fuera de servicio": "Averiado",
+}
+
+# Valores de estado del backend -> etiquetas propias (las de STATUS_TEXT_MAP también valen)
+API_STATUS_MAP = {
+    "available": "Libre", "free": "Libre",
+    "occupied": "Ocupado", "charging": "Ocupado", "busy": "Ocupado", "in_use": "Ocupado",
+    "reserved": "Reservado", "booked": "Reservado",
+    "unavailable": "No disponible", "offline": "No disponible", "unknown_state": "No disponible",
+    "faulted": "Averiado", "out_of_order": "Averiado", "outoforder": "Averiado", "error": "Averiado",
+}
+API_STATUS_KEYS = ("status", "state", "plugStatus", "plug_status", "availability")
+
+
+class FetchSchemaError(Exception):
+    """Respuesta sin el formato esperado (no JSON, sin campo de estado, valor desconocido)."""
+
+
+def plug_id_from_url(url: str) -> Optional[str]:
+    """Identificador de toma desde UrlConector: ?plug=/?plugId= o último segmento de ruta."""
+    try:
+        u = urlparse(url)
+        q = parse_qs(u.query)
+        for k in ("plug", "plugId", "plug_id", "connector", "evse"):
+            if q.get(k):
+                return q[k][0]
+        parts = [p for p in u.path.split("/") if p]
+        return parts[-1] if parts else None
+    except Exception:
+        return None
+
+
+def _map_api_status(raw: str) -> Optional[str]:
+    low = (raw or "").strip().lower().replace("-", "_").replace(" ", "_")
+    if low in API_STATUS_MAP:
+        return API_STATUS_MAP[low]
+    return STATUS_TEXT_MAP.get(low.replace("_", " "))
+
+
+def parse_status_payload(data: Any) -> Tuple[str, str]:
+    """
+    Busca el campo de estado en el JSON (raíz o 'data'/'plug'/'result'): gana el primer
+    par clave/valor conocido. Lanza FetchSchemaError si no hay ninguno.
+    """
+    candidates = [data]
+    if isinstance(data, dict):
+        for k in ("data", "plug", "result"):
+            if isinstance(data.get(k), dict):
+                candidates.append(data[k])
+    unknown = []
+    for obj in candidates:
+        if not isinstance(obj, dict):
+            continue
+        for key in API_STATUS_KEYS:
+            val = obj.get(key)
+            if isinstance(val, str) and val:
+                label = _map_api_status(val)
+                if label:
+                    return label, f"api:{key}={val}"
+                unknown.append(f"{key}={val!r}")
+    if unknown:
+        raise FetchSchemaError(f"valor de estado desconocido {', '.join(unknown)}")
+    raise FetchSchemaError("sin campo de estado en la respuesta")
+
+
+def url_key(url: Optional[str]) -> str:
+    """Último segmento de ruta de una URL (sin query ni barra final): clave de la toma."""
+    path = (url or "").split("?", 1)[0].split("#", 1)[0].rstrip("/")
+    return path.rsplit("/", 1)[-1] if path else ""
+
+
+def match_cards(cards: List[Dict[str, Any]], conns: List[Dict[str, Any]]) -> Dict[int, Dict[str, Any]]:
+    """
+    Asigna tarjetas a ConectorId solo si alguna clave de la tarjeta es exactamente el
+    último segmento de UrlConector. Sin posición como respaldo: escribir el estado de
+    una toma en otro conector es peor que no escribirlo. Los no casados no aparecen.
+    """
+    out: Dict[int, Dict[str, Any]] = {}
+    by_key: Dict[str, Dict[str, Any]] = {}
+    for card in cards:
+        for k in card["keys"]:
+            if k:
+                by_key.setdefault(k, card)
+    used = set()
+    for c in conns:
+        key = url_key(c.get("UrlConector"))
+        card = by_key.get(key) if key else None
+        if card is not None and card["index"] not in used:
+            out[c["ConectorId"]] = card
+            used.add(card["index"])
+    return out
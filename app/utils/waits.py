@@ -0,0 +1,186 @@
+# app/utils/waits.py
+import os
+import time
+import logging
+from contextlib import contextmanager
+from typing import List, Optional, Sequence, Tuple, Union
+
+from selenium.webdriver.remote.webdriver import WebDriver
+from selenium.webdriver.support.ui import WebDriverWait as W
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+logger = logging.getLogger("waits")
+
+# Capa de esperas explícitas: el driver va con implicit wait 0, así que un
+# selector que no existe cuesta una ida y vuelta, no SELENIUM_IMPLICIT_WAIT segundos.
+WAIT_POLL_SEC = float(os.getenv("WAIT_POLL_SEC", "0.1"))
+DOM_QUIET_MS = int(os.getenv("WAIT_DOM_QUIET_MS", "300"))
+
+# "css:..." / "xpath:..." o texto plano (XPath si empieza por / o (, si no CSS)
+Selector = Union[str, Tuple[str, str]]
+
+# Comprueba todos los selectores en una sola llamada: [índice, elemento] del primero que aparece
+JS_FIND_ANY = r"""
+const sels = arguments[0], visible = arguments[1];
+const shown = el => !visible || !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+for (let i = 0; i < sels.length; i++) {
+  const [kind, expr] = sels[i];
+  let els = [];
+  try {
+    if (kind === 'xpath') {
+      const r = document.evaluate(expr, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+      for (let k = 0; k < r.snapshotLength; k++) els.push(r.snapshotItem(k));
+    } else {
+      els = Array.from(document.querySelectorAll(expr));
+    }
+  } catch (e) { continue; }
+  for (const el of els) if (shown(el)) return [i, el];
+}
+return null;
+"""
+
+# Señal de "app lista": se resuelve cuando existe `root` (si se da) y el DOM lleva
+# quietMs sin mutaciones (Angular terminó de pintar), o al agotar timeoutMs.
+JS_DOM_QUIET = r"""
+const root = arguments[0], quietMs = arguments[1], timeoutMs = arguments[2];
+const done = arguments[arguments.length - 1];
+const t0 = Date.now();
+let timer = null, obs = null, finished = false;
+const finish = ok => {
+  if (finished) return;
+  finished = true;
+  if (obs) obs.disconnect();
+  clearTimeout(timer);
+  clearTimeout(hard);
+  done({ok: ok, ms: Date.now() - t0});
+};
+const hard = setTimeout(() => finish(false), timeoutMs);
+const arm = () => { clearTimeout(timer); timer = setTimeout(() => finish(true), quietMs); };
+const start = () => {
+  obs = new MutationObserver(() => {
+    if (!root || document.querySelector(root)) arm();
+  });
+  obs.observe(document.documentElement, {childList: true, subtree: true, attributes: true, characterData: true});
+  if (!root || document.querySelector(root)) arm();
+};
+if (document.readyState === 'loading') document.addEventListener('DOMContentLoaded', start); else start();
+"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Una tarea con plazo lo superó: no debe escribir su resultado."""
+
+
+def time_left(deadline: Optional[float], cap: float) -> float:
+    """Segundos hasta `deadline` (epoch), acotados a cap; sin deadline, cap."""
+    if deadline is None:
+        return cap
+    return max(0.0, min(cap, deadline - time.time()))
+
+
+def check_deadline(deadline: Optional[float], what: str = ""):
+    if deadline is not None and time.time() > deadline:
+        raise DeadlineExceeded(f"plazo vencido {what}".strip())
+
+
+@contextmanager
+def driver_deadline(driver: WebDriver, deadline: Optional[float]):
+    """
+    Acota page load y script timeout del driver al plazo de la tarea y restaura los
+    anteriores al salir (el driver vuelve al pool con su configuración).
+    """
+    if deadline is None:
+        yield driver
+        return
+    check_deadline(deadline)
+    prev = driver.timeouts
+    left = max(0.5, deadline - time.time())
+    driver.set_page_load_timeout(min(prev.page_load, left))
+    driver.set_script_timeout(min(prev.script, left))
+    try:
+        yield driver
+    finally:
+        try:
+            driver.set_page_load_timeout(prev.page_load)
+            driver.set_script_timeout(prev.script)
+        except WebDriverException:
+            pass
+
+
+def _norm(sel: Selector) -> List[str]:
+    if isinstance(sel, (tuple, list)):
+        return [sel[0], sel[1]]
+    if sel.startswith("xpath:"):
+        return ["xpath", sel[6:]]
+    if sel.startswith("css:"):
+        return ["css", sel[4:]]
+    return ["xpath", sel] if sel.startswith(("/", "(")) else ["css", sel]
+
+
+def find_any(driver: WebDriver, selectors: Sequence[Selector], visible: bool = False):
+    """(índice, elemento) del primer selector con coincidencia, o None; una sola llamada."""
+    hit = driver.execute_script(JS_FIND_ANY, [_norm(s) for s in selectors], visible)
+    return (hit[0], hit[1]) if hit else None
+
+
+def wait_any(driver: WebDriver, selectors: Sequence[Selector], timeout: float,
+             visible: bool = False, poll: float = WAIT_POLL_SEC):
+    """
+    Espera combinada: el primero de varios selectores que aparezca (o sea visible).
+    Devuelve (índice, elemento); lanza TimeoutException si no aparece ninguno.
+    """
+    return W(driver, timeout, poll_frequency=poll).until(
+        lambda d: find_any(d, selectors, visible) or False,
+        message=f"ninguno de {list(selectors)} en {timeout}s",
+    )
+
+
+def maybe_any(driver: WebDriver, selectors: Sequence[Selector], timeout: float, visible: bool = False):
+    """Como wait_any, pero devuelve None en vez de lanzar si no aparece."""
+    try:
+        return wait_any(driver, selectors, timeout, visible)
+    except TimeoutException:
+        return None
+
+
+def wait_dom_quiet(driver: WebDriver, timeout: float, root: Optional[str] = None,
+                   quiet_ms: int = DOM_QUIET_MS) -> bool:
+    """
+    Espera a que exista `root` (CSS) y el DOM deje de mutar quiet_ms (MutationObserver).
+    Devuelve False si se agotó el plazo; nunca lanza (una navegación en curso aborta el script).
+    El script timeout del driver se restaura al salir: los drivers del pool se reutilizan.
+    """
+    t0 = time.time()
+    prev = None
+    try:
+        prev = driver.timeouts.script
+        driver.set_script_timeout(timeout + 2)
+        res = driver.execute_async_script(JS_DOM_QUIET, root, quiet_ms, int(timeout * 1000))
+        return bool(res and res.get("ok"))
+    except WebDriverException as e:
+        logger.info("waits.dom_quiet.abort root=%s ms=%s err=%s", root, int((time.time() - t0) * 1000),
+                    str(e).splitlines()[0] if str(e) else type(e).__name__)
+        return False
+    finally:
+        if prev is not None:
+            try:
+                driver.set_script_timeout(prev)
+            except WebDriverException:
+                pass
+
+
+def wait_app_ready(driver: WebDriver, selectors: Sequence[Selector], timeout: float,
+                   quiet_ms: int = DOM_QUIET_MS, deadline: Optional[float] = None) -> Optional[int]:
+    """
+    Página de la app Angular lista: aparece alguno de `selectors` y el DOM se asienta.
+    Devuelve el índice del selector encontrado o None si no apareció ninguno a tiempo.
+    Con `deadline` (epoch) la espera no pasa de ese instante.
+    """
+    t0 = time.time()
+    timeout = time_left(deadline, timeout)
+    hit = maybe_any(driver, selectors, timeout)
+    if hit is None:
+        return None
+    remaining = max(0.5, timeout - (time.time() - t0))
+    wait_dom_quiet(driver, min(remaining, 5.0), quiet_ms=quiet_ms)
+    return hit[0]
@@ -0,0 +1,240 @@
+# app/watch.py
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Optional, Tuple
+
+from .db import fetch_all, fetch_one, unit_of_work
+from .driver_pool import POOL_SIZE
+from .estado import scrape_punto_estados, scrape_punto_cards
+from .fetchers import fetch_estado
+from .jobs import cuenta_ptp
+from .refresh import REFRESH_BY_PUNTO
+from .metrics import observe_watch_tick
+
+logger = logging.getLogger("watch")
+
+# ------------------- CONFIG -------------------
+WATCH_WORKERS = int(os.getenv("WATCH_WORKERS", str(POOL_SIZE)))
+# fracción de VentanaCambioMin que puede durar un tick (el resto es margen para reservar)
+WATCH_WINDOW_FRACTION = float(os.getenv("WATCH_WINDOW_FRACTION", "0.25"))
+WATCH_TICK_MAX_SEC = float(os.getenv("WATCH_TICK_MAX_SEC", "45"))
+# URL de un punto que no está dado de alta en dbo.Puntos, p.ej. https://.../{slug}; vacío = no se vigila
+WATCH_PUNTO_URL_TPL = os.getenv("WATCH_PUNTO_URL_TPL", "")
+
+LIBRE = "Libre"
+SOCKETS = ("A", "B")   # A = primer conector del punto (Orden 1), B = segundo
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, WATCH_WORKERS), thread_name_prefix="watch")
+        return _executor
+
+
+def _slug(url: Optional[str]) -> str:
+    return (url or "").rstrip("/").rsplit("/", 1)[-1]
+
+
+def _socket_pos(socket: Optional[str]) -> Optional[int]:
+    s = (socket or "").strip().upper()
+    return SOCKETS.index(s) if s in SOCKETS else None
+
+
+# ------------------- CARGA DEL SET -------------------
+def load_set(set_id: int) -> Optional[Dict[str, Any]]:
+    """Set + items (por Prioridad) + conectores del usuario resueltos por slug, en 3 consultas."""
+    s = fetch_one("""
+        SELECT SetId, UserId, Nombre, TomaPreferida, VentanaCambioMin, Activo
+        FROM dbo.ConjuntosVigilancia WHERE SetId=:id
+    """, id=set_id)
+    if not s:
+        return None
+    items = fetch_all("""
+        SELECT SetItemId, ExternalIdPTP, Prioridad, PreferredSocket
+        FROM dbo.ConjuntoItems WHERE SetId=:id ORDER BY Prioridad ASC, SetItemId ASC
+    """, id=set_id)
+    conns = fetch_all("""
+        SELECT c.ConectorId, c.UrlConector, c.Orden, p.PuntoId, p.UrlPunto
+        FROM dbo.Conectores c
+        JOIN dbo.Puntos p ON p.PuntoId=c.PuntoId
+        WHERE p.UserId=:uid AND c.Activo=1
+        ORDER BY p.PuntoId, c.Orden
+    """, uid=s["UserId"])
+    by_slug: Dict[str, List[Dict[str, Any]]] = {}
+    for c in conns:
+        by_slug.setdefault(_slug(c["UrlPunto"]), []).append(dict(c))
+    out = dict(s)
+    out["items"] = []
+    for it in items:
+        ext = (it["ExternalIdPTP"] or "").strip()
+        pref = _socket_pos(it["PreferredSocket"] or s["TomaPreferida"])
+        out["items"].append({
+            "item_id": it["SetItemId"], "slug": ext, "prioridad": it["Prioridad"] or 0,
+            "pref": pref, "conns": by_slug.get(ext, []),
+        })
+    return out
+
+
+def _rank(item: Dict[str, Any], pos: Optional[int]) -> Tuple[int, int]:
+    """Menor es mejor: prioridad del item y, dentro del item, la toma preferida primero."""
+    return (item["prioridad"], 0 if item["pref"] is None or pos == item["pref"] else 1)
+
+
+def _ordered_conns(item: Dict[str, Any]) -> List[Dict[str, Any]]:
+    conns = sorted(item["conns"], key=lambda c: (c.get("Orden") or 0, c["ConectorId"]))
+    pref = item["pref"]
+    if pref is not None and pref < len(conns):
+        conns = [conns[pref]] + conns[:pref] + conns[pref + 1:]
+    return conns
+
+
+# ------------------- EVALUACIÓN DE UN ITEM -------------------
+def _eval_item(account_id: int, item: Dict[str, Any], deadline: Optional[float] = None,
+               stop: Optional[threading.Event] = None) -> Dict[str, Any]:
+    """
+    Devuelve {"item_id", "free": [(rank, socket_pos, conector_id)], "ms"}.
+    Con punto registrado se escribe el estado en BD como en cualquier refresco.
+    deadline acota cada scrape (y una lectura vencida no se escribe); con stop activado
+    (el tick ya no espera este item) no se empieza ningún scrape más.
+    """
+    t0 = time.time()
+    free: List[Tuple[Tuple[int, int], int, Optional[int]]] = []
+    conns = item["conns"]
+
+    def _go_on() -> bool:
+        # lo ya leído se conserva: se deja de leer, no se descarta
+        return (stop is None or not stop.is_set()) and (deadline is None or time.time() < deadline)
+
+    if conns:
+        sorted_conns = sorted(conns, key=lambda c: (c.get("Orden") or 0, c["ConectorId"]))
+        pos_of = {c["ConectorId"]: i for i, c in enumerate(sorted_conns)}
+        if REFRESH_BY_PUNTO and conns[0].get("UrlPunto") and len(conns) > 1:
+            res = scrape_punto_estados(account_id, conns[0]["PuntoId"], conns[0]["UrlPunto"], sorted_conns,
+                                       deadline=deadline)
+            # los que no casaron con ninguna tarjeta se consultan por conector
+            for c in sorted_conns:
+                if c["ConectorId"] not in res and _go_on():
+                    res[c["ConectorId"]] = fetch_estado(account_id, c["ConectorId"], c["UrlConector"],
+                                                        deadline=deadline)
+            for cid, (estado, _h) in res.items():
+                if estado == LIBRE:
+                    free.append((_rank(item, pos_of[cid]), pos_of[cid], cid))
+        else:
+            # por conector, la toma preferida primero: se corta en la primera libre preferida
+            for c in _ordered_conns(item):
+                if not _go_on():
+                    break
+                estado, _h = fetch_estado(account_id, c["ConectorId"], c["UrlConector"], deadline=deadline)
+                if estado == LIBRE:
+                    pos = pos_of[c["ConectorId"]]
+                    free.append((_rank(item, pos), pos, c["ConectorId"]))
+                    if _rank(item, pos)[1] == 0:
+                        break
+    elif WATCH_PUNTO_URL_TPL:
+        cards = scrape_punto_cards(account_id, WATCH_PUNTO_URL_TPL.format(slug=item["slug"]), label=item["slug"],
+                                   deadline=deadline)
+        for card in cards:
+            if card["estado"] == LIBRE:
+                free.append((_rank(item, card["index"]), card["index"], None))
+    else:
+        logger.warning("watch.item.unresolved item_id=%s slug=%s", item["item_id"], item["slug"])
+    free.sort()
+    return {"item_id": item["item_id"], "free": free, "ms": int((time.time() - t0) * 1000)}
+
+
+# ------------------- TICK -------------------
+def tick_deadline_sec(s: Dict[str, Any], max_sec: Optional[float] = None) -> float:
+    ventana = (s.get("VentanaCambioMin") or 5) * 60 * WATCH_WINDOW_FRACTION
+    return max(1.0, min(ventana, WATCH_TICK_MAX_SEC, max_sec or WATCH_TICK_MAX_SEC))
+
+
+def run_watch_tick(set_id: int, max_sec: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Evalúa en paralelo todos los items de un set activo y devuelve la mejor toma libre:
+    {"set_id", "found": {item_id, slug, socket, conector_id, prioridad} | None, "metrics": {...}}.
+    Se corta en cuanto hay una libre que ningún item pendiente puede mejorar
+    (misma o mejor Prioridad/toma) o al vencer el plazo del tick.
+    """
+    t0 = time.time()
+    # set + cuenta: un checkout; la conexión se suelta antes de los scrapes
+    with unit_of_work():
+        s = load_set(set_id)
+        account_id = cuenta_ptp(s["UserId"]) if s and s["Activo"] else None
+    t_load = time.time()
+    if not s or not s["Activo"]:
+        observe_watch_tick({"skipped": True})
+        return {"set_id": set_id, "found": None, "metrics": {"skipped": True}}
+    if not account_id:
+        logger.warning("watch.no_account set_id=%s user_id=%s", set_id, s["UserId"])
+        observe_watch_tick({"skipped": True})
+        return {"set_id": set_id, "found": None, "metrics": {"skipped": True}}
+
+    items = s["items"]
+    deadline = t0 + tick_deadline_sec(s, max_sec)
+    ex = _get_executor()
+    stop = threading.Event()
+    pending = {ex.submit(_eval_item, account_id, it, deadline, stop): it for it in items}
+    best = None            # (rank, pos, conector_id, item)
+    first_free_ms = None
+    done_n, errors, item_ms = 0, 0, []
+
+    while pending:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        done, _ = wait(list(pending), timeout=remaining, return_when=FIRST_COMPLETED)
+        for fut in done:
+            it = pending.pop(fut)
+            done_n += 1
+            try:
+                r = fut.result()
+            except Exception as e:
+                errors += 1
+                logger.warning("watch.item.fail set_id=%s item_id=%s: %s", set_id, it["item_id"], e)
+                continue
+            item_ms.append(r["ms"])
+            if r["free"]:
+                if first_free_ms is None:
+                    first_free_ms = int((time.time() - t0) * 1000)
+                rank, pos, cid = r["free"][0]
+                if best is None or rank < best[0]:
+                    best = (rank, pos, cid, it)
+        # ningún item pendiente puede mejorar lo encontrado: no se espera por ellos
+        if best is not None and all(_rank(it, it["pref"]) >= best[0] for it in pending.values()):
+            break
+
+    # los que ya corren no se pueden cancelar: se les avisa para que no empiecen otro scrape
+    stop.set()
+    cancelled = sum(1 for f in pending if f.cancel())
+    timed_out = bool(pending) and best is None
+    found = None
+    if best is not None:
+        rank, pos, cid, it = best
+        found = {"item_id": it["item_id"], "slug": it["slug"], "prioridad": it["prioridad"],
+                 "socket": SOCKETS[pos] if pos is not None and pos < len(SOCKETS) else None,
+                 "conector_id": cid}
+
+    item_ms.sort()
+    metrics = {
+        "set_id": set_id, "items": len(items), "evaluated": done_n, "errors": errors,
+        "cancelled": cancelled, "abandoned": len(pending) - cancelled, "timed_out": timed_out,
+        "load_ms": int((t_load - t0) * 1000),
+        "tick_ms": int((time.time() - t0) * 1000),
+        "first_free_ms": first_free_ms,
+        "item_p50_ms": item_ms[len(item_ms) // 2] if item_ms else None,
+        "item_max_ms": item_ms[-1] if item_ms else None,
+        "deadline_ms": int((deadline - t0) * 1000),
+    }
+    logger.info("watch.tick set_id=%s found=%s tick_ms=%s first_free_ms=%s timed_out=%s",
+                set_id, bool(found), metrics["tick_ms"], first_free_ms, timed_out,
+                extra={"extra_dict": metrics})
+    observe_watch_tick(dict(metrics, found=bool(found)))
+    return {"set_id": set_id, "found": found, "metrics": metrics}
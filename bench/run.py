@@ -0,0 +1,356 @@
+# bench/run.py
+"""
+Benchmark de scraping contra el servidor local de fixtures (bench/server.py).
+
+    python -m bench.run                          # todos los escenarios, 20 iteraciones
+    python -m bench.run -n 50 --latency-ms 40    # simula red lenta
+    python -m bench.run --only extract_status,punto --compare bench/results/<anterior>.json
+
+Por fase: p50/p95/p99 y media de latencia, llamadas WebDriver (idas y vueltas al
+navegador), peticiones HTTP que llegaron al servidor y RSS pico del árbol de procesos
+del benchmark (python + chromedriver + chrome). Resultado en bench/results/<utc>-<sha>.json.
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import threading
+import subprocess
+from pathlib import Path
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
+from urllib.parse import urlparse
+
+from .server import FixtureServer, fixture_estado
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+BENCH_EMAIL = "bench@example.com"
+BENCH_PASSWORD = "bench"
+
+SCENARIOS = ("create_driver", "prime_cookies", "extract_status", "punto", "login", "http_login")
+
+# contador global de comandos WebDriver (el benchmark es de un solo hilo)
+_wd_calls = [0]
+
+
+def _count_wd_calls():
+    """Cuenta cada comando WebDriver (una ida y vuelta HTTP a chromedriver)."""
+    from selenium.webdriver.remote.remote_connection import RemoteConnection
+    orig = RemoteConnection.execute
+
+    def execute(self, command, params):
+        _wd_calls[0] += 1
+        return orig(self, command, params)
+
+    RemoteConnection.execute = execute
+
+
+class RssSampler:
+    """Muestrea en segundo plano el RSS del árbol de procesos; peak() da el máximo desde reset()."""
+
+    def __init__(self, interval: float, rss_fn):
+        self.interval = interval
+        self.rss_fn = rss_fn
+        self._peak = 0.0
+        self._stop = threading.Event()
+        self._t = threading.Thread(target=self._loop, name="bench-rss", daemon=True)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, self.rss_fn())
+
+    def start(self):
+        self._t.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def reset(self):
+        self._peak = 0.0
+
+    def peak(self) -> float:
+        return max(self._peak, self.rss_fn())
+
+
+def percentile(sorted_ms: List[float], p: float) -> Optional[float]:
+    """Percentil por rango más cercano (sin interpolar: con pocas muestras es lo honesto)."""
+    if not sorted_ms:
+        return None
+    k = max(0, min(len(sorted_ms) - 1, math.ceil(p / 100.0 * len(sorted_ms)) - 1))
+    return sorted_ms[k]
+
+
+class Bench:
+    def __init__(self, fx: FixtureServer, sampler: RssSampler):
+        self.fx = fx
+        self.sampler = sampler
+        self.samples: Dict[str, List[Dict[str, Any]]] = {}
+        self.errors: Dict[str, int] = {}
+        self.record = True
+
+    @contextmanager
+    def phase(self, name: str):
+        wd0, http0 = _wd_calls[0], self.fx.hits
+        self.sampler.reset()
+        t0 = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            if self.record:
+                self.errors[name] = self.errors.get(name, 0) + 1
+            print(f"[bench] {name} error: {type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''}",
+                  file=sys.stderr)
+            return
+        ms = (time.perf_counter() - t0) * 1000.0
+        if self.record:
+            self.samples.setdefault(name, []).append({
+                "ms": ms, "wd": _wd_calls[0] - wd0, "http": self.fx.hits - http0,
+                "rss_mb": self.sampler.peak(),
+            })
+
+    def check(self, name: str, ok: bool):
+        """Resultado incorrecto (p.ej. estado que no coincide con la fixture): cuenta como error."""
+        if not ok and self.record:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self) -> Dict[str, Any]:
+        out = {}
+        for name in sorted(set(self.samples) | set(self.errors)):
+            rows = self.samples.get(name, [])
+            ms = sorted(r["ms"] for r in rows)
+            n = len(rows)
+            out[name] = {
+                "n": n,
+                "errors": self.errors.get(name, 0),
+                "p50_ms": _r(percentile(ms, 50)),
+                "p95_ms": _r(percentile(ms, 95)),
+                "p99_ms": _r(percentile(ms, 99)),
+                "mean_ms": _r(sum(ms) / n if n else None),
+                "max_ms": _r(ms[-1] if ms else None),
+                "wd_calls": _r(sum(r["wd"] for r in rows) / n if n else None),
+                "http_reqs": _r(sum(r["http"] for r in rows) / n if n else None),
+                "rss_mb_peak": _r(max((r["rss_mb"] for r in rows), default=None)),
+                "samples_ms": [_r(r["ms"]) for r in rows],
+            }
+        return out
+
+
+def urlhost(url: str) -> str:
+    return urlparse(url).hostname or "127.0.0.1"
+
+
+def _r(v: Optional[float]) -> Optional[float]:
+    return round(v, 2) if v is not None else None
+
+
+# ------------------- ESCENARIOS -------------------
+# Cada escenario: fn(bench, ctx, i). ctx guarda el driver "scrape" compartido y la config.
+
+def sc_create_driver(b: Bench, ctx, i):
+    from app.ptp import create_driver
+    for profile in ("scrape", "login"):
+        drv = None
+        with b.phase(f"create_driver.{profile}"):
+            drv = create_driver(ctx["headless"], profile=profile)
+        if drv is not None:
+            drv.quit()
+
+
+def sc_prime_cookies(b: Bench, ctx, i):
+    from app.utils.ptp_cookies import prime_cookies
+    drv = ctx["drv"]
+    drv.delete_all_cookies()
+    with b.phase("prime_cookies"):
+        prime_cookies(drv, ctx["cookies"])
+    b.check("prime_cookies", len(drv.get_cookies()) >= len(ctx["cookies"]))
+
+
+def sc_extract_status(b: Bench, ctx, i):
+    from app.estado import extract_status
+    from app.utils.waits import wait_app_ready
+    drv = ctx["drv"]
+    cid = f"bench-{i % 8 + 1}"
+    # misma carga y espera que estado.scrape_conector_estado
+    with b.phase("conector.load"):
+        drv.get(f"{ctx['base']}/es/conector/{cid}")
+        wait_app_ready(drv, ["lib-status-indicator", "lib-plug-card", "app-charging-stations"], 15)
+    res = None
+    with b.phase("extract_status"):
+        res = extract_status(drv)
+    b.check("extract_status", res is not None and res[0] == fixture_estado(cid)[2])
+
+
+def sc_punto(b: Bench, ctx, i):
+    from app.meta import read_punto_info
+    from app.estado import extract_plug_statuses
+    drv = ctx["drv"]
+    slug = f"zona-{i % 8 + 1}"
+    info = None
+    # la parte de navegador de meta.scrape_punto_info (carga + espera + manifiesto), sin BD
+    with b.phase("scrape_punto_info"):
+        info = read_punto_info(drv, f"{ctx['base']}/es/zona/{slug}")
+    b.check("scrape_punto_info", bool(info and info["nombre"] and info["lat"] is not None
+                                      and info["num_tomas"] == ctx["plugs"]))
+    cards = []
+    with b.phase("extract_plug_statuses"):
+        cards = extract_plug_statuses(drv)
+    b.check("extract_plug_statuses", len(cards) == ctx["plugs"])
+
+
+def sc_login(b: Bench, ctx, i):
+    from app.ptp import login_and_collect_cookies
+    cookies = []
+    with b.phase("login_and_collect_cookies"):
+        cookies = login_and_collect_cookies(BENCH_EMAIL, BENCH_PASSWORD)
+    b.check("login_and_collect_cookies", any(c.get("name") == "auth_token" for c in cookies))
+
+
+def sc_http_login(b: Bench, ctx, i):
+    from app.http_login import http_login_and_collect_cookies
+    cookies = []
+    with b.phase("http_login_and_collect_cookies"):
+        cookies = http_login_and_collect_cookies(BENCH_EMAIL, BENCH_PASSWORD, base=ctx["base"])
+    b.check("http_login_and_collect_cookies", any(c.get("name") == "auth_token" for c in cookies))
+
+
+RUNNERS = {
+    "create_driver": sc_create_driver,
+    "prime_cookies": sc_prime_cookies,
+    "extract_status": sc_extract_status,
+    "punto": sc_punto,
+    "login": sc_login,
+    "http_login": sc_http_login,
+}
+
+# ------------------- RESULTADOS -------------------
+def _git(*args) -> str:
+    try:
+        return subprocess.run(["git", *args], cwd=REPO_DIR, capture_output=True, text=True,
+                              timeout=30).stdout.strip()
+    except Exception:
+        return ""
+
+
+def print_table(phases: Dict[str, Any], prev: Optional[Dict[str, Any]] = None):
+    cols = ("n", "errors", "p50_ms", "p95_ms", "p99_ms", "wd_calls", "http_reqs", "rss_mb_peak")
+    print(f"{'fase':34}" + "".join(f"{c:>12}" for c in cols))
+    for name, st in phases.items():
+        print(f"{name:34}" + "".join(f"{'' if st[c] is None else st[c]:>12}" for c in cols))
+        old = (prev or {}).get(name)
+        if old:
+            deltas = []
+            for c in cols[2:]:
+                a, b = old.get(c), st.get(c)
+                deltas.append(f"{(b - a) / a * 100:+.0f}%" if a and b is not None else "")
+            print(f"{'  vs anterior':34}{'':>12}{'':>12}" + "".join(f"{d:>12}" for d in deltas))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de scraping contra fixtures locales")
+    ap.add_argument("-n", "--iterations", type=int, default=20)
+    ap.add_argument("--warmup", type=int, default=2, help="iteraciones descartadas por escenario")
+    ap.add_argument("--only", default=",".join(SCENARIOS), help=f"escenarios separados por coma: {','.join(SCENARIOS)}")
+    ap.add_argument("--latency-ms", type=int, default=0, help="latencia añadida por petición en el servidor")
+    ap.add_argument("--render-ms", type=int, default=150, help="retardo de pintado de la app simulada")
+    ap.add_argument("--plugs", type=int, default=4, help="tomas por zona")
+    ap.add_argument("--headed", action="store_true", help="Chrome con ventana")
+    ap.add_argument("--rss-interval", type=float, default=0.1)
+    ap.add_argument("--out", default=None, help="fichero JSON (por defecto bench/results/<utc>-<sha>.json)")
+    ap.add_argument("--compare", default=None, help="JSON de una ejecución anterior para mostrar deltas")
+    a = ap.parse_args()
+    only = [s.strip() for s in a.only.split(",") if s.strip()]
+    unknown = [s for s in only if s not in RUNNERS]
+    if unknown:
+        ap.error(f"escenarios desconocidos: {unknown}")
+
+    fx = FixtureServer(latency_ms=a.latency_ms, render_ms=a.render_ms, plugs=a.plugs,
+                       password=BENCH_PASSWORD).start()
+    base = fx.base_url
+    # la config de app.* se lee al importar: apuntarla al servidor local antes de importar nada
+    os.environ["PTP_LOGIN_URL"] = f"{base}/es/entrar?from=bench"
+    os.environ["PTP_AUTH_BASE"] = base
+    os.environ["PTP_AUTH_COOKIE_DOMAIN"] = urlhost(base)
+    os.environ["SELENIUM_HEADLESS"] = "0" if a.headed else "1"
+    os.environ["SNAPSHOT_CAPTURE"] = "0"
+
+    from app.ptp import create_driver
+    from app.driver_pool import tree_rss_mb
+
+    _count_wd_calls()
+    sampler = RssSampler(a.rss_interval, lambda: tree_rss_mb(os.getpid())).start()
+    b = Bench(fx, sampler)
+    host = urlhost(base)
+    ctx = {
+        "base": base, "headless": not a.headed, "plugs": a.plugs,
+        "cookies": [{"name": f"c{k}", "value": "x" * 32, "domain": host, "path": "/",
+                     "secure": False, "httpOnly": k == 0} for k in range(8)],
+    }
+
+    t0 = time.time()
+    drv = None
+    try:
+        if any(s in only for s in ("prime_cookies", "extract_status", "punto")):
+            # driver de scrape compartido, como uno del pool; primera carga para fijar el origen
+            drv = create_driver(ctx["headless"], profile="scrape")
+            drv.get(f"{base}/es/inicio")
+            ctx["drv"] = drv
+        for name in only:
+            fn = RUNNERS[name]
+            for i in range(a.warmup + a.iterations):
+                b.record = i >= a.warmup
+                fn(b, ctx, i)
+            print(f"[bench] {name} ok ({int(time.time() - t0)}s)", file=sys.stderr)
+        browser = (drv.capabilities.get("browserVersion") if drv is not None else None)
+    finally:
+        if drv is not None:
+            drv.quit()
+        sampler.stop()
+        fx.stop()
+
+    sha = _git("rev-parse", "--short", "HEAD") or "nogit"
+    now = datetime.now(timezone.utc)
+    result = {
+        "meta": {
+            "git_sha": sha,
+            "git_dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+            "utc": now.isoformat(timespec="seconds"),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "selenium": _pkg_version("selenium"),
+            "browser": browser,
+            "args": vars(a),
+            "total_sec": round(time.time() - t0, 1),
+            "http_by_kind": fx.snapshot(),
+        },
+        "phases": b.summary(),
+    }
+
+    out = Path(a.out) if a.out else RESULTS_DIR / f"{now.strftime('%Y%m%dT%H%M%SZ')}-{sha}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    prev = None
+    if a.compare:
+        prev = json.loads(Path(a.compare).read_text(encoding="utf-8")).get("phases")
+    print_table(result["phases"], prev)
+    print(f"[bench] resultados en {out}")
+    return 1 if any(st["errors"] for st in result["phases"].values()) else 0
+
+
+def _pkg_version(name: str) -> Optional[str]:
+    try:
+        from importlib.metadata import version
+        return version(name)
+    except Exception:
+        return None
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+# bench/server.py
+import os
+import json
+import time
+import html
+import secrets
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Servidor local de páginas tipo PlaceToPlug para el benchmark (bench/run.py).
+# Solo stdlib: las fixtures son HTML grabado con placeholders {{...}} y la vista se
+# "pinta" por JS tras render_ms, como la app Angular, para que las esperas cuenten.
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+# (clase del indicador, texto visible, estado esperado): sin clase, la cascada de
+# estado.extract_status tiene que llegar hasta la heurística de texto
+ESTADOS = [
+    ("s-light-green", "Libre", "Libre"),
+    ("s-light-red", "Ocupado", "Ocupado"),
+    ("s-light-orange", "Reservado", "Reservado"),
+    ("", "Fuera de servicio", "Averiado"),
+]
+
+# Estado esperado -> valor que devuelve el backend JSON (app/utils/status.py API_STATUS_MAP)
+API_ESTADOS = {"Libre": "available", "Ocupado": "occupied", "Reservado": "reserved", "Averiado": "out_of_order"}
+
+ASSET_BYTES = 64 * 1024
+ASSET_TYPES = {".png": "image/png", ".woff2": "font/woff2", ".js": "application/javascript"}
+
+
+def _render(name: str, **values) -> bytes:
+    s = (FIXTURES_DIR / name).read_text(encoding="utf-8")
+    for k, v in values.items():
+        s = s.replace("{{%s}}" % k, str(v))
+    return s.encode("utf-8")
+
+
+def fixture_estado(key: str, idx: int = 0):
+    """Estado determinista de una toma de las fixtures: (clase, texto, esperado)."""
+    return ESTADOS[(sum(key.encode()) + idx) % len(ESTADOS)]
+
+
+def plug_cards_html(slug: str, n: int) -> str:
+    out = []
+    for i in range(n):
+        cls, txt, _ = fixture_estado(slug, i)
+        cid = f"{slug}-{i + 1}"
+        out.append(
+            f'<lib-plug-card id="{html.escape(cid)}"><div class="plug-icon"></div>'
+            f'<div><div>Tipo 2</div><div>22 kW</div></div>'
+            f'<lib-status-indicator class="{cls}"></lib-status-indicator><span>{txt}</span>'
+            f'<a href="/es/conector/{html.escape(cid)}">Ver</a></lib-plug-card>'
+        )
+    return "\n".join(out)
+
+
+class FixtureServer:
+    """Servidor de fixtures en un hilo; cuenta peticiones para medir idas y vueltas HTTP."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: int = 0,
+                 render_ms: int = 150, plugs: int = 4, password: str = "bench"):
+        self.latency_ms = latency_ms
+        self.render_ms = render_ms
+        self.plugs = plugs
+        self.password = password
+        self.hits = 0
+        self.hits_by_kind: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fx = self
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, kind: str):
+        with self._lock:
+            self.hits += 1
+            self.hits_by_kind[kind] = self.hits_by_kind.get(kind, 0) + 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.hits_by_kind, total=self.hits)
+
+    def start(self) -> "FixtureServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="bench-fixtures", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    @property
+    def fx(self) -> FixtureServer:
+        return self.server.fx
+
+    def _send(self, status: int, body: bytes, ctype: str = "text/html; charset=utf-8", cookies=()):
+        if self.fx.latency_ms:
+            time.sleep(self.fx.latency_ms / 1000.0)
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        for c in cookies:
+            self.send_header("Set-Cookie", c)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        u = urlparse(self.path)
+        parts = [p for p in u.path.split("/") if p]
+        q = parse_qs(u.query)
+        rm = self.fx.render_ms
+
+        if parts[:2] == ["es", "entrar"]:
+            self.fx.count("login")
+            return self._send(200, _render("entrar.html", render_ms=rm),
+                              cookies=[f"XSRF-TOKEN={secrets.token_hex(8)}; Path=/; SameSite=Lax"])
+        if parts[:2] == ["es", "inicio"]:
+            self.fx.count("page")
+            return self._send(200, _render("inicio.html", render_ms=rm))
+        if parts[:2] == ["es", "zona"] and len(parts) == 3:
+            self.fx.count("page")
+            slug = parts[2]
+            n = int(q.get("tomas", [self.fx.plugs])[0])
+            body = _render("zona.html", render_ms=rm, nombre=html.escape(f"Zona {slug}"),
+                           direccion="CALLE BORRIOL, Sant Joan de Moró", proveedor="Iberdrola",
+                           lat="40.0594", lng="-0.1362", cards=plug_cards_html(slug, n))
+            return self._send(200, body)
+        if parts[:2] == ["es", "conector"] and len(parts) == 3:
+            self.fx.count("page")
+            cid = parts[2]
+            cls, txt, _ = fixture_estado(cid)
+            body = _render("conector.html", render_ms=rm, conector_id=html.escape(cid), tipo="Tipo 2",
+                           potencia="22 kW", precio="0,45 €/kWh", status_class=cls, status_text=txt)
+            return self._send(200, body)
+        if parts[:1] == ["plugs"] and len(parts) == 2:
+            # sustituto del backend JSON de estado (fetchers.HttpStatusFetcher, /plugs/{plug_id})
+            self.fx.count("api")
+            if "auth_token=" not in (self.headers.get("Cookie") or ""):
+                return self._send(401, b'{"error":"auth"}', "application/json")
+            pid = parts[1]
+            body = {"data": {"id": pid, "status": API_ESTADOS[fixture_estado(pid)[2]]}}
+            return self._send(200, json.dumps(body).encode(), "application/json")
+        if parts[:1] == ["assets"]:
+            self.fx.count("asset")
+            ext = os.path.splitext(u.path)[1]
+            return self._send(200, b"\0" * ASSET_BYTES, ASSET_TYPES.get(ext, "application/octet-stream"))
+
+        self.fx.count("other")
+        self._send(404, b"not found", "text/plain")
+
+    def do_POST(self):
+        u = urlparse(self.path)
+        if u.path != "/api/auth/login":
+            self.fx.count("other")
+            return self._send(404, b"not found", "text/plain")
+        self.fx.count("auth")
+        try:
+            n = int(self.headers.get("Content-Length") or 0)
+            data = json.loads(self.rfile.read(n) or b"{}")
+        except ValueError:
+            return self._send(400, b'{"error":"json"}', "application/json")
+        if not data.get("email") or data.get("password") != self.fx.password:
+            return self._send(401, b'{"error":"credenciales"}', "application/json")
+        token = secrets.token_hex(16)
+        self._send(200, json.dumps({"token": token}).encode(), "application/json",
+                   cookies=[f"auth_token={token}; Path=/; HttpOnly; SameSite=Lax"])
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Sirve las fixtures del benchmark para pruebas manuales")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency-ms", type=int, default=0)
+    ap.add_argument("--render-ms", type=int, default=150)
+    a = ap.parse_args()
+    fx = FixtureServer(port=a.port, latency_ms=a.latency_ms, render_ms=a.render_ms).start()
+    print(f"[bench-server] {fx.base_url}/es/zona/demo  {fx.base_url}/es/conector/demo-1  {fx.base_url}/es/entrar  "
+          f"{fx.base_url}/plugs/demo-1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fx.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+# gunicorn.conf.py
+# Workers y hooks para métricas multiproceso (app/metrics.py). Gunicorn carga este
+# fichero solo si se arranca desde la raíz del repo o con -c gunicorn.conf.py; las
+# opciones de línea de comandos tienen prioridad.
+import os
+import shutil
+
+# gthread: un stream SSE (/dashboard/estado/stream, hasta EVENTS_STREAM_MAX_SEC)
+# ocupa un hilo, no un worker entero como con la clase sync
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+
+
+def on_starting(server):
+    # valores de una ejecución anterior: /metrics los sumaría a los nuevos
+    d = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if d:
+        shutil.rmtree(d, ignore_errors=True)
+        os.makedirs(d, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # un worker muerto deja de contar en los gauges "live"; sus contadores se conservan
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,12 @@
+-- sql/001_cookies_version.sql
+-- Generación de cookies por cuenta: la incrementa store_cookies_in_db y la
+-- consultan las cachés de get_current_cookies para invalidarse entre procesos.
+IF OBJECT_ID(N'dbo.CookiesPTPVersion', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.CookiesPTPVersion (
+        AccountId   INT       NOT NULL PRIMARY KEY,
+        Generation  BIGINT    NOT NULL DEFAULT 0,
+        UpdatedUtc  DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+    );
+END
+GO
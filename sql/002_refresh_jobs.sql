@@ -0,0 +1,37 @@
+-- sql/002_refresh_jobs.sql
+-- Cola de trabajos de refresco (estado / punto / meta) que encola la web y
+-- ejecuta workers/jobs_run.py, con progreso por conector.
+IF OBJECT_ID(N'dbo.RefreshJobs', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.RefreshJobs (
+        JobId          NVARCHAR(32)   NOT NULL PRIMARY KEY,
+        UserId         INT            NOT NULL,
+        Tipo           NVARCHAR(16)   NOT NULL,          -- estado | punto | meta
+        PayloadJson    NVARCHAR(MAX)  NULL,
+        Estado         NVARCHAR(16)   NOT NULL DEFAULT N'pendiente',  -- pendiente | en_curso | ok | error
+        Total          INT            NOT NULL DEFAULT 0,
+        Hechos         INT            NOT NULL DEFAULT 0,
+        Error          NVARCHAR(MAX)  NULL,
+        ResultJson     NVARCHAR(MAX)  NULL,
+        WorkerId       NVARCHAR(128)  NULL,
+        CreadoUtc      DATETIME2      NOT NULL DEFAULT SYSUTCDATETIME(),
+        IniciadoUtc    DATETIME2      NULL,
+        FinalizadoUtc  DATETIME2      NULL
+    );
+    CREATE INDEX IX_RefreshJobs_Estado ON dbo.RefreshJobs (Estado, CreadoUtc);
+END
+GO
+
+IF OBJECT_ID(N'dbo.RefreshJobItems', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.RefreshJobItems (
+        JobItemId       BIGINT IDENTITY(1,1) PRIMARY KEY,
+        JobId           NVARCHAR(32)   NOT NULL,
+        ConectorId      INT            NULL,              -- NULL: paso a nivel de punto (meta)
+        Estado          NVARCHAR(32)   NULL,
+        Hint            NVARCHAR(MAX)  NULL,
+        ActualizadoUtc  DATETIME2      NOT NULL DEFAULT SYSUTCDATETIME()
+    );
+    CREATE INDEX IX_RefreshJobItems_Job ON dbo.RefreshJobItems (JobId, JobItemId);
+END
+GO
@@ -0,0 +1,53 @@
+-- sql/003_conector_estado_actual.sql
+-- Estado actual materializado: una fila por conector, actualizada en sitio por
+-- estado.save_estado. dbo.EstadosConector pasa a ser solo histórico de
+-- transiciones (+ latido opcional, ESTADO_HEARTBEAT_MIN).
+--
+-- dbo.V_PuntoEstadoActual (app/puntos.py, dashboard de puntos) vive solo en la BD:
+-- se conserva su definición y su agregación tal cual, y solo se cambia la tabla
+-- de origen (EstadosConector -> ConectorEstadoActual, mismas columnas).
+IF OBJECT_ID(N'dbo.ConectorEstadoActual', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.ConectorEstadoActual (
+        ConectorId     INT            NOT NULL PRIMARY KEY,
+        Estado         NVARCHAR(32)   NOT NULL,
+        Precio         DECIMAL(10,4)  NULL,
+        RawHint        NVARCHAR(400)  NULL,
+        CapturedAtUtc  DATETIME2      NOT NULL,   -- última lectura
+        CambioUtc      DATETIME2      NOT NULL,   -- última transición de estado
+        HistoricoUtc   DATETIME2      NOT NULL    -- última fila escrita en EstadosConector
+    );
+    CREATE INDEX IX_ConectorEstadoActual_Cambio ON dbo.ConectorEstadoActual (CambioUtc);
+
+    -- carga inicial desde la última lectura de cada conector
+    INSERT INTO dbo.ConectorEstadoActual (ConectorId, Estado, Precio, RawHint, CapturedAtUtc, CambioUtc, HistoricoUtc)
+    SELECT x.ConectorId, x.Estado, x.Precio, x.RawHint, x.CapturedAtUtc, x.CapturedAtUtc, x.CapturedAtUtc
+    FROM (
+        SELECT e.ConectorId, e.Estado, e.Precio, e.RawHint, e.CapturedAtUtc,
+               ROW_NUMBER() OVER (PARTITION BY e.ConectorId ORDER BY e.CapturedAtUtc DESC) AS rn
+        FROM dbo.EstadosConector e
+    ) x
+    WHERE x.rn = 1;
+END
+GO
+
+CREATE OR ALTER VIEW dbo.V_ConectorEstadoActual AS
+SELECT a.ConectorId, a.Estado, a.Precio, a.RawHint, a.CapturedAtUtc, a.CambioUtc
+FROM dbo.ConectorEstadoActual a;
+GO
+
+-- Misma vista, otra tabla: la agregación de EstadoPunto no cambia
+DECLARE @def NVARCHAR(MAX) = OBJECT_DEFINITION(OBJECT_ID(N'dbo.V_PuntoEstadoActual'));
+IF @def IS NULL
+    PRINT N'dbo.V_PuntoEstadoActual no existe: nada que migrar';
+ELSE IF CHARINDEX(N'ConectorEstadoActual', @def) = 0
+BEGIN
+    IF CHARINDEX(N'EstadosConector', @def) = 0
+        THROW 50003, N'dbo.V_PuntoEstadoActual no lee EstadosConector: revisar a mano', 1;
+    SET @def = REPLACE(@def, N'EstadosConector', N'ConectorEstadoActual');
+    -- "CREATE [OR ALTER] VIEW" -> "CREATE OR ALTER VIEW"
+    DECLARE @c INT = PATINDEX(N'%CREATE%VIEW%', @def);
+    SET @def = STUFF(@def, @c, CHARINDEX(N'VIEW', @def, @c) - @c, N'CREATE OR ALTER ');
+    EXEC sys.sp_executesql @def;
+END
+GO
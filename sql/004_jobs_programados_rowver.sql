@@ -0,0 +1,16 @@
+-- sql/004_jobs_programados_rowver.sql
+-- Watermark para la carga incremental de dbo.JobsProgramados en workers/runner.py:
+-- cualquier INSERT/UPDATE (activar, desactivar, cambiar CronExpr) avanza RowVer.
+IF COL_LENGTH(N'dbo.JobsProgramados', N'RowVer') IS NULL
+BEGIN
+    ALTER TABLE dbo.JobsProgramados ADD RowVer ROWVERSION NOT NULL;
+END
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_JobsProgramados_RowVer'
+               AND object_id = OBJECT_ID(N'dbo.JobsProgramados'))
+BEGIN
+    CREATE INDEX IX_JobsProgramados_RowVer ON dbo.JobsProgramados (RowVer)
+        INCLUDE (UserId, Tipo, CronExpr, Activo);
+END
+GO
@@ -0,0 +1,26 @@
+-- sql/005_conector_polling.sql
+-- Cadencia aprendida por conector para el sondeo adaptativo (app/polling.py):
+-- workers/estado_refresh.py solo consulta los conectores con NextPollUtc vencido.
+IF OBJECT_ID(N'dbo.ConectorPolling', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.ConectorPolling (
+        ConectorId     INT            NOT NULL PRIMARY KEY,
+        IntervalSec    INT            NOT NULL,
+        NextPollUtc    DATETIME2      NOT NULL,
+        LastPollUtc    DATETIME2      NULL,
+        Transiciones   INT            NOT NULL DEFAULT 0,   -- en la ventana POLL_WINDOW_H
+        Vigilado       BIT            NOT NULL DEFAULT 0,   -- referenciado por un set activo
+        ActualizadoUtc DATETIME2      NOT NULL DEFAULT SYSUTCDATETIME()
+    );
+    CREATE INDEX IX_ConectorPolling_Next ON dbo.ConectorPolling (NextPollUtc);
+END
+GO
+
+-- transiciones recientes: EstadosConector por conector y fecha
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_EstadosConector_Conector_Captured'
+               AND object_id = OBJECT_ID(N'dbo.EstadosConector'))
+BEGIN
+    CREATE INDEX IX_EstadosConector_Conector_Captured ON dbo.EstadosConector (ConectorId, CapturedAtUtc)
+        INCLUDE (Estado);
+END
+GO
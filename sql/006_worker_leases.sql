@@ -0,0 +1,29 @@
+-- sql/006_worker_leases.sql
+-- Reparto del sondeo de estados entre procesos/hosts (app/leases.py): cada nodo
+-- late en WorkerNodes y posee leases con caducidad sobre recursos (cuentas PTP).
+-- Si un nodo muere, sus leases caducan y los reclaman los demás.
+IF OBJECT_ID(N'dbo.WorkerNodes', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.WorkerNodes (
+        NodeId        NVARCHAR(128)  NOT NULL,
+        Tipo          NVARCHAR(32)   NOT NULL,          -- estado | ...
+        HeartbeatUtc  DATETIME2      NOT NULL,
+        IniciadoUtc   DATETIME2      NOT NULL DEFAULT SYSUTCDATETIME(),
+        CONSTRAINT PK_WorkerNodes PRIMARY KEY (Tipo, NodeId)
+    );
+END
+GO
+
+IF OBJECT_ID(N'dbo.WorkerLeases', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.WorkerLeases (
+        Tipo          NVARCHAR(32)   NOT NULL,
+        Recurso       INT            NOT NULL,          -- AccountId
+        Owner         NVARCHAR(128)  NULL,
+        ExpiraUtc     DATETIME2      NOT NULL DEFAULT '19000101',
+        AdquiridoUtc  DATETIME2      NULL,
+        CONSTRAINT PK_WorkerLeases PRIMARY KEY (Tipo, Recurso)
+    );
+    CREATE INDEX IX_WorkerLeases_Owner ON dbo.WorkerLeases (Tipo, Owner) INCLUDE (ExpiraUtc);
+END
+GO
@@ -0,0 +1,32 @@
+-- sql/007_cookie_refresh.sql
+-- Renovación de cookies (app/cookie_refresh.py): estado por cuenta con backoff
+-- exponencial tras fallos, e histórico de intentos.
+IF OBJECT_ID(N'dbo.CookieRefreshEstado', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.CookieRefreshEstado (
+        AccountId          INT             NOT NULL PRIMARY KEY,
+        FallosSeguidos     INT             NOT NULL DEFAULT 0,
+        UltimoIntentoUtc   DATETIME2       NULL,
+        UltimoOkUtc        DATETIME2       NULL,
+        ProximoIntentoUtc  DATETIME2       NULL,      -- NULL = sin backoff
+        UltimoError        NVARCHAR(1000)  NULL
+    );
+END
+GO
+
+IF OBJECT_ID(N'dbo.CookieRefreshIntentos', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.CookieRefreshIntentos (
+        IntentoId    BIGINT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+        AccountId    INT             NOT NULL,
+        InicioUtc    DATETIME2       NOT NULL,
+        DuracionMs   INT             NOT NULL,
+        Ok           BIT             NOT NULL,
+        Guardadas    INT             NULL,
+        AuthToken    BIT             NULL,
+        Error        NVARCHAR(1000)  NULL,
+        WorkerId     NVARCHAR(128)   NULL
+    );
+    CREATE INDEX IX_CookieRefreshIntentos_Account ON dbo.CookieRefreshIntentos (AccountId, InicioUtc);
+END
+GO
@@ -0,0 +1,18 @@
+-- sql/008_snapshots.sql
+-- Índice de snapshots de página (app/snapshots.py). El HTML va comprimido en
+-- disco (SNAPSHOT_DIR/<sha[:2]>/<sha>.html.gz); varias capturas idénticas
+-- comparten fichero. Lo usan workers/snapshot_backfill.py para re-parsear offline.
+IF OBJECT_ID(N'dbo.Snapshots', N'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.Snapshots (
+        SnapshotId     BIGINT IDENTITY(1,1) NOT NULL PRIMARY KEY,
+        Sha256         CHAR(64)        NOT NULL,
+        Tipo           NVARCHAR(16)    NOT NULL,      -- conector | punto
+        RefId          INT             NULL,          -- ConectorId / PuntoId
+        Url            NVARCHAR(1000)  NULL,
+        Bytes          INT             NOT NULL,      -- HTML sin comprimir
+        CapturedAtUtc  DATETIME2       NOT NULL DEFAULT SYSUTCDATETIME()
+    );
+    CREATE INDEX IX_Snapshots_Tipo_Ref ON dbo.Snapshots (Tipo, RefId, CapturedAtUtc) INCLUDE (Sha256);
+END
+GO
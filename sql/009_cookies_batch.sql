@@ -0,0 +1,19 @@
+-- sql/009_cookies_batch.sql
+-- Lote de cookies (store_cookies_in_db): las filas de un mismo guardado comparten
+-- BatchId; la invalidación de las vigentes y la activación del lote se hacen por él.
+IF COL_LENGTH(N'dbo.CookiesPTP', N'BatchId') IS NULL
+BEGIN
+    ALTER TABLE dbo.CookiesPTP ADD BatchId UNIQUEIDENTIFIER NULL;
+END
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = N'IX_CookiesPTP_Batch' AND object_id = OBJECT_ID(N'dbo.CookiesPTP'))
+BEGIN
+    CREATE INDEX IX_CookiesPTP_Batch ON dbo.CookiesPTP (AccountId, BatchId) WHERE BatchId IS NOT NULL;
+END
+GO
+
+-- Lotes que nunca se activaron (se buscaban por LastLoginUtc y no casaban): fuera de juego
+UPDATE dbo.CookiesPTP SET IsValid = 0
+WHERE IsCurrent = 0 AND IsValid = 1 AND BatchId IS NULL;
+GO
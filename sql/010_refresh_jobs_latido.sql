@@ -0,0 +1,14 @@
+-- sql/010_refresh_jobs_latido.sql
+-- Reclamar trabajos de refresco solo cuando su worker deja de latir (LatidoUtc, que
+-- renuevan start/report) y como mucho JOBS_MAX_ATTEMPTS veces (Intentos).
+IF COL_LENGTH(N'dbo.RefreshJobs', N'LatidoUtc') IS NULL
+BEGIN
+    ALTER TABLE dbo.RefreshJobs ADD LatidoUtc DATETIME2 NULL;
+END
+GO
+
+IF COL_LENGTH(N'dbo.RefreshJobs', N'Intentos') IS NULL
+BEGIN
+    ALTER TABLE dbo.RefreshJobs ADD Intentos INT NOT NULL CONSTRAINT DF_RefreshJobs_Intentos DEFAULT 0;
+END
+GO
@@ -0,0 +1,37 @@
+# tests/test_cookie_refresh.py
+# Backoff de los logins fallidos (app/utils/cadence.py, sin BD).
+# Los valores esperados usan la configuración por defecto (300 s de base, 6 h de techo).
+import random
+
+import pytest
+
+from app.utils import cadence
+from app.utils.cadence import backoff_sec
+
+pytestmark = pytest.mark.skipif(
+    (cadence.COOKIE_REFRESH_BACKOFF_SEC, cadence.COOKIE_REFRESH_BACKOFF_MAX_SEC) != (300, 6 * 3600),
+    reason="COOKIE_REFRESH_BACKOFF_* distintos de los valores por defecto")
+
+
+@pytest.mark.parametrize("fallos", [0, -1])
+def test_sin_fallos_sin_espera(fallos):
+    assert backoff_sec(fallos) == 0
+
+
+@pytest.mark.parametrize("fallos, base", [
+    (1, 300), (2, 600), (3, 1200), (4, 2400), (5, 4800), (6, 9600), (7, 19200),
+    (8, 21600), (9, 21600), (30, 21600), (10 ** 6, 21600),
+])
+def test_crece_al_doble_hasta_el_techo(monkeypatch, fallos, base):
+    # jitter en sus extremos: -20% / sin jitter / +20%
+    for factor in (0.8, 1.0, 1.2):
+        monkeypatch.setattr(cadence.random, "uniform", lambda a, b, f=factor: f)
+        assert backoff_sec(fallos) == int(base * factor)
+
+
+def test_jitter_acotado_y_disperso():
+    random.seed(2024)
+    for fallos, base in ((1, 300), (4, 2400), (12, 21600)):
+        vals = [backoff_sec(fallos) for _ in range(300)]
+        assert all(int(base * 0.8) <= v <= int(base * 1.2) for v in vals)
+        assert len(set(vals)) > 10      # reintentos no sincronizados
@@ -0,0 +1,73 @@
+# tests/test_estado.py
+# Emparejado de tarjetas de un punto con sus conectores (app/utils/status.py, sin dependencias)
+import pytest
+
+from app.utils.status import url_key, match_cards
+
+
+def _card(i, *keys):
+    return {"index": i, "keys": list(keys), "estado": "Libre", "hint": f"card{i}"}
+
+
+def _conn(cid, url):
+    return {"ConectorId": cid, "UrlConector": url}
+
+
+# ------------------- url_key -------------------
+@pytest.mark.parametrize("url, key", [
+    ("https://placetoplug.com/es/conector/abc-123", "abc-123"),
+    ("https://placetoplug.com/es/conector/abc-123/", "abc-123"),
+    ("https://placetoplug.com/es/conector/abc-123//", "abc-123"),
+    ("https://placetoplug.com/es/conector/abc-123?lang=es&x=1", "abc-123"),
+    ("https://placetoplug.com/es/conector/abc-123/?lang=es", "abc-123"),
+    ("https://placetoplug.com/es/conector/abc-123#mapa", "abc-123"),
+    ("abc-123", "abc-123"),
+    ("", ""),
+    (None, ""),
+])
+def test_url_key(url, key):
+    assert url_key(url) == key
+
+
+# ------------------- match_cards -------------------
+def test_match_por_clave_exacta_no_por_posicion():
+    cards = [_card(0, "b-2"), _card(1, "a-1")]
+    conns = [_conn(10, "https://x/es/conector/a-1"), _conn(11, "https://x/es/conector/b-2/")]
+    out = match_cards(cards, conns)
+    assert out[10]["index"] == 1
+    assert out[11]["index"] == 0
+
+
+def test_match_cualquier_clave_de_la_tarjeta():
+    cards = [_card(0, "", "evse-9", "plug-7")]
+    out = match_cards(cards, [_conn(10, "https://x/es/conector/plug-7?ref=mapa")])
+    assert out[10]["index"] == 0
+
+
+def test_match_clave_parcial_no_casa():
+    cards = [_card(0, "a-12"), _card(1, "xa-1")]
+    assert match_cards(cards, [_conn(10, "https://x/es/conector/a-1")]) == {}
+
+
+def test_no_casados_no_aparecen():
+    cards = [_card(0, "a-1")]
+    conns = [_conn(10, "https://x/es/conector/a-1"), _conn(11, "https://x/es/conector/zz"),
+             _conn(12, None)]
+    assert set(match_cards(cards, conns)) == {10}
+
+
+def test_sin_url_no_casa_con_tarjeta_sin_clave():
+    cards = [_card(0, ""), _card(1)]
+    assert match_cards(cards, [_conn(10, None), _conn(11, "")]) == {}
+
+
+def test_clave_duplicada_en_tarjetas_gana_la_primera():
+    cards = [_card(0, "a-1"), _card(1, "a-1")]
+    out = match_cards(cards, [_conn(10, "https://x/es/conector/a-1")])
+    assert out[10]["index"] == 0
+
+
+def test_clave_duplicada_en_conectores_una_tarjeta_un_conector():
+    cards = [_card(0, "a-1")]
+    conns = [_conn(10, "https://x/es/conector/a-1"), _conn(11, "https://y/es/conector/a-1/")]
+    assert set(match_cards(cards, conns)) == {10}
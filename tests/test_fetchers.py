@@ -0,0 +1,90 @@
+# tests/test_fetchers.py
+# python -m pytest tests  (desde la raíz del repo)
+# El parseo (app/utils/status.py) no necesita dependencias; el fetcher HTTP, requirements.txt.
+import pytest
+
+from app.utils.status import parse_status_payload as parse, plug_id_from_url, FetchSchemaError
+from bench.server import FixtureServer, fixture_estado, API_ESTADOS
+
+
+# ------------------- parse_status_payload -------------------
+def test_parse_status_en_raiz():
+    assert parse({"status": "available"}) == ("Libre", "api:status=available")
+
+
+@pytest.mark.parametrize("wrapper", ["data", "plug", "result"])
+def test_parse_status_anidado(wrapper):
+    assert parse({wrapper: {"state": "Charging"}})[0] == "Ocupado"
+
+
+def test_parse_normaliza_guiones_y_espacios():
+    assert parse({"status": "out-of-order"})[0] == "Averiado"
+    assert parse({"availability": "Out Of Order"})[0] == "Averiado"
+
+
+def test_parse_acepta_etiquetas_propias():
+    assert parse({"status": "No disponible"})[0] == "No disponible"
+    assert parse({"status": "fuera de servicio"})[0] == "Averiado"
+
+
+def test_parse_valor_desconocido_sigue_con_otras_claves():
+    assert parse({"status": "weird", "state": "reserved"}) == ("Reservado", "api:state=reserved")
+    assert parse({"status": "weird", "data": {"status": "free"}})[0] == "Libre"
+
+
+def test_parse_solo_valores_desconocidos():
+    with pytest.raises(FetchSchemaError, match="desconocido"):
+        parse({"status": "weird", "data": {"state": "rare"}})
+
+
+@pytest.mark.parametrize("payload", [{}, {"status": ""}, {"status": 3}, [], "available", None])
+def test_parse_sin_campo_de_estado(payload):
+    with pytest.raises(FetchSchemaError):
+        parse(payload)
+
+
+def test_parse_cubre_los_valores_del_sustituto():
+    for label, val in API_ESTADOS.items():
+        assert parse({"data": {"status": val}})[0] == label
+
+
+# ------------------- HttpStatusFetcher contra bench/server.py -------------------
+@pytest.fixture(scope="module")
+def fetchers():
+    return pytest.importorskip("app.fetchers")
+
+
+@pytest.fixture(scope="module")
+def fx():
+    srv = FixtureServer().start()
+    yield srv
+    srv.stop()
+
+
+def _fetcher(fetchers, fx, cookies):
+    return fetchers.HttpStatusFetcher(api_base=fx.base_url, timeout=5, cookies_fn=lambda aid: cookies)
+
+
+def test_fetch_contra_sustituto(fetchers, fx):
+    f = _fetcher(fetchers, fx, [{"name": "auth_token", "value": "t"}])
+    try:
+        for cid in ("zona-1-1", "zona-1-2", "zona-2-3", "demo-1"):
+            estado, hint = f.fetch(1, 1, f"{fx.base_url}/es/conector/{cid}")
+            assert estado == fixture_estado(cid)[2]
+            assert hint.startswith("api:status=")
+    finally:
+        f.close()
+
+
+def test_fetch_sin_cookies_es_error_de_auth(fetchers, fx):
+    f = _fetcher(fetchers, fx, [])
+    try:
+        with pytest.raises(fetchers.FetchAuthError):
+            f.fetch(1, 1, f"{fx.base_url}/es/conector/zona-1-1")
+    finally:
+        f.close()
+
+
+def test_plug_id_from_url():
+    assert plug_id_from_url("https://placetoplug.com/es/conector/abc-123/") == "abc-123"
+    assert plug_id_from_url("https://placetoplug.com/es/conector?plugId=77") == "77"
@@ -0,0 +1,60 @@
+# tests/test_polling.py
+# Intervalo de sondeo adaptativo (app/utils/cadence.py, sin BD).
+# Los valores esperados usan la configuración por defecto (POLL_* sin definir en el entorno).
+import pytest
+
+from app.utils import cadence
+from app.utils.cadence import compute_interval
+
+pytestmark = pytest.mark.skipif(
+    (cadence.POLL_MIN_SEC, cadence.POLL_MAX_SEC, cadence.POLL_WATCHED_MAX_SEC, cadence.POLL_WINDOW_H,
+     cadence.POLL_SAMPLES_PER_CHANGE, cadence.POLL_SMOOTHING) != (60, 3600, 120, 24, 4.0, 0.5),
+    reason="POLL_* distintos de los valores por defecto")
+
+
+@pytest.mark.parametrize("transitions, estado, watched, prev, expected", [
+    # sin cambios en la ventana: techo
+    (0, "Libre", False, None, 3600),
+    (-1, "Libre", False, None, 3600),
+    # 24 cambios/24 h, 4 lecturas por cambio: 900 s
+    (24, "Libre", False, None, 900),
+    (96, "Ocupado", False, None, 225),
+    (24, "Estado raro", False, None, 900),
+    # factor por estado
+    (24, "No disponible", False, None, 2700),
+    (48, "Averiado", False, None, 1800),
+    (24, "Averiado", False, None, 3600),
+    (12, "Averiado", False, None, 3600),
+    # suelo
+    (10000, "Libre", False, None, 60),
+    # vigilado: techo POLL_WATCHED_MAX_SEC
+    (0, "Libre", True, None, 120),
+    (24, "Libre", True, None, 120),
+    (10000, "Libre", True, None, 60),
+    (0, "Averiado", True, 3600, 120),
+    # sin lectura fiable: suelo, sin heredar el intervalo anterior
+    (0, None, False, None, 60),
+    (24, "Error", False, 3000, 60),
+    (0, "Desconocido", True, 3000, 60),
+    # suavizado con el intervalo anterior (EWMA 0.5)
+    (24, "Libre", False, 1800, 1350),
+    (0, "Libre", False, 600, 2100),
+    (10000, "Libre", False, 100, 60),
+    (24, "Libre", True, 1800, 120),
+])
+def test_compute_interval(transitions, estado, watched, prev, expected):
+    assert compute_interval(transitions, estado, watched, prev) == expected
+
+
+def test_ventana_distinta():
+    assert compute_interval(12, "Libre", False, window_h=12) == 900
+    assert compute_interval(12, "Libre", False, window_h=48) == 3600
+
+
+def test_siempre_entero_y_dentro_de_limites():
+    for t in range(0, 2000, 37):
+        for estado in ("Libre", "Ocupado", "Averiado", None):
+            for watched in (False, True):
+                iv = compute_interval(t, estado, watched, prev_interval=(t * 7) % 4000 or None)
+                assert isinstance(iv, int)
+                assert 60 <= iv <= (120 if watched else 3600)
@@ -0,0 +1,118 @@
+# tests/test_scheduler.py
+# Intervalos de CronExpr y heap de ejecuciones (app/utils/cron.py, sin BD)
+import random
+
+import pytest
+
+from app.utils import cron
+from app.utils.cron import parse_cron, JobHeap, SCHED_MAX_CATCHUP
+
+
+# ------------------- parse_cron -------------------
+@pytest.mark.parametrize("expr, sec", [
+    ("@every 60s", 60), ("@every 5m", 300), ("@every 2h", 7200), ("@every 1d", 86400),
+    ("@every 500ms", 0.5), ("@every 30", 30), ("@EVERY 10S", 10), ("@every  7 m", 420),
+    ("@minutely", 60), ("@hourly", 3600), ("@daily", 86400), ("  @Hourly ", 3600),
+    ("*/15 * * * *", 900), ("*/1 * * * *", 60),
+])
+def test_parse_cron(expr, sec):
+    assert parse_cron(expr) == sec
+
+
+@pytest.mark.parametrize("expr", [
+    None, "", "   ", "@weekly", "@every", "@every 5x", "@every -5s", "@every 0s",
+    "*/0 * * * *", "0 * * * *", "*/5 * * *", "*/5 * * * * *", "cada 5 minutos",
+])
+def test_parse_cron_no_reconocida(expr):
+    assert parse_cron(expr) is None
+
+
+# ------------------- JobHeap -------------------
+def _row(jid=1, cron_expr="@every 60s", activo=True, payload=None):
+    return {"JobId": jid, "UserId": 7, "Tipo": "watch", "CronExpr": cron_expr,
+            "PayloadJson": payload, "Activo": activo}
+
+
+@pytest.fixture
+def heap(monkeypatch):
+    # primera ejecución al principio de su intervalo y sin jitter: tiempos exactos
+    monkeypatch.setattr(cron.random, "uniform", lambda a, b: a)
+    return JobHeap(jitter_pct=0, default_policy="run_once")
+
+
+def _runs(heap, now):
+    return [(job.job_id, n) for job, n in heap.pop_due(now)]
+
+
+def test_alta_y_primera_ejecucion(heap):
+    heap.apply(_row(), now=1000)
+    assert heap.jobs[1].next_run == 1000
+    assert heap.seconds_until_next(990) == 10
+    assert _runs(heap, 999) == []
+    assert _runs(heap, 1000) == [(1, 1)]
+
+
+def test_a_tiempo_se_reprograma_en_la_rejilla(heap):
+    heap.apply(_row(), now=1000)
+    assert _runs(heap, 1005) == [(1, 1)]
+    assert heap.jobs[1].next_run == 1060
+    assert _runs(heap, 1059) == []
+    assert _runs(heap, 1060) == [(1, 1)]
+    assert heap.jobs[1].next_run == 1120
+
+
+@pytest.mark.parametrize("policy, missed, runs", [
+    ("run_once", 3, 1),
+    ("skip", 3, 0),
+    ("catchup", 1, 2),
+    ("catchup", 10, SCHED_MAX_CATCHUP),
+])
+def test_politica_de_perdidas(heap, policy, missed, runs):
+    heap.apply(_row(payload='{"MissedPolicy": "%s"}' % policy), now=1000)
+    now = 1000 + missed * 60 + 5
+    assert _runs(heap, now) == ([(1, runs)] if runs else [])
+    # siguiente en la rejilla del intervalo, después de now
+    assert heap.jobs[1].next_run == 1000 + (missed + 1) * 60
+
+
+def test_politica_por_defecto_si_el_payload_no_es_valido(heap):
+    heap.apply(_row(jid=1, payload='{"MissedPolicy": "nunca"}'), now=1000)
+    heap.apply(_row(jid=2, payload="no es json"), now=1000)
+    assert heap.jobs[1].policy == heap.jobs[2].policy == "run_once"
+    assert JobHeap(default_policy="otra").default_policy == "run_once"
+
+
+def test_en_curso_no_se_solapa(heap):
+    heap.apply(_row(), now=1000)
+    heap.jobs[1].running = True
+    assert _runs(heap, 1000) == []
+    assert heap.jobs[1].next_run == 1060
+
+
+def test_baja_y_cron_no_soportada(heap):
+    heap.apply(_row(jid=1), now=1000)
+    heap.apply(_row(jid=2, cron_expr="0 * * * *"), now=1000)
+    assert set(heap.jobs) == {1}
+    heap.apply(_row(jid=1, activo=False), now=1010)
+    assert heap.jobs == {}
+    # la entrada vieja del heap se descarta
+    assert heap.seconds_until_next(1010) is None
+    assert _runs(heap, 5000) == []
+
+
+def test_cambio_de_intervalo_adelanta_la_siguiente(heap):
+    heap.apply(_row(cron_expr="@hourly"), now=1000)
+    assert _runs(heap, 1000) == [(1, 1)]
+    assert heap.jobs[1].next_run == 4600
+    heap.apply(_row(cron_expr="@every 60s"), now=1010)
+    assert heap.jobs[1].next_run == 1070
+    assert _runs(heap, 1070) == [(1, 1)]
+
+
+def test_jitter_acotado():
+    h = JobHeap(jitter_pct=0.1)
+    random.seed(12345)
+    vals = [h._jittered(100.0) for _ in range(500)]
+    assert all(90.0 <= v <= 110.0 for v in vals)
+    assert max(vals) - min(vals) > 10     # hay dispersión real
+    assert JobHeap(jitter_pct=0)._jittered(100.0) == 100.0
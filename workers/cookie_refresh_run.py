@@ -1,26 +1,21 @@
 import os
-from datetime import datetime, timezone, timedelta
-from app.db import fetch_all, fetch_one
-from app.ptp import selenium_login_and_store_cookies
-from app.utils.crypto import decrypt_str
+import logging
+from app.cookie_refresh import refresh_due, COOKIE_REFRESH_WORKERS
+from app.logging import DBHandler, RequestContextFilter
+from dotenv import load_dotenv
 
-def due_accounts():
-    # Buscar cookies "vigentes" que vencen en <= 24h por AccountId
-    rows = fetch_all("""
-    SELECT DISTINCT a.AccountId, a.EmailPTP, c.PasswordEnc
-    FROM dbo.CuentasPTP a
-    JOIN dbo.CredencialesPTP c ON c.AccountId=a.AccountId
-    LEFT JOIN dbo.CookiesPTP k ON k.AccountId=a.AccountId AND k.IsCurrent=1 AND k.Name=N'auth_token'
-    WHERE (k.ExpiryUtc IS NULL OR k.ExpiryUtc <= DATEADD(hour, 24, SYSUTCDATETIME()))
-    """)
-    return rows
+load_dotenv("/opt/reservas4/repo/.env")
+logger = logging.getLogger("cookie_refresh")
+h = DBHandler(); h.addFilter(RequestContextFilter()); h.setLevel(logging.INFO)
+logger.addHandler(h); logger.setLevel(logging.INFO)
 
 def main():
-    for r in due_accounts():
-        pwd = decrypt_str(r["PasswordEnc"])
-        print(f"[cookie-refresh] Renovando AccountId={r['AccountId']} ({r['EmailPTP']})...")
-        total, ok = selenium_login_and_store_cookies(r["AccountId"], r["EmailPTP"], pwd)
-        print(f"[cookie-refresh] Guardadas={total} auth_token={'OK' if ok else 'NO'}")
+    # cuentas por orden de caducidad del auth_token, varios logins en paralelo;
+    # un fallo no corta la pasada: queda registrado y la cuenta entra en backoff
+    for r in refresh_due(COOKIE_REFRESH_WORKERS):
+        print(f"[cookie-refresh] AccountId={r['account_id']} ok={r['ok']} "
+              f"guardadas={r['guardadas']} auth_token={'OK' if r['auth_token'] else 'NO'}"
+              + (f" error={r['error']}" if r["error"] else ""))
 
 if __name__ == "__main__":
     main()
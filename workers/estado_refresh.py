@@ -1,16 +1,39 @@
-import os
-from app.db import fetch_all
-from app.estado import scrape_conector_estado
+import os, time
+from itertools import groupby
+from app.db import fetch_all, unit_of_work
+from app.refresh import refresh_conectores
+from app.polling import due_conectores, reschedule
+from app.leases import LeaseManager
+from app.driver_pool import get_pool
+from app.metrics import serve_worker_metrics
 import logging
 from app.logging import DBHandler, RequestContextFilter
 from dotenv import load_dotenv
 
 load_dotenv("/opt/reservas4/repo/.env")
+# 1: solo conectores con sondeo vencido (app/polling.py); 0: todos los activos en cada pasada
+ADAPTIVE = os.getenv("POLL_ADAPTIVE", "1") == "1"
+LOOP_SEC = int(os.getenv("ESTADO_REFRESH_LOOP_SEC", "0"))   # >0: proceso residente en vez de cron
+BATCH = int(os.getenv("POLL_BATCH", "500"))
+# reparto de cuentas entre varias copias de este worker (dbo.WorkerLeases); 0 = este nodo lo hace todo.
+# En una pasada suelta (LOOP_SEC=0) solo se reparten las copias que arrancan dentro de
+# LEASE_JOIN_GRACE_SEC unas de otras; para un reparto estable usar ESTADO_REFRESH_LOOP_SEC>0.
+SHARDED = os.getenv("ESTADO_SHARDED", "1") == "1"
+
 logger = logging.getLogger("estado_refresh")
 h = DBHandler(); h.addFilter(RequestContextFilter()); h.setLevel(logging.INFO)
 logger.addHandler(h); logger.setLevel(logging.INFO)
+logging.getLogger("polling").addHandler(h); logging.getLogger("polling").setLevel(logging.INFO)
+logging.getLogger("leases").addHandler(h); logging.getLogger("leases").setLevel(logging.INFO)
 
-def main():
+def _refresh(account_id, conns):
+    results = refresh_conectores(account_id, conns)
+    for r in results:
+        if r["estado"] == "Error":
+            logger.error("estado_refresh error conector_id=%s: %s", r["conector_id"], r["hint"])
+    return results
+
+def run_all():
     # recorre todos los usuarios con cuenta PTP
     users = fetch_all("""
       SELECT DISTINCT a.UserId, a.AccountId
@@ -18,19 +41,58 @@ def main():
       JOIN dbo.CredencialesPTP c ON c.AccountId=a.AccountId
     """)
     for u in users:
-        account_id = u["AccountId"]
         conns = fetch_all("""
-          SELECT c.ConectorId, c.UrlConector
+          SELECT c.ConectorId, c.UrlConector, c.Orden, p.PuntoId, p.UrlPunto
           FROM dbo.Conectores c
           JOIN dbo.Puntos p ON p.PuntoId=c.PuntoId
           WHERE p.UserId=:uid AND c.Activo=1
           ORDER BY p.PuntoId, c.Orden, c.ConectorId
         """, uid=u["UserId"])
-        for c in conns:
+        _refresh(u["AccountId"], conns)
+
+def run_due(leases=None):
+    accts = leases.rebalance() if leases else None
+    if accts is not None and not accts:
+        logger.info("estado_refresh sin cuentas asignadas")
+        return
+    due = sorted(due_conectores(BATCH, accts), key=lambda c: (c["AccountId"], c["PuntoId"], c["Orden"] or 0))
+    logger.info("estado_refresh due=%s", len(due))
+    for account_id, grp in groupby(due, key=lambda c: c["AccountId"]):
+        if leases and not leases.holds(account_id):
+            continue   # lease perdido durante la pasada: ya es de otro nodo
+        results = _refresh(account_id, list(grp))
+        try:
+            # estadísticas + MERGE de cadencias: una conexión y un commit por cuenta
+            with unit_of_work():
+                reschedule(results)
+        except Exception as e:
+            logger.error("estado_refresh reschedule error account_id=%s: %s", account_id, e, exc_info=True)
+
+def main():
+    if LOOP_SEC > 0:
+        # solo en bucle: una pasada suelta termina antes de que nadie la raspe
+        serve_worker_metrics()
+    leases = LeaseManager("estado") if (ADAPTIVE and SHARDED) else None
+    if leases:
+        leases.start()
+    try:
+        while True:
+            t0 = time.time()
             try:
-                scrape_conector_estado(account_id, c["ConectorId"], c["UrlConector"])
+                run_due(leases) if ADAPTIVE else run_all()
             except Exception as e:
-                logger.error("estado_refresh error conector_id=%s: %s", c["ConectorId"], e, exc_info=True)
+                if LOOP_SEC <= 0:
+                    raise
+                logger.error("estado_refresh error: %s", e, exc_info=True)
+            if LOOP_SEC <= 0:
+                return
+            time.sleep(max(1.0, LOOP_SEC - (time.time() - t0)))
+    finally:
+        if leases:
+            leases.stop()
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        get_pool().shutdown()
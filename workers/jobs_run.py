@@ -0,0 +1,37 @@
+import os, time
+import logging
+from app.jobs import DBJobStore, run_job
+from app.driver_pool import get_pool
+from app.metrics import serve_worker_metrics
+from app.logging import DBHandler, RequestContextFilter
+from dotenv import load_dotenv
+
+load_dotenv("/opt/reservas4/repo/.env")
+POLL_SEC = float(os.getenv("JOBS_POLL_SEC", "1"))
+
+logger = logging.getLogger("jobs_run")
+h = DBHandler(); h.addFilter(RequestContextFilter()); h.setLevel(logging.INFO)
+logger.addHandler(h); logger.setLevel(logging.INFO)
+logging.getLogger("jobs").addHandler(h); logging.getLogger("jobs").setLevel(logging.INFO)
+
+def main():
+    # ejecuta los trabajos de refresco encolados por la web (JOBS_BACKEND=db)
+    store = DBJobStore()
+    logger.info("jobs_run iniciado", extra={"extra_dict": {"poll_sec": POLL_SEC}})
+    serve_worker_metrics()
+    while True:
+        try:
+            job = store.claim()
+        except Exception as e:
+            logger.error("jobs_run claim error: %s", e, exc_info=True)
+            job = None
+        if not job:
+            time.sleep(POLL_SEC)
+            continue
+        run_job(job, store)
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        get_pool().shutdown()
@@ -1,9 +1,14 @@
-import os, time, json, logging
-from datetime import datetime, timezone
+import os, time, logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from app.logging import DBHandler, RequestContextFilter  # reutilizamos
-from app.db import fetch_all
+from app.scheduler import run_scheduler
+from app.watch import run_watch_tick
+from app.metrics import serve_worker_metrics
 
+# cada cuánto se leen altas/cambios de dbo.JobsProgramados (no la frecuencia de los jobs: esa es su CronExpr)
 INTERVAL = int(os.getenv("WORKER_INTERVAL_SEC", "60"))
+SCHED_WORKERS = int(os.getenv("SCHED_WORKERS", "4"))
 
 logger = logging.getLogger("workers")
 handler = DBHandler()
@@ -11,35 +16,34 @@ handler.setLevel(logging.INFO)
 handler.addFilter(RequestContextFilter())   # inyecta user_id/path = None en workers
 logger.addHandler(handler)
 logger.setLevel(logging.INFO)
+logging.getLogger("scheduler").addHandler(handler)
+logging.getLogger("scheduler").setLevel(logging.INFO)
+logging.getLogger("watch").addHandler(handler)
+logging.getLogger("watch").setLevel(logging.INFO)
+
+def run_watch(job):
+    set_id = job.payload.get("SetId")
+    if not set_id:
+        logger.warning("Job con payload inválido", extra={"extra_dict":{"job_id": job.job_id}})
+        return
+    # el tick termina antes de la siguiente ejecución del job
+    res = run_watch_tick(int(set_id), max_sec=job.interval * 0.9)
+    found = res["found"]
+    if found:
+        logger.info("toma libre", extra={"extra_dict":{"set_id": set_id, "job_id": job.job_id, **found}})
+
+HANDLERS = {"watch": run_watch}
 
 def main():
-    logger.info("worker iniciado", extra={"extra_dict":{"interval_sec": INTERVAL}})
-    print("[worker] iniciado, interval:", INTERVAL, "s")
-    
-    while True:
+    logger.info("worker iniciado", extra={"extra_dict":{"sync_sec": INTERVAL, "workers": SCHED_WORKERS}})
+    print("[worker] iniciado, sync:", INTERVAL, "s")
+    serve_worker_metrics()
+    stop = threading.Event()
+    with ThreadPoolExecutor(max_workers=SCHED_WORKERS, thread_name_prefix="sched") as ex:
         try:
-            jobs = fetch_all("""
-                SELECT JobId, UserId, PayloadJson
-                FROM dbo.JobsProgramados
-                WHERE Tipo=N'watch' AND Activo=1
-            """)
-            for j in jobs:
-                payload = j["PayloadJson"] or "{}"
-                try:
-                    data = json.loads(payload)
-                except Exception:
-                    data = {}
-                set_id = data.get("SetId")
-                if not set_id:
-                    logger.warning("Job con payload inválido", extra={"extra_dict":{"job_id": j["JobId"]}})
-                    continue
-                logger.info("watch tick", extra={"extra_dict":{"set_id": set_id, "job_id": j["JobId"]}})
-                # Aquí haremos: leer items del set, scrape de estados, y si hay toma libre -> reservar.
-                print(f"[worker] {datetime.now(timezone.utc).isoformat()} watch SetId={set_id} (stub)")
-        except Exception as e:
-            logger.error("worker error: %s", e, exc_info=True)
-            print("[worker] error:", e)
-        time.sleep(INTERVAL)
+            run_scheduler(HANDLERS, ex, stop, poll_sec=INTERVAL, now_fn=time.monotonic)
+        except KeyboardInterrupt:
+            stop.set()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,149 @@
+import os, time, argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from app.db import fetch_all, execute_many
+from app.snapshots import get as get_snapshot
+from app.offline import load_doc, status_from_doc, plug_cards_from_doc, manifest_from_doc
+from app.utils.status import match_cards
+from app.meta import (MANIF_PUNTO, MANIF_CONECTOR, punto_info_from_raw, conector_info_from_raw,
+                      punto_info_params, conector_info_params)
+from app.jobs import conectores_punto
+from app.logging import DBHandler, RequestContextFilter
+from dotenv import load_dotenv
+
+load_dotenv("/opt/reservas4/repo/.env")
+logger = logging.getLogger("snapshot_backfill")
+h = DBHandler(); h.addFilter(RequestContextFilter()); h.setLevel(logging.INFO)
+logger.addHandler(h); logger.setLevel(logging.INFO)
+
+BATCH = 500
+
+# Histórico reconstruido con la misma regla que estado.save_estado (solo transiciones):
+# la lectura offline se inserta solo si su estado difiere de la fila anterior Y de la
+# siguiente del histórico de ese conector. Así no duplica la fila que escribió el scrape
+# en vivo (misma lectura, @now unos ms después) ni altera los cambios que cuenta
+# polling.reschedule; volver a ejecutarlo no inserta nada nuevo (la anterior ya es ella).
+ESTADO_INSERT = """
+    INSERT INTO dbo.EstadosConector (ConectorId, Estado, Precio, RawHint, CapturedAtUtc)
+    SELECT :cid, :est, NULL, :hint, :ts
+    WHERE ISNULL((SELECT TOP 1 e.Estado FROM dbo.EstadosConector e
+                  WHERE e.ConectorId = :cid AND e.CapturedAtUtc <= :ts
+                  ORDER BY e.CapturedAtUtc DESC), N'') <> :est
+      AND ISNULL((SELECT TOP 1 e.Estado FROM dbo.EstadosConector e
+                  WHERE e.ConectorId = :cid AND e.CapturedAtUtc > :ts
+                  ORDER BY e.CapturedAtUtc ASC), N'') <> :est;
+"""
+
+# Info desde snapshots: solo si el snapshot es más reciente que la fila actual, y sin
+# pisar con NULL lo que el parser offline no encontró. ActualizadoUtc = hora del snapshot.
+PUNTO_INFO_BACKFILL = """
+    MERGE dbo.PuntoInfo AS T
+    USING (SELECT :pid AS PuntoId) AS S
+    ON (T.PuntoId = S.PuntoId)
+    WHEN MATCHED AND (T.ActualizadoUtc IS NULL OR T.ActualizadoUtc < :ts) THEN UPDATE SET
+        NombrePTP=COALESCE(:n, T.NombrePTP), Direccion=COALESCE(:d, T.Direccion),
+        Lat=COALESCE(:lat, T.Lat), Lng=COALESCE(:lng, T.Lng), Proveedor=COALESCE(:pr, T.Proveedor),
+        ActualizadoUtc=:ts
+    WHEN NOT MATCHED THEN
+        INSERT (PuntoId, NombrePTP, Direccion, Lat, Lng, Proveedor, ActualizadoUtc)
+        VALUES (:pid, :n, :d, :lat, :lng, :pr, :ts);
+"""
+
+CONECTOR_INFO_BACKFILL = """
+    MERGE dbo.ConectorInfo AS T
+    USING (SELECT :cid AS ConectorId) AS S
+    ON (T.ConectorId = S.ConectorId)
+    WHEN MATCHED AND (T.ActualizadoUtc IS NULL OR T.ActualizadoUtc < :ts) THEN UPDATE SET
+        Tipo=COALESCE(:tipo, T.Tipo), PotenciaKw=COALESCE(:pkw, T.PotenciaKw),
+        PrecioTexto=COALESCE(:pt, T.PrecioTexto), PrecioKwh=COALESCE(:pkwh, T.PrecioKwh),
+        TarifaModelo=COALESCE(:tm, T.TarifaModelo), ActualizadoUtc=:ts
+    WHEN NOT MATCHED THEN
+        INSERT (ConectorId, Tipo, PotenciaKw, PrecioTexto, PrecioKwh, TarifaModelo, ActualizadoUtc)
+        VALUES (:cid, :tipo, :pkw, :pt, :pkwh, :tm, :ts);
+"""
+
+def parse_snapshot(args):
+    """(sha, tipo, modos) -> resultados offline; se ejecuta en procesos aparte."""
+    sha, tipo, modos = args
+    try:
+        doc = load_doc(get_snapshot(sha))
+    except Exception as e:
+        return {"sha": sha, "error": str(e)}
+    out = {"sha": sha}
+    if "estado" in modos:
+        if tipo == "punto":
+            out["cards"] = plug_cards_from_doc(doc)
+        else:
+            out["estado"] = status_from_doc(doc)
+    if "meta" in modos:
+        out["meta"] = (punto_info_from_raw(manifest_from_doc(doc, MANIF_PUNTO)) if tipo == "punto"
+                       else conector_info_from_raw(manifest_from_doc(doc, MANIF_CONECTOR)))
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="Re-parsea snapshots guardados y rellena EstadosConector / *Info")
+    ap.add_argument("--modo", choices=("estado", "meta", "all"), default="all")
+    ap.add_argument("--tipo", choices=("conector", "punto"), default=None)
+    ap.add_argument("--desde", default=None, help="CapturedAtUtc mínimo (ISO)")
+    ap.add_argument("--limit", type=int, default=100000)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    ap.add_argument("--dry-run", action="store_true")
+    a = ap.parse_args()
+    modos = ("estado", "meta") if a.modo == "all" else (a.modo,)
+
+    t0 = time.time()
+    snaps = fetch_all("""
+        SELECT TOP (:lim) SnapshotId, Sha256, Tipo, RefId, CapturedAtUtc
+        FROM dbo.Snapshots
+        WHERE RefId IS NOT NULL
+          AND (:tipo IS NULL OR Tipo = :tipo)
+          AND (:desde IS NULL OR CapturedAtUtc >= :desde)
+        ORDER BY SnapshotId
+    """, lim=a.limit, tipo=a.tipo, desde=a.desde)
+
+    # contenido direccionado: cada HTML distinto se parsea una sola vez
+    uniq = sorted({(s["Sha256"], s["Tipo"]) for s in snaps})
+    with ProcessPoolExecutor(max_workers=max(1, a.workers)) as ex:
+        results = ex.map(parse_snapshot, [(sha, t, modos) for sha, t in uniq], chunksize=32)
+        parsed = dict(zip(uniq, results))
+    t_parse = time.time()
+
+    estados, info_c, info_p, errores = [], {}, {}, 0
+    conns_punto = {}
+    for s in snaps:
+        r = parsed[(s["Sha256"], s["Tipo"])]
+        if r.get("error"):
+            errores += 1
+            continue
+        ts = s["CapturedAtUtc"]
+        if s["Tipo"] == "conector":
+            if "estado" in r:
+                est, hint = r["estado"]
+                estados.append({"cid": s["RefId"], "ts": ts, "est": est, "hint": f"offline:{hint}"})
+            if "meta" in r:
+                info_c[s["RefId"]] = dict(conector_info_params(s["RefId"], r["meta"]), ts=ts)   # la última gana
+        else:
+            if "cards" in r:
+                if s["RefId"] not in conns_punto:
+                    conns_punto[s["RefId"]] = conectores_punto(s["RefId"])
+                for cid, card in match_cards(r["cards"], conns_punto[s["RefId"]]).items():
+                    estados.append({"cid": cid, "ts": ts, "est": card["estado"], "hint": f"offline:{card['hint']}"})
+            if "meta" in r:
+                info_p[s["RefId"]] = dict(punto_info_params(s["RefId"], r["meta"]), ts=ts)
+
+    if not a.dry_run:
+        # por conector y en orden temporal: cada fila se compara con las ya insertadas
+        estados.sort(key=lambda e: (e["cid"], e["ts"]))
+        for i in range(0, len(estados), BATCH):
+            execute_many(ESTADO_INSERT, estados[i:i + BATCH])
+        execute_many(CONECTOR_INFO_BACKFILL, list(info_c.values()))
+        execute_many(PUNTO_INFO_BACKFILL, list(info_p.values()))
+
+    msg = (f"snapshots={len(snaps)} unicos={len(uniq)} errores={errores} lecturas={len(estados)} "
+           f"conector_info={len(info_c)} punto_info={len(info_p)} parse_ms={int((t_parse - t0) * 1000)} "
+           f"total_ms={int((time.time() - t0) * 1000)} dry_run={a.dry_run}")
+    logger.info("snapshot_backfill %s", msg)
+    print("[snapshot-backfill]", msg)
+
+if __name__ == "__main__":
+    main()